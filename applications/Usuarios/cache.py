@@ -0,0 +1,72 @@
+"""
+Caché por usuario de las respuestas de vista_dashboard y vista_perfil (GET).
+
+Usa el framework de caché de Django con el alias USUARIOS_CACHE_ALIAS
+(por defecto 'default', LocMemCache salvo que se configure otro backend).
+Las entradas se invalidan desde las señales de PerfilUsuario, User y Usuario
+(ver signals.py) y desde la rama POST de vista_perfil.
+
+Las claves de los payloads llevan la versión del usuario, y invalidar
+consiste en subir esa versión. Así, un payload construido antes de una
+invalidación se guarda con la versión anterior y nadie vuelve a leerlo,
+aunque el cache.set llegue después de la invalidación. Si la versión no
+está en la caché (usuario nuevo o clave expulsada), se crea una a partir
+del reloj, mayor que cualquiera anterior.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+TIPOS = ('dashboard', 'perfil')
+
+
+def _cache():
+    return caches[getattr(settings, 'USUARIOS_CACHE_ALIAS', 'default')]
+
+
+def _clave_version(user_id):
+    return f'usuarios:version:{user_id}'
+
+
+def _clave(tipo, user_id, version):
+    return f'usuarios:{tipo}:{user_id}:{version}'
+
+
+def _version(cache, user_id):
+    clave = _clave_version(user_id)
+    version = cache.get(clave)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(clave, version, None):
+            # Otro proceso la creó a la vez: se usa la suya
+            version = cache.get(clave, version)
+    return version
+
+
+def obtener_payload(tipo, user_id, construir):
+    """Devuelve el payload cacheado o lo construye con ``construir()`` y lo guarda"""
+    cache = _cache()
+    # La versión se lee antes de construir: si se invalida mientras tanto, el set va a una clave vieja
+    clave = _clave(tipo, user_id, _version(cache, user_id))
+    payload = cache.get(clave)
+    if payload is None:
+        payload = construir()
+        cache.set(clave, payload, getattr(settings, 'USUARIOS_CACHE_TIMEOUT', 300))
+    return payload
+
+
+def _subir_version(user_id):
+    cache = _cache()
+    clave = _clave_version(user_id)
+    try:
+        cache.incr(clave)
+    except ValueError:
+        # Sin versión guardada (expulsada o nunca leída): una nueva del reloj deja atrás las anteriores
+        cache.set(clave, time.time_ns(), None)
+
+
+def invalidar_usuario(user_id):
+    """Descarta los payloads del usuario cuando la transacción en curso se confirma"""
+    transaction.on_commit(lambda: _subir_version(user_id))
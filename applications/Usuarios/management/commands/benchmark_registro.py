@@ -0,0 +1,84 @@
+import json
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from applications.benchmark import base_datos_temporal, resumen_tiempos
+from applications.Usuarios.models import Usuario
+from applications.Usuarios.views import vista_registro
+
+
+def _registro_anterior(data):
+    """Flujo previo de vista_registro: dos comprobaciones, INSERT, UPDATE de nombres e INSERT de Usuario"""
+    if User.objects.filter(email=data['email']).exists():
+        return 'email'
+    if User.objects.filter(username=data['username']).exists():
+        return 'username'
+    user = User.objects.create_user(username=data['username'], email=data['email'], password=data['password'])
+    user.first_name = data.get('first_name', '')
+    user.last_name = data.get('last_name', '')
+    user.save()
+    Usuario.objects.create(nombre=f"{user.first_name} {user.last_name}".strip() or user.username,
+                           correo=data['email'], contrasena=data['password'])
+    return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Registra una ráfaga de usuarios con el flujo anterior y con vista_registro y compara '
+        'consultas por registro y latencias, incluidos los intentos duplicados'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--registros', type=int, default=500)
+        parser.add_argument('--duplicados', type=int, default=20,
+                            help='Porcentaje de intentos que repiten un username o email ya registrado')
+        parser.add_argument('--hasher-real', action='store_true',
+                            help='Usa PASSWORD_HASHERS de la configuración en lugar de uno rápido')
+
+    def handle(self, *args, **options):
+        hashers = settings.PASSWORD_HASHERS if options['hasher_real'] else [
+            'django.contrib.auth.hashers.MD5PasswordHasher'
+        ]
+        fabrica = RequestFactory()
+        with base_datos_temporal(), override_settings(PASSWORD_HASHERS=hashers):
+            # La vista se llama directamente, sin middleware, igual que el flujo anterior
+            resultados = [
+                ('anterior', self._rafaga('antes', options, _registro_anterior)),
+                ('vista_registro', self._rafaga('ahora', options, lambda data: vista_registro(fabrica.post(
+                    '/', json.dumps(data), content_type='application/json'
+                )))),
+            ]
+
+        for nombre, (consultas, tiempos) in resultados:
+            self.stdout.write(
+                f'{nombre:15} {consultas / options["registros"]:5.2f} consultas/registro | '
+                f'media {tiempos["media_ms"]} ms, p95 {tiempos["p95_ms"]} ms, p99 {tiempos["p99_ms"]} ms'
+            )
+
+    def _rafaga(self, prefijo, options, registrar):
+        """Ejecuta los registros y devuelve el total de consultas y el resumen de latencias"""
+        cada = max(1, round(100 / options['duplicados'])) if options['duplicados'] else 0
+        consultas = 0
+        muestras = []
+        for i in range(options['registros']):
+            # Cada cierto número de intentos se repite el username o el email del anterior
+            n = i - 1 if cada and i and i % cada == 0 else i
+            data = {
+                'username': f'{prefijo}{n}',
+                'email': f'{prefijo}{i if n == i or i % 2 else n}@edumap.test',
+                'password': 'contrasena-segura-123',
+                'first_name': 'Nombre',
+                'last_name': f'Apellido {i}',
+            }
+            with CaptureQueriesContext(connection) as capturadas:
+                inicio = time.perf_counter()
+                registrar(data)
+                muestras.append(time.perf_counter() - inicio)
+            consultas += len(capturadas)
+        return consultas, resumen_tiempos(muestras)
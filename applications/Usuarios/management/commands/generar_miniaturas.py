@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from applications.Usuarios.miniaturas import generar_miniaturas
+from applications.Usuarios.models import PerfilUsuario
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera en este proceso las miniaturas de los avatares que aún no las tienen '
+        '(p. ej. los subidos antes de existir el pipeline)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todos', action='store_true',
+                            help='Revisar también los perfiles que ya tienen miniaturas y crear los archivos que falten')
+
+    def handle(self, *args, **options):
+        perfiles = PerfilUsuario.objects.exclude(avatar='').exclude(avatar__isnull=True)
+        if not options['todos']:
+            perfiles = perfiles.filter(avatar_hash__isnull=True)
+
+        generados = errores = 0
+        for perfil_id in perfiles.order_by('pk').values_list('pk', flat=True).iterator():
+            try:
+                generar_miniaturas(perfil_id)
+                generados += 1
+            except Exception as e:
+                errores += 1
+                self.stderr.write(f'Perfil {perfil_id}: {e}')
+
+        self.stdout.write(self.style.SUCCESS(f'Miniaturas generadas para {generados} perfiles ({errores} errores)'))
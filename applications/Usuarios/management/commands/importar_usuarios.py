@@ -0,0 +1,190 @@
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+from applications.Usuarios.models import PerfilUsuario, Usuario
+
+CAMPOS = ('username', 'email', 'password', 'first_name', 'last_name', 'telefono')
+
+
+def _inicializar_proceso(modulo_settings):
+    # Con el método de arranque spawn (macOS, Windows) el proceso hijo no hereda Django
+    if modulo_settings:
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', modulo_settings)
+    import django
+    django.setup()
+
+
+def _cifrar(contrasena):
+    return make_password(contrasena or None)
+
+
+class Command(BaseCommand):
+    help = (
+        'Importa usuarios desde un archivo CSV o JSONL (campos: username, email, password, '
+        'first_name, last_name, telefono) creando User, PerfilUsuario y Usuario por lotes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help="Ruta del archivo, o '-' para leer de la entrada estándar")
+        parser.add_argument('--formato', choices=['csv', 'jsonl'],
+                            help='Por defecto se deduce de la extensión del archivo')
+        parser.add_argument('--lote', type=int, default=1000, help='Filas por transacción')
+        parser.add_argument('--procesos', type=int, default=os.cpu_count() or 1,
+                            help='Procesos para cifrar contraseñas (0 cifra en el proceso actual)')
+
+    def handle(self, *args, **options):
+        formato = options['formato'] or ('jsonl' if options['archivo'].endswith(('.jsonl', '.ndjson')) else 'csv')
+        if options['lote'] < 1:
+            raise CommandError('--lote debe ser mayor que 0')
+
+        self.verbosity = options['verbosity']
+        self.procesos = options['procesos']
+        self.vistos_username = set()
+        self.vistos_email = set()
+        self.creados = self.omitidos = 0
+        self.inicio = time.perf_counter()
+
+        archivo = sys.stdin if options['archivo'] == '-' else open(options['archivo'], newline='', encoding='utf-8')
+        pool = None
+        try:
+            if options['procesos'] > 0:
+                pool = ProcessPoolExecutor(
+                    max_workers=options['procesos'], initializer=_inicializar_proceso,
+                    initargs=(os.environ.get('DJANGO_SETTINGS_MODULE'),)
+                )
+            lotes = self._lotes(self._filas(archivo, formato), options['lote'])
+
+            # Mientras se inserta un lote, el pool ya cifra las contraseñas del siguiente
+            pendiente = self._preparar(next(lotes, None), pool)
+            while pendiente is not None:
+                filas, hashes = pendiente
+                pendiente = self._preparar(next(lotes, None), pool)
+                self._insertar(filas, list(hashes))
+                self._informar()
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+            if archivo is not sys.stdin:
+                archivo.close()
+
+        duracion = time.perf_counter() - self.inicio
+        self.stdout.write(self.style.SUCCESS(
+            f'Importados {self.creados} usuarios en {duracion:.1f} s '
+            f'({self.creados / duracion if duracion else 0:,.0f} filas/s); omitidos {self.omitidos}'
+        ))
+
+    def _filas(self, archivo, formato):
+        """Recorre el archivo fila a fila sin cargarlo entero en memoria"""
+        if formato == 'csv':
+            lector = csv.DictReader(archivo)
+            for numero, fila in enumerate(lector, start=2):
+                yield numero, fila
+        else:
+            for numero, linea in enumerate(archivo, start=1):
+                if not linea.strip():
+                    continue
+                try:
+                    yield numero, json.loads(linea)
+                except json.JSONDecodeError as e:
+                    raise CommandError(f'Línea {numero}: JSON inválido ({e})')
+
+    def _lotes(self, filas, tamano):
+        while True:
+            lote = list(itertools.islice(filas, tamano))
+            if not lote:
+                return
+            yield lote
+
+    def _preparar(self, lote, pool):
+        """Descarta filas inválidas o repetidas y lanza el cifrado de las contraseñas"""
+        if lote is None:
+            return None
+
+        validas = []
+        for numero, fila in lote:
+            datos = {campo: str(fila.get(campo) or '').strip() for campo in CAMPOS}
+            datos['email'] = User.objects.normalize_email(datos['email'])
+            if not datos['username'] or not datos['email']:
+                self._omitir(numero, 'username y email son obligatorios')
+            elif datos['username'] in self.vistos_username or datos['email'] in self.vistos_email:
+                self._omitir(numero, 'repetido en el archivo')
+            else:
+                self.vistos_username.add(datos['username'])
+                self.vistos_email.add(datos['email'])
+                validas.append((numero, datos))
+
+        # Una consulta por tabla y lote para no cifrar contraseñas de usuarios que ya existen
+        usernames = {datos['username'] for _, datos in validas}
+        emails = {datos['email'] for _, datos in validas}
+        existentes = (
+            set(User.objects.filter(username__in=usernames).values_list('username', flat=True)) |
+            set(User.objects.filter(email__in=emails).values_list('email', flat=True)) |
+            set(Usuario.objects.filter(correo__in=emails).values_list('correo', flat=True))
+        )
+        filas = []
+        for numero, datos in validas:
+            if datos['username'] in existentes or datos['email'] in existentes:
+                self._omitir(numero, 'el usuario o el email ya existen')
+            else:
+                filas.append(datos)
+
+        contrasenas = [datos['password'] for datos in filas]
+        if pool is None:
+            return filas, map(_cifrar, contrasenas)
+        trozo = max(1, len(contrasenas) // (self.procesos * 4))
+        return filas, pool.map(_cifrar, contrasenas, chunksize=trozo)
+
+    def _insertar(self, filas, hashes):
+        if not filas:
+            return
+        usuarios = [
+            User(username=datos['username'], email=datos['email'], password=hash_,
+                 first_name=datos['first_name'], last_name=datos['last_name'])
+            for datos, hash_ in zip(filas, hashes)
+        ]
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create(usuarios)
+                # Algunos backends (MySQL) no devuelven las claves primarias
+                if any(user.pk is None for user in usuarios):
+                    ids = dict(User.objects.filter(username__in=[u.username for u in usuarios])
+                               .values_list('username', 'id'))
+                    for user in usuarios:
+                        user.pk = ids[user.username]
+
+                PerfilUsuario.objects.bulk_create([
+                    PerfilUsuario(usuario=user, first_name=datos['first_name'] or None,
+                                  last_name=datos['last_name'] or None, telefono=datos['telefono'] or None)
+                    for datos, user in zip(filas, usuarios)
+                ])
+                Usuario.objects.bulk_create([
+                    Usuario(usuario=user, nombre=f'{user.first_name} {user.last_name}'.strip() or user.username,
+                            correo=user.email, contrasena=user.password)
+                    for user in usuarios
+                ])
+        except IntegrityError as e:
+            raise CommandError(
+                f'Conflicto al insertar el lote que empieza en {filas[0]["username"]} '
+                f'(¿registros simultáneos?): {e}. Los lotes anteriores ya están guardados.'
+            )
+        self.creados += len(usuarios)
+
+    def _omitir(self, numero, motivo):
+        self.omitidos += 1
+        if self.verbosity > 1:
+            self.stderr.write(f'Fila {numero} omitida: {motivo}')
+
+    def _informar(self):
+        if self.verbosity > 0:
+            duracion = time.perf_counter() - self.inicio
+            self.stdout.write(f'{self.creados} usuarios importados ({self.creados / duracion:,.0f} filas/s)')
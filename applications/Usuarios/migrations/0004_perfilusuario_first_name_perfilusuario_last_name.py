@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Usuarios', '0003_delete_progreso'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='perfilusuario',
+            name='first_name',
+            field=models.CharField(blank=True, max_length=150, null=True),
+        ),
+        migrations.AddField(
+            model_name='perfilusuario',
+            name='last_name',
+            field=models.CharField(blank=True, max_length=150, null=True),
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations
+from django.db.models import Count
+
+
+INDICE = 'usuarios_user_email_unico'
+
+
+def crear_indice_email(apps, schema_editor):
+    if schema_editor.connection.vendor not in ('postgresql', 'sqlite'):
+        return
+    User = apps.get_model('auth', 'User')
+    duplicados = list(
+        User.objects.exclude(email='').values('email').annotate(total=Count('id'))
+        .filter(total__gt=1).values_list('email', flat=True)[:10]
+    )
+    if duplicados:
+        raise RuntimeError(
+            'Hay correos repetidos en auth_user; resuélvelos antes de migrar: ' + ', '.join(duplicados)
+        )
+    # Parcial: los usuarios creados sin correo (createsuperuser, admin) guardan ''
+    schema_editor.execute(
+        f"CREATE UNIQUE INDEX IF NOT EXISTS {INDICE} ON auth_user (email) WHERE email <> ''"
+    )
+
+
+def eliminar_indice_email(apps, schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        schema_editor.execute(f'DROP INDEX IF EXISTS {INDICE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('Usuarios', '0004_perfilusuario_first_name_perfilusuario_last_name'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice_email, eliminar_indice_email),
+    ]
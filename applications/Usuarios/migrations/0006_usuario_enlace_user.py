@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Usuarios', '0005_email_unico_auth_user'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usuario',
+            name='usuario',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='usuario_personalizado', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:09
+
+from django.db import migrations, transaction
+
+LOTE = 1000
+
+
+def enlazar_por_correo(apps, schema_editor):
+    """Rellena Usuario.usuario con el User del mismo correo, en lotes de LOTE filas por transacción"""
+    Usuario = apps.get_model('Usuarios', 'Usuario')
+    User = apps.get_model('auth', 'User')
+    ultimo_id = 0
+    while True:
+        lote = list(Usuario.objects.filter(id__gt=ultimo_id, usuario__isnull=True)
+                    .order_by('id').values_list('id', 'correo')[:LOTE])
+        if not lote:
+            return
+        ultimo_id = lote[-1][0]
+        ids_user = dict(User.objects.filter(email__in=[correo for _, correo in lote])
+                        .values_list('email', 'id'))
+        enlazados = [Usuario(id=id_usuario, usuario_id=ids_user[correo])
+                     for id_usuario, correo in lote if correo in ids_user]
+        with transaction.atomic(using=schema_editor.connection.alias):
+            Usuario.objects.bulk_update(enlazados, ['usuario'])
+
+
+class Migration(migrations.Migration):
+
+    # Cada lote del relleno se confirma por separado para no bloquear la tabla entera.
+    # Va aparte de 0006 para que el AddField sí sea atómico
+    atomic = False
+
+    dependencies = [
+        ('Usuarios', '0006_usuario_enlace_user'),
+    ]
+
+    operations = [
+        migrations.RunPython(enlazar_por_correo, migrations.RunPython.noop),
+    ]
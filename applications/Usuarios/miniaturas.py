@@ -0,0 +1,237 @@
+"""
+Miniaturas de PerfilUsuario.avatar.
+
+Al guardar un perfil con un avatar nuevo, PerfilUsuario.save vacía
+avatar_hash y la señal post_save programa generar_miniaturas() para cuando
+se confirme la transacción. La generación se hace en un pool de
+USUARIOS_MINIATURAS_HILOS hilos del proceso, fuera de la petición (con 0, en
+el hilo que guarda; con None no se programa y se deja para el comando
+generar_miniaturas). Pillow recorta cada tamaño de TAMANOS a un cuadrado y lo
+guarda en WebP y JPEG.
+
+Los archivos se nombran con el hash del contenido del avatar
+(``avatars/miniaturas/ab/<hash>-128.webp``). Un nombre nunca cambia de
+contenido, así que el servidor web puede servirlos con caché indefinida
+(``Cache-Control: public, max-age=31536000, immutable``), y dos perfiles con
+la misma imagen comparten miniaturas. Al cambiar de avatar, borrar_avatar()
+quita el archivo anterior y sus miniaturas si ningún otro perfil las usa.
+Mientras no están generadas, los payloads devuelven avatar_miniaturas = None
+y el cliente usa la URL original.
+"""
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .cache import invalidar_usuario
+from .models import PerfilUsuario
+
+logger = logging.getLogger(__name__)
+
+# Forma parte del hash: al cambiar tamaños o calidades hay que subirla para que los nombres cambien
+VERSION = 1
+TAMANOS = (48, 128, 512)
+FORMATOS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+DIRECTORIO = 'avatars/miniaturas'
+
+
+def _storage():
+    return PerfilUsuario._meta.get_field('avatar').storage
+
+
+def hash_contenido(archivo):
+    """Hash del contenido del archivo (32 caracteres hexadecimales)"""
+    digest = hashlib.sha256(f'miniaturas-v{VERSION}'.encode())
+    for bloque in archivo.chunks():
+        digest.update(bloque)
+    return digest.hexdigest()[:32]
+
+
+def nombre_miniatura(avatar_hash, tamano, formato):
+    # Un subdirectorio por los dos primeros caracteres para no acumular todo en uno
+    return f'{DIRECTORIO}/{avatar_hash[:2]}/{avatar_hash}-{tamano}.{formato}'
+
+
+def urls_miniaturas(avatar_hash):
+    """{'48': {'webp': url, 'jpeg': url}, ...}, o None si aún no hay miniaturas"""
+    if not avatar_hash:
+        return None
+    storage = _storage()
+    return {
+        str(tamano): {formato: storage.url(nombre_miniatura(avatar_hash, tamano, formato)) for formato in FORMATOS}
+        for tamano in TAMANOS
+    }
+
+
+def renderizar(archivo):
+    """Contenido codificado de cada (tamaño, formato) a partir de la imagen original"""
+    with Image.open(archivo) as original:
+        # En JPEG, decodificar ya reducido (escalado DCT) cuando la foto es mucho mayor que 512 px
+        original.draft('RGB', (max(TAMANOS), max(TAMANOS)))
+        imagen = ImageOps.exif_transpose(original)
+        transparente = imagen.mode in ('RGBA', 'LA') or (imagen.mode == 'P' and 'transparency' in imagen.info)
+        imagen = imagen.convert('RGBA' if transparente else 'RGB')
+
+    resultado = {}
+    for tamano in sorted(TAMANOS, reverse=True):
+        # Cada tamaño se reduce desde el anterior y no desde el original
+        imagen = ImageOps.fit(imagen, (tamano, tamano), Image.Resampling.LANCZOS)
+        for formato, (formato_pil, opciones) in FORMATOS.items():
+            salida = imagen
+            if formato_pil == 'JPEG' and imagen.mode == 'RGBA':
+                # JPEG no tiene transparencia: fondo blanco
+                salida = Image.new('RGB', imagen.size, (255, 255, 255))
+                salida.paste(imagen, mask=imagen.getchannel('A'))
+            buffer = io.BytesIO()
+            salida.save(buffer, formato_pil, **opciones)
+            resultado[tamano, formato] = buffer.getvalue()
+    return resultado
+
+
+def _escribir(storage, nombre, contenido):
+    """
+    Escribe la miniatura con exactamente ese nombre. Otro proceso puede estar
+    escribiéndola a la vez (con el mismo contenido): storage.save le daría un
+    nombre alternativo que nadie usaría, así que en disco se escribe a un
+    temporal y se renombra encima, y en otros storages se borra la copia.
+    """
+    try:
+        ruta = storage.path(nombre)
+    except NotImplementedError:
+        guardado = storage.save(nombre, ContentFile(contenido))
+        if guardado != nombre:
+            storage.delete(guardado)
+        return
+
+    directorio = os.path.dirname(ruta)
+    os.makedirs(directorio, mode=storage.directory_permissions_mode or 0o777, exist_ok=True)
+    descriptor, temporal = tempfile.mkstemp(dir=directorio, prefix='.tmp-')
+    try:
+        with os.fdopen(descriptor, 'wb') as salida:
+            salida.write(contenido)
+        os.chmod(temporal, storage.file_permissions_mode or 0o644)
+        # Atómico: quien la lea ve el archivo anterior o el nuevo, nunca uno a medias
+        os.replace(temporal, ruta)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+
+def borrar_avatar(nombre, avatar_hash):
+    """
+    Borra un avatar sustituido y sus miniaturas. Se llama después de confirmar
+    la transacción que guardó el nuevo; lo que otro perfil siga usando (el
+    mismo archivo, o miniaturas del mismo contenido) se conserva.
+    """
+    storage = _storage()
+    try:
+        if nombre and not PerfilUsuario.objects.filter(avatar=nombre).exists():
+            storage.delete(nombre)
+        if avatar_hash and not PerfilUsuario.objects.filter(avatar_hash=avatar_hash).exists():
+            for tamano in TAMANOS:
+                for formato in FORMATOS:
+                    storage.delete(nombre_miniatura(avatar_hash, tamano, formato))
+    except Exception:
+        # El avatar nuevo ya está guardado: un archivo huérfano no debe romper la petición
+        logger.exception('No se pudo borrar el avatar anterior %s', nombre)
+
+
+def generar_miniaturas(perfil_id):
+    """
+    Genera las miniaturas del avatar actual del perfil y guarda su hash.
+    Devuelve el hash, o None si el perfil no existe o no tiene avatar.
+    """
+    perfil = PerfilUsuario.objects.filter(pk=perfil_id).only('usuario_id', 'avatar').first()
+    if perfil is None or not perfil.avatar:
+        return None
+    nombre = perfil.avatar.name
+    storage = _storage()
+
+    with perfil.avatar.open('rb') as archivo:
+        avatar_hash = hash_contenido(archivo)
+        nombres = {(tamano, formato): nombre_miniatura(avatar_hash, tamano, formato)
+                   for tamano in TAMANOS for formato in FORMATOS}
+        # Misma imagen ya procesada (este u otro perfil): no se vuelve a decodificar
+        if not all(storage.exists(n) for n in nombres.values()):
+            archivo.seek(0)
+            for clave, contenido in renderizar(archivo).items():
+                # Si otro hilo lo escribió antes, el contenido es el mismo
+                if not storage.exists(nombres[clave]):
+                    _escribir(storage, nombres[clave], contenido)
+
+    # Solo si el avatar no cambió mientras tanto. fecha_actualizacion cambia el ETag del perfil
+    actualizados = PerfilUsuario.objects.filter(pk=perfil_id, avatar=nombre).update(
+        avatar_hash=avatar_hash, fecha_actualizacion=timezone.now()
+    )
+    if actualizados:
+        invalidar_usuario(perfil.usuario_id)
+    return avatar_hash
+
+
+def _generar(perfil_id):
+    # Una imagen dañada no debe romper la petición ni el pool: el perfil se queda con el avatar original
+    try:
+        generar_miniaturas(perfil_id)
+    except Exception:
+        logger.exception('No se pudieron generar las miniaturas del perfil %s', perfil_id)
+
+
+def _generar_en_pool(perfil_id):
+    try:
+        _generar(perfil_id)
+    finally:
+        close_old_connections()
+
+
+_pool = None
+_bloqueo = threading.Lock()
+
+
+def _obtener_pool():
+    """Pool del proceso, creado la primera vez que se usa"""
+    global _pool
+    with _bloqueo:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'USUARIOS_MINIATURAS_HILOS', 2),
+                thread_name_prefix='miniaturas-avatar',
+            )
+        return _pool
+
+
+def _enviar(perfil_id):
+    if getattr(settings, 'USUARIOS_MINIATURAS_HILOS', 2) <= 0:
+        _generar(perfil_id)
+    else:
+        _obtener_pool().submit(_generar_en_pool, perfil_id)
+
+
+def programar(perfil_id):
+    """Genera las miniaturas del perfil cuando se confirme la transacción en curso"""
+    if getattr(settings, 'USUARIOS_MINIATURAS_HILOS', 2) is None:
+        return
+    transaction.on_commit(lambda: _enviar(perfil_id))
+
+
+def _reiniciar_tras_fork():
+    # Los hilos del pool no existen en el hijo; la cola heredada la atiende el padre
+    global _pool, _bloqueo
+    _pool = None
+    _bloqueo = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reiniciar_tras_fork)
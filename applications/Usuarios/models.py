@@ -1,11 +1,21 @@
 from django.db import models
+from django.db.models.fields.files import FieldFile
 from django.contrib.auth.models import User
 
 
 class Usuario(models.Model):
+    # Enlace directo con el usuario de Django para leerlo con select_related; antes solo se unían por correo
+    usuario = models.OneToOneField(User, on_delete=models.SET_NULL, null=True, blank=True,
+                                   related_name='usuario_personalizado')
     nombre = models.CharField(max_length=100)
     correo = models.EmailField(unique=True)
     contrasena = models.CharField(max_length=100)
+    
+    def save(self, *args, **kwargs):
+        # Los registros creados sin enlace (admin, código antiguo) se enlazan por correo
+        if self.usuario_id is None and self.correo:
+            self.usuario = User.objects.filter(email=self.correo, usuario_personalizado__isnull=True).first()
+        super().save(*args, **kwargs)
 
 class PerfilUsuario(models.Model):
     usuario = models.OneToOneField(User, on_delete=models.CASCADE, related_name='perfil')
@@ -15,17 +25,69 @@ class PerfilUsuario(models.Model):
     fecha_nacimiento = models.DateField(blank=True, null=True)
     direccion = models.TextField(blank=True, null=True)
     avatar = models.ImageField(upload_to='avatars/', blank=True, null=True)
+    # Hash del contenido del avatar con el que se nombran sus miniaturas (ver miniaturas.py);
+    # vacío mientras no se han generado
+    avatar_hash = models.CharField(max_length=64, blank=True, null=True, editable=False)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_actualizacion = models.DateTimeField(auto_now=True)
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        instancia._valores_guardados = instancia._valores_actuales()
+        return instancia
+    
+    def _valores_actuales(self):
+        # Solo los campos ya cargados, para no disparar consultas por campos diferidos
+        valores = {}
+        for field in self._meta.concrete_fields:
+            if field.attname in self.__dict__:
+                valor = self.__dict__[field.attname]
+                valores[field.name] = valor.name if isinstance(valor, FieldFile) else valor
+        return valores
+    
+    def campos_modificados(self):
+        """
+        Campos que cambiaron desde que se cargó o guardó la instancia,
+        o None si la instancia todavía no se ha guardado
+        """
+        guardados = getattr(self, '_valores_guardados', None)
+        if guardados is None or self._state.adding:
+            return None
+        return {
+            campo for campo, valor in self._valores_actuales().items()
+            if campo not in guardados or guardados[campo] != valor
+        }
+    
     def save(self, *args, **kwargs):
-        # Sincronizar first_name y last_name con el usuario de Django
-        if self.first_name:
-            self.usuario.first_name = self.first_name
-        if self.last_name:
-            self.usuario.last_name = self.last_name
-        self.usuario.save()
+        modificados = self.campos_modificados()
+        
+        # Un avatar nuevo se queda sin miniaturas hasta que la señal post_save las genere
+        avatar_cambiado = modificados is None or 'avatar' in modificados
+        if modificados is not None and 'avatar' in modificados:
+            self.avatar_hash = None
+            modificados.add('avatar_hash')
+        self._avatar_nuevo = avatar_cambiado and bool(self.avatar)
+        
+        # Sincronizar first_name y last_name con el usuario de Django solo si cambiaron
+        campos_usuario = []
+        for campo in ('first_name', 'last_name'):
+            valor = getattr(self, campo)
+            if modificados is None:
+                sincronizar = bool(valor)
+            else:
+                sincronizar = campo in modificados and valor is not None
+            if sincronizar and getattr(self.usuario, campo) != valor:
+                setattr(self.usuario, campo, valor)
+                campos_usuario.append(campo)
+        if campos_usuario:
+            self.usuario.save(update_fields=campos_usuario)
+        
+        # Escribir solo las columnas modificadas
+        if modificados is not None and 'update_fields' not in kwargs and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = modificados | {'fecha_actualizacion'}
         super().save(*args, **kwargs)
+        self._valores_guardados = self._valores_actuales()
     
     def __str__(self):
         return f'Perfil de {self.usuario.username}'
\ No newline at end of file
@@ -0,0 +1,34 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import miniaturas
+from .cache import invalidar_usuario
+from .models import PerfilUsuario, Usuario
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidar_cache_user(sender, instance, update_fields=None, **kwargs):
+    # El login solo actualiza last_login, que no forma parte de los payloads
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    invalidar_usuario(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=PerfilUsuario)
+def invalidar_cache_perfil(sender, instance, **kwargs):
+    invalidar_usuario(instance.usuario_id)
+
+
+@receiver(post_save, sender=PerfilUsuario)
+def programar_miniaturas_perfil(sender, instance, **kwargs):
+    # PerfilUsuario.save marca si el avatar es nuevo; las miniaturas se generan fuera de la petición
+    if getattr(instance, '_avatar_nuevo', False):
+        miniaturas.programar(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Usuario)
+def invalidar_cache_usuario(sender, instance, **kwargs):
+    # Un Usuario sin enlace no aparece en ningún payload
+    if instance.usuario_id is not None:
+        invalidar_usuario(instance.usuario_id)
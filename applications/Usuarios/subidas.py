@@ -0,0 +1,114 @@
+"""
+Subida de avatares en streaming.
+
+ManejadorSubidaAvatar sustituye a los manejadores de subida de Django en
+vista_subir_avatar. El archivo se escribe en un temporal por bloques de
+64 KiB, así que el proceso no retiene en memoria más que un bloque y la
+cabecera de la imagen. Los límites se comprueban mientras llegan los datos:
+
+- tamaño: la vista rechaza por Content-Length antes de leer el cuerpo, y
+  el manejador corta la subida en cuanto los bytes recibidos superan
+  USUARIOS_AVATAR_MAX_BYTES (cuerpos chunked o Content-Length falso);
+- formato y píxeles: Pillow solo lee la cabecera (Image.open no decodifica
+  los píxeles) de los primeros bloques. Una imagen que no es JPEG, PNG o
+  WebP, o que supera USUARIOS_AVATAR_MAX_PIXELES, se rechaza sin esperar
+  al resto del archivo.
+
+Al rechazar se lanza StopUpload sin leer lo que queda del cuerpo y se
+borra el temporal. La decodificación completa la hace después el pipeline
+de miniaturas, fuera de la petición.
+"""
+import io
+
+from django.conf import settings
+from django.core.files.uploadhandler import SkipFile, StopUpload, TemporaryFileUploadHandler
+from PIL import Image
+
+CAMPO = 'avatar'
+# Formato de Pillow y extensión con la que se guarda
+FORMATOS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+# Bytes iniciales en los que debe aparecer la cabecera (los metadatos EXIF pueden ocupar 64 KiB)
+CABECERA_MAX = 256 * 1024
+# Margen de Content-Length sobre el tamaño del archivo para los delimitadores multipart
+MARGEN_MULTIPART = 16 * 1024
+
+
+def max_bytes():
+    return getattr(settings, 'USUARIOS_AVATAR_MAX_BYTES', 5 * 1024 * 1024)
+
+
+def max_pixeles():
+    return getattr(settings, 'USUARIOS_AVATAR_MAX_PIXELES', 25_000_000)
+
+
+class AvatarRechazado(Exception):
+    """Motivo del rechazo de una subida; `estado` es el código HTTP de la respuesta"""
+
+    def __init__(self, mensaje, estado):
+        super().__init__(mensaje)
+        self.estado = estado
+
+
+class ManejadorSubidaAvatar(TemporaryFileUploadHandler):
+    """
+    Escribe el campo `avatar` en un archivo temporal validando tamaño y
+    cabecera por bloques. Tras procesar request.FILES, `error` contiene el
+    AvatarRechazado que cortó la subida (o None) y `formato`, `ancho` y
+    `alto` los datos leídos de la cabecera.
+    """
+    chunk_size = 64 * 1024
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.max_bytes = max_bytes()
+        self.max_pixeles = max_pixeles()
+        self.error = None
+        self.formato = self.ancho = self.alto = None
+        self._cabecera = bytearray()
+        self._recibido = False
+
+    def _rechazar(self, mensaje, estado):
+        self.error = AvatarRechazado(mensaje, estado)
+        # Sin leer el resto del cuerpo; el parser cierra (y borra) el temporal
+        raise StopUpload(connection_reset=True)
+
+    def new_file(self, field_name, *args, **kwargs):
+        # Solo un archivo y solo en el campo avatar; el resto se descarta sin escribirlo
+        if field_name != CAMPO or self._recibido:
+            # Al saltar, el parser cierra self.file, que puede ser el avatar ya recibido
+            self.__dict__.pop('file', None)
+            raise SkipFile()
+        self._recibido = True
+        super().new_file(field_name, *args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.max_bytes:
+            self._rechazar(f'El avatar supera el tamaño máximo de {self.max_bytes} bytes', 413)
+        if self.formato is None:
+            self._leer_cabecera(raw_data, final=False)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        if self.formato is None:
+            # Archivo más corto que la cabecera buscada: último intento con todo lo recibido
+            self._leer_cabecera(b'', final=True)
+        return super().file_complete(file_size)
+
+    def _leer_cabecera(self, datos, final):
+        self._cabecera += datos
+        try:
+            # Image.open solo lee la cabecera; formats evita probar el resto de decodificadores
+            with Image.open(io.BytesIO(self._cabecera), formats=list(FORMATOS)) as imagen:
+                formato, (ancho, alto) = imagen.format, imagen.size
+        except Image.DecompressionBombError:
+            self._rechazar('El avatar supera el número máximo de píxeles', 413)
+        except Exception:
+            # Cabecera incompleta o datos que no son una imagen admitida: se espera al siguiente bloque
+            if final or len(self._cabecera) >= CABECERA_MAX:
+                self._rechazar('El avatar debe ser una imagen JPEG, PNG o WebP', 415)
+            return
+
+        if ancho * alto > self.max_pixeles:
+            self._rechazar(f'El avatar supera el número máximo de píxeles ({self.max_pixeles})', 413)
+        self.formato, self.ancho, self.alto = formato, ancho, alto
+        self._cabecera = None
@@ -1,7 +1,23 @@
-from django.test import TestCase, Client
+import importlib
+import json
+import os
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+from django.apps import apps
+from django.core.management import call_command
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
+from django.core.files.move import file_move_safe
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.db import IntegrityError, connection
 from django.urls import reverse
-from .models import PerfilUsuario
+from PIL import Image
+from . import miniaturas, subidas, views
+from .cache import invalidar_usuario, obtener_payload
+from .models import PerfilUsuario, Usuario
 
 
 class InicioSesionTestCase(TestCase):
@@ -88,3 +104,696 @@ class InicioSesionTestCase(TestCase):
         
         # Verificar que se creó el perfil
         self.assertTrue(PerfilUsuario.objects.filter(usuario=user_sin_perfil).exists())
+
+
+class CachePerfilTestCase(TestCase):
+    """
+    Casos de prueba para la caché de dashboard y perfil
+    """
+    
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123',
+            first_name='Test',
+            last_name='User'
+        )
+        self.perfil = PerfilUsuario.objects.create(usuario=self.user, telefono='+1234567890')
+        self.client.login(username='testuser', password='testpass123')
+    
+    def _consultas_de_perfil(self, url):
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [q['sql'] for q in consultas if 'Usuarios_' in q['sql']]
+    
+    def test_dashboard_repetido_sin_consultas(self):
+        """
+        Prueba que la segunda carga del dashboard no consulta perfil ni usuario
+        """
+        url = reverse('inicio_sesion:dashboard')
+        self.assertTrue(self._consultas_de_perfil(url))
+        self.assertEqual(self._consultas_de_perfil(url), [])
+    
+    def test_cambio_de_perfil_invalida(self):
+        """
+        Prueba que guardar el perfil invalida el dashboard cacheado
+        """
+        url = reverse('inicio_sesion:dashboard')
+        self.client.get(url)
+        self.perfil.telefono = '+0987654321'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.perfil.save()
+        response = self.client.get(url)
+        self.assertEqual(response.json()['perfil']['telefono'], '+0987654321')
+    
+    def test_post_de_perfil_invalida(self):
+        """
+        Prueba que editar el perfil por la API invalida la consulta cacheada
+        """
+        url = reverse('inicio_sesion:perfil')
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, json.dumps({'direccion': 'Nueva dirección'}), content_type='application/json')
+        response = self.client.get(url)
+        self.assertEqual(response.json()['perfil']['direccion'], 'Nueva dirección')
+    
+    def test_cambio_de_usuario_personalizado_invalida(self):
+        """
+        Prueba que guardar el Usuario asociado por correo invalida el nombre completo
+        """
+        url = reverse('inicio_sesion:perfil')
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Usuario.objects.create(nombre='Nombre Personalizado', correo='test@example.com', contrasena='x')
+        response = self.client.get(url)
+        self.assertEqual(response.json()['user']['nombre_completo'], 'Nombre Personalizado')
+    
+    def test_invalidacion_durante_la_construccion(self):
+        """
+        Prueba que un payload construido antes de una invalidación no se sirve después
+        """
+        def construir_viejo():
+            # La señal llega entre el fallo de caché y el set
+            with self.captureOnCommitCallbacks(execute=True):
+                invalidar_usuario(self.user.pk)
+            return {'valor': 'viejo'}
+        
+        self.assertEqual(obtener_payload('perfil', self.user.pk, construir_viejo), {'valor': 'viejo'})
+        self.assertEqual(obtener_payload('perfil', self.user.pk, lambda: {'valor': 'nuevo'}), {'valor': 'nuevo'})
+        self.assertEqual(obtener_payload('perfil', self.user.pk, lambda: {'valor': 'otro'}), {'valor': 'nuevo'})
+
+
+class PerfilCamposModificadosTestCase(TestCase):
+    """
+    Casos de prueba para el seguimiento de campos modificados de PerfilUsuario
+    """
+    
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123',
+            first_name='Test',
+            last_name='User'
+        )
+        PerfilUsuario.objects.create(usuario=self.user, first_name='Test', last_name='User')
+        self.perfil = PerfilUsuario.objects.get(usuario=self.user)
+    
+    def _actualizaciones(self, consultas, tabla):
+        return [q['sql'] for q in consultas if q['sql'].startswith(f'UPDATE "{tabla}"')]
+    
+    def test_guardar_sin_cambio_de_nombres_no_escribe_user(self):
+        """
+        Prueba que cambiar otro campo no actualiza auth_user y solo escribe esa columna
+        """
+        self.perfil.telefono = '+1234567890'
+        with CaptureQueriesContext(connection) as consultas:
+            self.perfil.save()
+        
+        self.assertEqual(self._actualizaciones(consultas, 'auth_user'), [])
+        (update,) = self._actualizaciones(consultas, 'Usuarios_perfilusuario')
+        self.assertIn('"telefono"', update)
+        self.assertNotIn('"direccion"', update)
+    
+    def test_cambio_de_nombre_actualiza_solo_esa_columna(self):
+        """
+        Prueba que un cambio de nombre escribe solo first_name en auth_user
+        """
+        self.perfil.first_name = 'Nuevo'
+        with CaptureQueriesContext(connection) as consultas:
+            self.perfil.save()
+        
+        (update,) = self._actualizaciones(consultas, 'auth_user')
+        self.assertIn('"first_name"', update)
+        self.assertNotIn('"last_name"', update)
+        self.assertNotIn('"password"', update)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, 'Nuevo')
+    
+    def test_post_de_perfil_escribe_auth_user_una_vez(self):
+        """
+        Prueba que editar el nombre por la API escribe auth_user una sola vez
+        """
+        self.client.login(username='testuser', password='testpass123')
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.post(reverse('inicio_sesion:perfil'),
+                                        json.dumps({'first_name': 'Otro', 'telefono': '+1'}),
+                                        content_type='application/json')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['user']['first_name'], 'Otro')
+        self.assertEqual(len(self._actualizaciones(consultas, 'auth_user')), 1)
+        
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.post(reverse('inicio_sesion:perfil'), json.dumps({'telefono': '+2'}),
+                             content_type='application/json')
+        self.assertEqual(self._actualizaciones(consultas, 'auth_user'), [])
+
+
+class PerfilCondicionalTestCase(TestCase):
+    """
+    Casos de prueba para las peticiones condicionales de vista_perfil
+    """
+    
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        PerfilUsuario.objects.create(usuario=self.user, telefono='+1234567890')
+        self.client.login(username='testuser', password='testpass123')
+        self.url = reverse('inicio_sesion:perfil')
+    
+    def test_perfil_sin_cambios_responde_304(self):
+        """
+        Prueba que una consulta repetida con el ETag devuelve 304 sin cuerpo
+        """
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+    
+    def test_editar_perfil_cambia_etag(self):
+        """
+        Prueba que editar el perfil o el Usuario asociado invalida el ETag
+        """
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url, json.dumps({'telefono': '+0987654321'}), content_type='application/json')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['perfil']['telefono'], '+0987654321')
+        
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Usuario.objects.create(nombre='Nombre Nuevo', correo='test@example.com', contrasena='x')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['user']['nombre_completo'], 'Nombre Nuevo')
+
+    
+    def test_editar_perfil_sin_validadores(self):
+        """
+        Prueba que una edición no consulta los validadores de la petición condicional
+        """
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.post(self.url, json.dumps({'telefono': '+0987654321'}),
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+        validadores = 'SELECT "Usuarios_perfilusuario"."fecha_actualizacion"'
+        self.assertFalse([q for q in consultas if q['sql'].startswith(validadores)])
+
+class RegistroTestCase(TestCase):
+    """
+    Casos de prueba para el registro en una sola transacción
+    """
+    
+    def setUp(self):
+        self.client = Client()
+        self.url = reverse('inicio_sesion:registro')
+    
+    def _registrar(self, **datos):
+        data = {'username': 'nuevo', 'email': 'nuevo@example.com', 'password': 'testpass123'}
+        data.update(datos)
+        return self.client.post(self.url, json.dumps(data), content_type='application/json')
+    
+    def test_registro_inserta_una_vez(self):
+        """
+        Prueba que el registro guarda User con sus nombres en un único INSERT, sin comprobaciones previas
+        """
+        with CaptureQueriesContext(connection) as consultas:
+            response = self._registrar(first_name='Ana', last_name='García')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['user']['nombre_completo'], 'Ana García')
+        
+        sentencias = [q['sql'] for q in consultas]
+        self.assertEqual(len([sql for sql in sentencias if sql.startswith('INSERT INTO "auth_user"')]), 1)
+        self.assertFalse([sql for sql in sentencias if sql.startswith('UPDATE "auth_user"')])
+        self.assertFalse([sql for sql in sentencias if 'EXISTS' in sql or 'LIMIT 1' in sql])
+        
+        user = User.objects.get(username='nuevo')
+        self.assertEqual((user.first_name, user.last_name), ('Ana', 'García'))
+        self.assertTrue(user.check_password('testpass123'))
+    
+    def test_conflictos_por_restriccion(self):
+        """
+        Prueba que username y email repetidos se detectan por las restricciones únicas
+        """
+        self._registrar()
+        response = self._registrar(email='otro@example.com')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['message'], 'El nombre de usuario ya está registrado')
+        
+        response = self._registrar(username='otro')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['message'], 'El email ya está registrado')
+        self.assertEqual(User.objects.count(), 1)
+    
+    def test_conflicto_de_username_que_contiene_email(self):
+        """
+        Prueba que un username con "email" dentro se reporta como username repetido
+        """
+        self._registrar(username='miemail', email='a@example.com')
+        response = self._registrar(username='miemail', email='b@example.com')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['message'], 'El nombre de usuario ya está registrado')
+        
+        # Mensaje de PostgreSQL, que incluye el valor repetido: decide el nombre de la restricción
+        causa = Exception()
+        causa.diag = mock.Mock(constraint_name='auth_user_username_key')
+        error = IntegrityError('duplicate key value violates unique constraint "auth_user_username_key"\n'
+                               'DETAIL:  Key (username)=(miemail) already exists.')
+        error.__cause__ = causa
+        self.assertEqual(views._mensaje_conflicto_registro(error, 'user'), 'El nombre de usuario ya está registrado')
+        causa.diag.constraint_name = views.INDICE_EMAIL_USER
+        self.assertEqual(views._mensaje_conflicto_registro(error, 'user'), 'El email ya está registrado')
+    
+    def test_conflicto_en_usuario_revierte_user(self):
+        """
+        Prueba que si falla el INSERT de Usuario tampoco queda el User creado
+        """
+        Usuario.objects.create(nombre='Existente', correo='nuevo@example.com', contrasena='x')
+        response = self._registrar()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['message'], 'El email ya está registrado')
+        self.assertFalse(User.objects.filter(username='nuevo').exists())
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ImportarUsuariosTestCase(TestCase):
+    """
+    Casos de prueba para el comando importar_usuarios
+    """
+    
+    def _archivo(self, sufijo, contenido):
+        descriptor, ruta = tempfile.mkstemp(suffix=sufijo)
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as archivo:
+            archivo.write(contenido)
+        self.addCleanup(os.remove, ruta)
+        return ruta
+    
+    def _importar(self, ruta, **opciones):
+        salida = StringIO()
+        call_command('importar_usuarios', ruta, stdout=salida, **opciones)
+        return salida.getvalue()
+    
+    def test_importar_csv_por_lotes(self):
+        """
+        Prueba que se crean User, PerfilUsuario y Usuario y se omiten filas inválidas o repetidas
+        """
+        User.objects.create_user(username='existente', email='existente@example.com', password='x')
+        ruta = self._archivo('.csv', (
+            'username,email,password,first_name,last_name,telefono\n'
+            'ana,ana@example.com,clave1,Ana,García,600000000\n'
+            'luis,luis@example.com,clave2,Luis,,\n'
+            'ana,otra@example.com,clave3,,,\n'
+            'existente,nuevo@example.com,clave4,,,\n'
+            'sin_email,,clave5,,,\n'
+            'marta,marta@example.com,,Marta,Ruiz,\n'
+        ))
+        salida = self._importar(ruta, lote=2, procesos=0)
+        self.assertIn('Importados 3 usuarios', salida)
+        self.assertIn('omitidos 3', salida)
+        
+        ana = User.objects.get(username='ana')
+        self.assertTrue(ana.check_password('clave1'))
+        self.assertEqual(ana.perfil.telefono, '600000000')
+        self.assertEqual(Usuario.objects.get(correo='ana@example.com').nombre, 'Ana García')
+        self.assertFalse(User.objects.get(username='marta').has_usable_password())
+        self.assertEqual(PerfilUsuario.objects.count(), 3)
+    
+    def test_importar_jsonl_con_procesos(self):
+        """
+        Prueba la lectura de JSONL cifrando las contraseñas en procesos aparte
+        """
+        ruta = self._archivo('.jsonl', '\n'.join(
+            json.dumps({'username': f'alumno{i}', 'email': f'alumno{i}@example.com', 'password': f'clave{i}'})
+            for i in range(5)
+        ))
+        self._importar(ruta, lote=2, procesos=2)
+        self.assertEqual(User.objects.filter(username__startswith='alumno').count(), 5)
+        self.assertTrue(User.objects.get(username='alumno3').check_password('clave3'))
+        self.assertEqual(Usuario.objects.get(correo='alumno4@example.com').nombre, 'alumno4')
+
+
+class EnlaceUsuarioTestCase(TestCase):
+    """
+    Casos de prueba para el enlace directo entre Usuario y el usuario de Django
+    """
+    
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        PerfilUsuario.objects.create(usuario=self.user, telefono='+1234567890')
+        self.usuario = Usuario.objects.create(nombre='Nombre Personalizado', correo='test@example.com', contrasena='x')
+        self.client.login(username='testuser', password='testpass123')
+    
+    def test_usuario_se_enlaza_por_correo(self):
+        """
+        Prueba que un Usuario creado sin enlace se enlaza con el User de su correo
+        """
+        self.assertEqual(self.usuario.usuario, self.user)
+        self.assertEqual(self.user.usuario_personalizado, self.usuario)
+    
+    def test_perfil_en_una_consulta(self):
+        """
+        Prueba que la consulta de perfil lee User, PerfilUsuario y Usuario con un único JOIN
+        """
+        url = reverse('inicio_sesion:perfil')
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(url)
+        self.assertEqual(response.json()['user']['nombre_completo'], 'Nombre Personalizado')
+        
+        sentencias = [q['sql'] for q in consultas if 'Usuarios_' in q['sql']]
+        # Validadores de la petición condicional y carga del payload
+        self.assertEqual(len(sentencias), 2)
+        self.assertTrue(all('"Usuarios_perfilusuario"' in sql and '"Usuarios_usuario"' in sql for sql in sentencias))
+        
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.post(url, json.dumps({'first_name': 'Ana'}), content_type='application/json')
+        self.assertEqual(response.json()['user']['nombre_completo'].strip(), 'Ana')
+        lecturas = [q['sql'] for q in consultas if q['sql'].startswith('SELECT') and 'Usuarios_' in q['sql']]
+        # Un POST no evalúa los validadores: solo la carga del perfil
+        self.assertEqual(len(lecturas), 1)
+    
+    def test_relleno_por_correo(self):
+        """
+        Prueba la migración que enlaza por correo los Usuario existentes
+        """
+        otro = User.objects.create_user(username='otro', email='otro@example.com', password='x')
+        huerfano = Usuario.objects.create(nombre='Sin cuenta', correo='nadie@example.com', contrasena='x')
+        Usuario.objects.create(nombre='Otro', correo='otro@example.com', contrasena='x')
+        Usuario.objects.update(usuario=None)
+        
+        migracion = importlib.import_module('applications.Usuarios.migrations.0007_usuario_relleno_enlace_user')
+        with mock.patch.object(migracion, 'LOTE', 1):
+            migracion.enlazar_por_correo(apps, mock.Mock(connection=connection))
+        
+        self.assertEqual(dict(Usuario.objects.values_list('correo', 'usuario')), {
+            'test@example.com': self.user.id,
+            'otro@example.com': otro.id,
+            'nadie@example.com': None,
+        })
+        self.assertIsNone(Usuario.objects.get(pk=huerfano.pk).usuario)
+
+
+class MiniaturasAvatarTestCase(TestCase):
+    """
+    Casos de prueba para las miniaturas del avatar
+    """
+    
+    def setUp(self):
+        cache.clear()
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        ajustes = override_settings(MEDIA_ROOT=directorio.name, MEDIA_URL='/media/', USUARIOS_MINIATURAS_HILOS=0)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass123')
+        self.perfil = PerfilUsuario.objects.create(usuario=self.user)
+        self.client.login(username='testuser', password='testpass123')
+    
+    def _imagen(self, nombre='foto.png', tamano=(800, 600), modo='RGB', color=(200, 30, 30)):
+        contenido = BytesIO()
+        Image.new(modo, tamano, color).save(contenido, 'PNG')
+        return SimpleUploadedFile(nombre, contenido.getvalue(), content_type='image/png')
+    
+    def _subir(self, perfil, archivo):
+        perfil.avatar = archivo
+        with self.captureOnCommitCallbacks(execute=True):
+            perfil.save()
+        perfil.refresh_from_db()
+        return perfil
+    
+    def test_avatar_nuevo_genera_miniaturas(self):
+        """
+        Prueba que guardar un avatar genera cada tamaño en WebP y JPEG con nombre por hash
+        """
+        perfil = self._subir(self.perfil, self._imagen())
+        self.assertEqual(len(perfil.avatar_hash), 32)
+        storage = miniaturas._storage()
+        for tamano in miniaturas.TAMANOS:
+            for formato, formato_pil in (('webp', 'WEBP'), ('jpeg', 'JPEG')):
+                nombre = miniaturas.nombre_miniatura(perfil.avatar_hash, tamano, formato)
+                with storage.open(nombre) as archivo, Image.open(archivo) as imagen:
+                    self.assertEqual(imagen.size, (tamano, tamano))
+                    self.assertEqual(imagen.format, formato_pil)
+    
+    def test_payloads_con_urls_de_miniaturas(self):
+        """
+        Prueba que dashboard y perfil devuelven las URLs una vez generadas, sin esperar a la caché
+        """
+        url = reverse('inicio_sesion:dashboard')
+        self.assertIsNone(self.client.get(url).json()['perfil']['avatar_miniaturas'])
+        perfil = self._subir(self.perfil, self._imagen())
+        
+        for url in (reverse('inicio_sesion:dashboard'), reverse('inicio_sesion:perfil')):
+            datos = self.client.get(url).json()['perfil']
+            self.assertEqual(sorted(datos['avatar_miniaturas'], key=int), ['48', '128', '512'])
+            self.assertTrue(datos['avatar'].startswith('/media/avatars/'))
+            self.assertEqual(datos['avatar_miniaturas']['48']['webp'],
+                             f'/media/avatars/miniaturas/{perfil.avatar_hash[:2]}/{perfil.avatar_hash}-48.webp')
+    
+    def test_mismo_contenido_reutiliza_miniaturas(self):
+        """
+        Prueba que otra subida de la misma imagen usa el mismo hash sin volver a decodificarla
+        """
+        primero = self._subir(self.perfil, self._imagen())
+        otro = PerfilUsuario.objects.create(
+            usuario=User.objects.create_user(username='otro', email='otro@example.com', password='x')
+        )
+        with mock.patch.object(miniaturas, 'renderizar') as renderizar:
+            otro = self._subir(otro, self._imagen(nombre='copia.png'))
+        renderizar.assert_not_called()
+        self.assertEqual(otro.avatar_hash, primero.avatar_hash)
+        self.assertNotEqual(otro.avatar.name, primero.avatar.name)
+    
+    def test_cambio_de_avatar_vacia_hash(self):
+        """
+        Prueba que un avatar nuevo no sirve las miniaturas del anterior mientras se generan
+        """
+        perfil = self._subir(self.perfil, self._imagen())
+        perfil.avatar = self._imagen(color=(0, 0, 255))
+        perfil.save()
+        self.assertIsNone(PerfilUsuario.objects.get(pk=perfil.pk).avatar_hash)
+        
+        # Guardar otros campos no vuelve a generarlas
+        perfil.telefono = '+1'
+        with mock.patch.object(miniaturas, 'programar') as programar:
+            perfil.save()
+        programar.assert_not_called()
+    
+    def test_escritura_concurrente_sin_nombres_alternativos(self):
+        """
+        Prueba que si otro proceso escribe las miniaturas a la vez no quedan copias con otro nombre
+        """
+        storage = miniaturas._storage()
+        primero = self._subir(self.perfil, self._imagen())
+        directorio = os.path.dirname(storage.path(miniaturas.nombre_miniatura(primero.avatar_hash, 48, 'webp')))
+        archivos = sorted(os.listdir(directorio))
+        
+        # exists() dice que faltan, como si el otro escritor terminara justo después de comprobarlo
+        PerfilUsuario.objects.filter(pk=primero.pk).update(avatar_hash=None)
+        with mock.patch('django.core.files.storage.FileSystemStorage.exists', return_value=False):
+            self.assertEqual(miniaturas.generar_miniaturas(primero.pk), primero.avatar_hash)
+        self.assertEqual(sorted(os.listdir(directorio)), archivos)
+        self.assertEqual(len(archivos), len(miniaturas.TAMANOS) * len(miniaturas.FORMATOS))
+        with storage.open(miniaturas.nombre_miniatura(primero.avatar_hash, 128, 'jpeg')) as archivo:
+            self.assertEqual(Image.open(archivo).size, (128, 128))
+    
+    def test_transparencia_en_jpeg(self):
+        """
+        Prueba que una imagen con canal alfa conserva la transparencia en WebP y usa fondo blanco en JPEG
+        """
+        perfil = self._subir(self.perfil, self._imagen(modo='RGBA', color=(0, 0, 0, 0)))
+        storage = miniaturas._storage()
+        with storage.open(miniaturas.nombre_miniatura(perfil.avatar_hash, 48, 'webp')) as archivo:
+            self.assertEqual(Image.open(archivo).mode, 'RGBA')
+        with storage.open(miniaturas.nombre_miniatura(perfil.avatar_hash, 48, 'jpeg')) as archivo:
+            imagen = Image.open(archivo)
+            self.assertEqual(imagen.mode, 'RGB')
+            self.assertGreater(min(imagen.getpixel((24, 24))), 240)
+    
+    def test_imagen_danada_no_falla(self):
+        """
+        Prueba que un avatar que no es una imagen deja el perfil sin miniaturas y lo registra
+        """
+        with self.assertLogs('applications.Usuarios.miniaturas', 'ERROR'):
+            perfil = self._subir(self.perfil, SimpleUploadedFile('roto.png', b'no es una imagen'))
+        self.assertIsNone(perfil.avatar_hash)
+        self.assertIsNone(self.client.get(reverse('inicio_sesion:perfil')).json()['perfil']['avatar_miniaturas'])
+    
+    def test_generacion_en_pool(self):
+        """
+        Prueba que con hilos configurados la generación se envía al pool tras el commit
+        """
+        self.perfil.avatar = self._imagen()
+        with override_settings(USUARIOS_MINIATURAS_HILOS=2), \
+                mock.patch.object(miniaturas, '_obtener_pool') as pool:
+            with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                self.perfil.save()
+            pool.return_value.submit.assert_not_called()
+            for callback in callbacks:
+                callback()
+        pool.return_value.submit.assert_called_once_with(miniaturas._generar_en_pool, self.perfil.pk)
+    
+    def test_comando_generar_miniaturas(self):
+        """
+        Prueba que el comando rellena las miniaturas de avatares existentes
+        """
+        self.perfil.avatar = self._imagen()
+        self.perfil.save()
+        self.assertIsNone(PerfilUsuario.objects.get(pk=self.perfil.pk).avatar_hash)
+        
+        salida = StringIO()
+        call_command('generar_miniaturas', stdout=salida)
+        self.assertIn('1 perfiles', salida.getvalue())
+        self.assertIsNotNone(PerfilUsuario.objects.get(pk=self.perfil.pk).avatar_hash)
+
+
+class SubidaAvatarTestCase(TestCase):
+    """
+    Casos de prueba para la subida de avatares en streaming
+    """
+    
+    def setUp(self):
+        cache.clear()
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        ajustes = override_settings(MEDIA_ROOT=directorio.name, MEDIA_URL='/media/', USUARIOS_MINIATURAS_HILOS=0)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass123')
+        self.perfil = PerfilUsuario.objects.create(usuario=self.user)
+        self.client.login(username='testuser', password='testpass123')
+        self.url = reverse('inicio_sesion:avatar')
+    
+    def _imagen(self, formato='JPEG', tamano=(640, 480), modo='RGB', nombre='foto.jpg'):
+        contenido = BytesIO()
+        Image.new(modo, tamano, 128).save(contenido, formato)
+        return SimpleUploadedFile(nombre, contenido.getvalue())
+    
+    def test_subida_adjunta_avatar(self):
+        """
+        Prueba que la imagen se mueve desde el temporal al avatar con un nombre propio y genera miniaturas
+        """
+        imagen = self._imagen(nombre='../../otro.png')
+        with mock.patch('django.core.files.storage.filesystem.file_move_safe',
+                        wraps=file_move_safe) as mover, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, {'avatar': imagen})
+        
+        self.assertEqual(response.status_code, 200)
+        datos = response.json()
+        self.assertEqual((datos['ancho'], datos['alto']), (640, 480))
+        mover.assert_called_once()
+        perfil = PerfilUsuario.objects.get(pk=self.perfil.pk)
+        self.assertRegex(perfil.avatar.name, r'^avatars/[0-9a-f]{32}\.jpg$')
+        self.assertEqual(datos['avatar'], perfil.avatar.url)
+        imagen.seek(0)
+        with perfil.avatar.open('rb') as archivo:
+            self.assertEqual(archivo.read(), imagen.read())
+        self.assertIsNotNone(perfil.avatar_hash)
+    
+    def test_cambiar_avatar_borra_el_anterior(self):
+        """
+        Prueba que al subir otro avatar se borran el archivo anterior y sus miniaturas
+        """
+        storage = miniaturas._storage()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url, {'avatar': self._imagen()})
+        anterior = PerfilUsuario.objects.get(pk=self.perfil.pk)
+        miniaturas_anteriores = [miniaturas.nombre_miniatura(anterior.avatar_hash, tamano, formato)
+                                 for tamano in miniaturas.TAMANOS for formato in miniaturas.FORMATOS]
+        self.assertTrue(all(storage.exists(nombre) for nombre in miniaturas_anteriores))
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, {'avatar': self._imagen(tamano=(320, 240))})
+        
+        self.assertEqual(response.status_code, 200)
+        perfil = PerfilUsuario.objects.get(pk=self.perfil.pk)
+        self.assertNotEqual(perfil.avatar.name, anterior.avatar.name)
+        self.assertTrue(storage.exists(perfil.avatar.name))
+        self.assertFalse(storage.exists(anterior.avatar.name))
+        self.assertFalse(any(storage.exists(nombre) for nombre in miniaturas_anteriores))
+    
+    def test_content_length_excesivo_no_lee_el_cuerpo(self):
+        """
+        Prueba que un Content-Length mayor que el límite se rechaza sin procesar la subida
+        """
+        # Ruido: no se comprime y ocupa más que el margen multipart
+        contenido = BytesIO()
+        Image.effect_noise((400, 400), 60).save(contenido, 'PNG')
+        imagen = SimpleUploadedFile('ruido.png', contenido.getvalue())
+        self.assertGreater(imagen.size, 1000 + subidas.MARGEN_MULTIPART)
+        with override_settings(USUARIOS_AVATAR_MAX_BYTES=1000), \
+                mock.patch.object(subidas.ManejadorSubidaAvatar, 'receive_data_chunk') as recibir:
+            response = self.client.post(self.url, {'avatar': imagen})
+        self.assertEqual(response.status_code, 413)
+        recibir.assert_not_called()
+    
+    def test_tamano_maximo_durante_la_subida(self):
+        """
+        Prueba que el manejador corta la subida cuando los bytes recibidos superan el límite
+        """
+        imagen = self._imagen(formato='PNG', tamano=(300, 300), modo='RGB', nombre='foto.png')
+        limite = imagen.size - 10
+        self.assertLess(imagen.size + 1000, limite + subidas.MARGEN_MULTIPART)
+        with override_settings(USUARIOS_AVATAR_MAX_BYTES=limite):
+            response = self.client.post(self.url, {'avatar': imagen})
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(PerfilUsuario.objects.get(pk=self.perfil.pk).avatar)
+    
+    def test_pixeles_por_cabecera(self):
+        """
+        Prueba que una imagen con demasiados píxeles se rechaza leyendo solo su cabecera
+        """
+        imagen = self._imagen(formato='PNG', tamano=(6000, 6000), modo='1', nombre='grande.png')
+        with mock.patch.object(Image.Image, 'load') as decodificar:
+            response = self.client.post(self.url, {'avatar': imagen})
+        self.assertEqual(response.status_code, 413)
+        self.assertIn('píxeles', response.json()['message'])
+        decodificar.assert_not_called()
+    
+    def test_formato_no_admitido(self):
+        """
+        Prueba que un GIF o un archivo que no es una imagen se rechazan con 415
+        """
+        for archivo in (self._imagen(formato='GIF', nombre='a.gif'), SimpleUploadedFile('a.jpg', b'texto')):
+            response = self.client.post(self.url, {'avatar': archivo})
+            self.assertEqual(response.status_code, 415)
+        self.assertFalse(PerfilUsuario.objects.get(pk=self.perfil.pk).avatar)
+    
+    def test_sin_archivo(self):
+        """
+        Prueba que una petición sin el campo avatar devuelve 400
+        """
+        self.assertEqual(self.client.post(self.url, {'otro': self._imagen()}).status_code, 400)
+        response = self.client.post(self.url, json.dumps({'avatar': 'x'}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+    
+    def test_otros_archivos_no_afectan_al_avatar(self):
+        """
+        Prueba que un archivo extra después del avatar se descarta sin cerrar el avatar recibido
+        """
+        response = self.client.post(self.url, {'avatar': self._imagen(), 'otro': self._imagen(nombre='b.jpg')})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(PerfilUsuario.objects.get(pk=self.perfil.pk).avatar.name.endswith('.jpg'))
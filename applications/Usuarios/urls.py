@@ -9,4 +9,5 @@ urlpatterns = [
     path('register/', views.vista_registro, name='registro'),
     path('dashboard/', views.vista_dashboard, name='dashboard'),
     path('profile/', views.vista_perfil, name='perfil'),
+    path('profile/avatar/', views.vista_subir_avatar, name='avatar'),
 ]
@@ -7,12 +7,22 @@ from django.urls import reverse_lazy
 from django.views.generic import CreateView
 from django.http import JsonResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import condition, require_http_methods
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http.multipartparser import MultiPartParserError
+import hashlib
 import json
+import uuid
+from applications.monitoreo.middleware import medir
 from .forms import FormularioRegistroPersonalizado, FormularioPerfilUsuario
 from .models import PerfilUsuario, Usuario
+from .cache import invalidar_usuario, obtener_payload
+from .miniaturas import borrar_avatar, urls_miniaturas
+from .subidas import CAMPO, FORMATOS, MARGEN_MULTIPART, ManejadorSubidaAvatar, max_bytes
 
 
 def vista_home(request):
@@ -29,7 +39,8 @@ def vista_home(request):
                 'logout': '/api/usuarios/logout/',
                 'register': '/api/usuarios/register/',
                 'dashboard': '/api/usuarios/dashboard/',
-                'profile': '/api/usuarios/profile/'
+                'profile': '/api/usuarios/profile/',
+                'avatar': '/api/usuarios/profile/avatar/'
             },
             'progreso': {
                 'lista': '/api/progreso/',
@@ -113,53 +124,124 @@ def vista_cerrar_sesion(request):
         }, status=500)
 
 
+def _cargar_usuario(user):
+    """
+    Relee el usuario con su perfil y su Usuario personalizado en una sola
+    consulta (LEFT JOIN de ambas relaciones)
+    """
+    return User.objects.select_related('perfil', 'usuario_personalizado').get(pk=user.pk)
+
+
+def _obtener_perfil(user):
+    """
+    Obtiene o crea el perfil del usuario
+    """
+    try:
+        return user.perfil
+    except PerfilUsuario.DoesNotExist:
+        return PerfilUsuario.objects.create(usuario=user)
+
+
+def _usuario_personalizado(user):
+    """
+    Usuario personalizado enlazado al usuario de Django, o None
+    """
+    try:
+        return user.usuario_personalizado
+    except Usuario.DoesNotExist:
+        return None
+
+
+def _nombre_completo(user):
+    usuario = _usuario_personalizado(user)
+    if usuario is not None:
+        return usuario.nombre
+    return f"{user.first_name} {user.last_name}".strip() or user.username
+
+
+def _datos_dashboard(user):
+    """
+    Construye el payload del dashboard (se guarda en caché por usuario)
+    """
+    user = _cargar_usuario(user)
+    perfil = _obtener_perfil(user)
+    nombre_completo = _nombre_completo(user)
+    
+    # Preparar datos de perfil
+    perfil_data = {
+        'first_name': perfil.first_name or user.first_name or '',
+        'last_name': perfil.last_name or user.last_name or '',
+        'telefono': perfil.telefono or '',
+        'fecha_nacimiento': perfil.fecha_nacimiento.isoformat() if perfil.fecha_nacimiento else None,
+        'direccion': perfil.direccion or '',
+        'avatar': perfil.avatar.url if perfil.avatar else None,
+        'avatar_miniaturas': urls_miniaturas(perfil.avatar_hash),
+        'fecha_creacion': perfil.fecha_creacion.isoformat(),
+        'fecha_actualizacion': perfil.fecha_actualizacion.isoformat()
+    }
+
+    user_data = {
+        'id': user.id,
+        'username': user.username,
+        'email': user.email,
+        'first_name': user.first_name or '',
+        'last_name': user.last_name or '',
+        'nombre_completo': nombre_completo,
+        'is_active': user.is_active,
+        'date_joined': user.date_joined.isoformat()
+    }
+
+    return {
+        'success': True,
+        'user': user_data,
+        'perfil': perfil_data
+    }
+
+
+def _datos_perfil(user, perfil):
+    """
+    Construye el payload de la consulta de perfil (se guarda en caché por usuario)
+    """
+    nombre_completo = _nombre_completo(user)
+
+    # Preparar datos de usuario y perfil
+    user_data = {
+        'id': user.id,
+        'username': user.username,
+        'email': user.email,
+        'first_name': user.first_name or '',
+        'last_name': user.last_name or '',
+        'nombre_completo': nombre_completo
+    }
+    
+    perfil_data = {
+        'first_name': perfil.first_name or user.first_name or '',
+        'last_name': perfil.last_name or user.last_name or '',
+        'telefono': perfil.telefono or '',
+        'fecha_nacimiento': perfil.fecha_nacimiento.isoformat() if perfil.fecha_nacimiento else None,
+        'direccion': perfil.direccion or '',
+        'avatar': perfil.avatar.url if perfil.avatar else None,
+        'avatar_miniaturas': urls_miniaturas(perfil.avatar_hash),
+        'fecha_creacion': perfil.fecha_creacion.isoformat(),
+        'fecha_actualizacion': perfil.fecha_actualizacion.isoformat()
+    }
+    
+    return {
+        'success': True,
+        'user': user_data,
+        'perfil': perfil_data
+    }
+
+
 @login_required
 def vista_dashboard(request):
     """
     API del dashboard después del inicio de sesión
     """
     try:
-        # Obtener perfil
-        try:
-            perfil = request.user.perfil
-        except PerfilUsuario.DoesNotExist:
-            perfil = PerfilUsuario.objects.create(usuario=request.user)
-        
-        # Obtener usuario personalizado
-        try:
-            usuario = Usuario.objects.get(correo=request.user.email)
-            nombre_completo = usuario.nombre
-        except Usuario.DoesNotExist:
-            nombre_completo = f"{request.user.first_name} {request.user.last_name}".strip() or request.user.username
-        
-        # Preparar datos de perfil
-        perfil_data = {
-            'first_name': perfil.first_name or request.user.first_name or '',
-            'last_name': perfil.last_name or request.user.last_name or '',
-            'telefono': perfil.telefono or '',
-            'fecha_nacimiento': perfil.fecha_nacimiento.isoformat() if perfil.fecha_nacimiento else None,
-            'direccion': perfil.direccion or '',
-            'avatar': perfil.avatar.url if perfil.avatar else None,
-            'fecha_creacion': perfil.fecha_creacion.isoformat(),
-            'fecha_actualizacion': perfil.fecha_actualizacion.isoformat()
-        }
-
-        user_data = {
-            'id': request.user.id,
-            'username': request.user.username,
-            'email': request.user.email,
-            'first_name': request.user.first_name or '',
-            'last_name': request.user.last_name or '',
-            'nombre_completo': nombre_completo,
-            'is_active': request.user.is_active,
-            'date_joined': request.user.date_joined.isoformat()
-        }
-
-        return JsonResponse({
-            'success': True,
-            'user': user_data,
-            'perfil': perfil_data
-        })
+        payload = obtener_payload('dashboard', request.user.pk, lambda: _datos_dashboard(request.user))
+        with medir('serializacion'):
+            return JsonResponse(payload)
     except Exception as e:
         return JsonResponse({
             'success': False,
@@ -167,6 +249,34 @@ def vista_dashboard(request):
         }, status=500)
 
 
+# Índice único parcial de auth_user.email (migración 0005_email_unico_auth_user)
+INDICE_EMAIL_USER = 'usuarios_user_email_unico'
+
+
+def _conflicto_de_email(error):
+    """
+    Indica si la violación de unicidad en auth_user es la del correo. Se decide
+    por la restricción y no por el texto completo, que en PostgreSQL incluye el
+    valor repetido (un username como "miemail" no debe leerse como correo)
+    """
+    diag = getattr(error.__cause__, 'diag', None)
+    if diag is not None and getattr(diag, 'constraint_name', None):
+        # psycopg y psycopg2
+        return diag.constraint_name == INDICE_EMAIL_USER
+    # SQLite nombra la columna: "UNIQUE constraint failed: auth_user.email"
+    return 'auth_user.email' in str(error)
+
+
+def _mensaje_conflicto_registro(error, paso):
+    """
+    Traduce la violación de unicidad de un paso del registro al mensaje de la
+    API; en el paso de Usuario solo puede fallar el correo
+    """
+    if paso == 'usuario' or _conflicto_de_email(error):
+        return 'El email ya está registrado'
+    return 'El nombre de usuario ya está registrado'
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def vista_registro(request):
@@ -185,43 +295,41 @@ def vista_registro(request):
                     'message': f'El campo {field} es requerido'
                 }, status=400)
         
-        # Verificar que el email no exista
-        if User.objects.filter(email=data['email']).exists():
-            return JsonResponse({
-                'success': False,
-                'message': 'El email ya está registrado'
-            }, status=400)
+        nombre_completo = f"{data.get('first_name', '')} {data.get('last_name', '')}".strip()
+        if not nombre_completo:
+            nombre_completo = data['username']
+        
+        # El hash se calcula antes de abrir la transacción para no alargarla
+        contrasena_cifrada = make_password(data['password'])
         
-        # Verificar que el username no exista
-        if User.objects.filter(username=data['username']).exists():
+        # Los duplicados se detectan por las restricciones únicas de la base de datos
+        # (auth_user.username, auth_user.email y Usuario.correo), sin consultas previas
+        paso = 'user'
+        try:
+            with transaction.atomic():
+                # Usuario de Django con nombre y apellido en un único INSERT
+                user = User.objects.create(
+                    username=User.normalize_username(data['username']),
+                    email=User.objects.normalize_email(data['email']),
+                    password=contrasena_cifrada,
+                    first_name=data.get('first_name', ''),
+                    last_name=data.get('last_name', '')
+                )
+                
+                # Crear el usuario personalizado
+                paso = 'usuario'
+                usuario = Usuario.objects.create(
+                    usuario=user,
+                    nombre=nombre_completo,
+                    correo=data['email'],
+                    contrasena=data['password']  # Nota: en producción deberías encriptar esta contraseña
+                )
+        except IntegrityError as e:
             return JsonResponse({
                 'success': False,
-                'message': 'El nombre de usuario ya está registrado'
+                'message': _mensaje_conflicto_registro(e, paso)
             }, status=400)
         
-        # Crear el usuario de Django con nombre y apellido opcionales
-        user = User.objects.create_user(
-            username=data['username'],
-            email=data['email'],
-            password=data['password']
-        )
-        
-        # Actualizar first_name y last_name si se proporcionan
-        user.first_name = data.get('first_name', '')
-        user.last_name = data.get('last_name', '')
-        user.save()
-        
-        # Crear el usuario personalizado
-        nombre_completo = f"{data.get('first_name', '')} {data.get('last_name', '')}".strip()
-        if not nombre_completo:
-            nombre_completo = data['username']
-            
-        usuario = Usuario.objects.create(
-            nombre=nombre_completo,
-            correo=data['email'],
-            contrasena=data['password']  # Nota: en producción deberías encriptar esta contraseña
-        )
-        
         return JsonResponse({
             'success': True,
             'message': '¡Cuenta creada exitosamente! Ahora puedes iniciar sesión.',
@@ -247,55 +355,62 @@ def vista_registro(request):
         }, status=500)
 
 
+def _validadores_perfil(request):
+    """
+    Fecha de actualización del perfil y nombre del Usuario asociado en una sola
+    consulta, calculados una vez por petición (None si el perfil no existe).
+    Solo en las lecturas: una edición no se evalúa como petición condicional
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    if not hasattr(request, '_validadores_perfil'):
+        request._validadores_perfil = PerfilUsuario.objects.filter(usuario=request.user).values(
+            'fecha_actualizacion', nombre=F('usuario__usuario_personalizado__nombre')
+        ).first()
+    return request._validadores_perfil
+
+
+def _etag_perfil(request):
+    """
+    ETag de la consulta de perfil; los campos de User ya están cargados en
+    request.user y no requieren consulta
+    """
+    datos = _validadores_perfil(request)
+    if datos is None:
+        return None
+    user = request.user
+    clave = (f'{user.pk}|{user.username}|{user.email}|{user.first_name}|{user.last_name}|'
+             f'{datos["nombre"]}|{datos["fecha_actualizacion"].isoformat()}')
+    return hashlib.md5(clave.encode()).hexdigest()
+
+
+def _ultima_modificacion_perfil(request):
+    datos = _validadores_perfil(request)
+    return datos['fecha_actualizacion'] if datos else None
+
+
 @csrf_exempt
 @login_required
+@condition(etag_func=_etag_perfil, last_modified_func=_ultima_modificacion_perfil)
 def vista_perfil(request):
     """
     API para ver y editar el perfil del usuario
     """
     try:
-        # Obtener o crear perfil
-        try:
-            perfil = request.user.perfil
-        except PerfilUsuario.DoesNotExist:
-            perfil = PerfilUsuario.objects.create(usuario=request.user)
-        
         if request.method == 'GET':
-            # Obtener usuario personalizado
-            try:
-                usuario = Usuario.objects.get(correo=request.user.email)
-                nombre_completo = usuario.nombre
-            except Usuario.DoesNotExist:
-                nombre_completo = f"{request.user.first_name} {request.user.last_name}".strip() or request.user.username
-
-            # Preparar datos de usuario y perfil
-            user_data = {
-                'id': request.user.id,
-                'username': request.user.username,
-                'email': request.user.email,
-                'first_name': request.user.first_name or '',
-                'last_name': request.user.last_name or '',
-                'nombre_completo': nombre_completo
-            }
-            
-            perfil_data = {
-                'first_name': perfil.first_name or request.user.first_name or '',
-                'last_name': perfil.last_name or request.user.last_name or '',
-                'telefono': perfil.telefono or '',
-                'fecha_nacimiento': perfil.fecha_nacimiento.isoformat() if perfil.fecha_nacimiento else None,
-                'direccion': perfil.direccion or '',
-                'avatar': perfil.avatar.url if perfil.avatar else None,
-                'fecha_creacion': perfil.fecha_creacion.isoformat(),
-                'fecha_actualizacion': perfil.fecha_actualizacion.isoformat()
-            }
-            
-            return JsonResponse({
-                'success': True,
-                'user': user_data,
-                'perfil': perfil_data
-            })
+            def construir():
+                user = _cargar_usuario(request.user)
+                return _datos_perfil(user, _obtener_perfil(user))
+            payload = obtener_payload('perfil', request.user.pk, construir)
+            with medir('serializacion'):
+                return JsonResponse(payload)
         
         elif request.method == 'POST':
+            # Usuario, perfil y Usuario personalizado en una sola consulta
+            user = _cargar_usuario(request.user)
+            perfil = _obtener_perfil(user)
+            usuario = _usuario_personalizado(user)
+            
             try:
                 data = json.loads(request.body)
                 
@@ -315,25 +430,21 @@ def vista_perfil(request):
                             'message': 'Formato de fecha inválido. Use YYYY-MM-DD'
                         }, status=400)
                 
-                # Actualizar datos del usuario y perfil
+                # Actualizar nombres del perfil; PerfilUsuario.save los sincroniza
+                # con el usuario de Django solo si cambiaron
                 if 'first_name' in data:
                     perfil.first_name = data['first_name']
-                    request.user.first_name = data['first_name']
                 if 'last_name' in data:
                     perfil.last_name = data['last_name']
-                    request.user.last_name = data['last_name']
+                
+                perfil.save()
                 
                 # Actualizar el usuario personalizado si existe
-                try:
-                    usuario = Usuario.objects.get(correo=request.user.email)
-                    if 'first_name' in data or 'last_name' in data:
-                        usuario.nombre = f"{request.user.first_name} {request.user.last_name}"
-                        usuario.save()
-                except Usuario.DoesNotExist:
-                    pass
+                if usuario is not None and ('first_name' in data or 'last_name' in data):
+                    usuario.nombre = f"{user.first_name} {user.last_name}"
+                    usuario.save(update_fields=['nombre'])
                 
-                request.user.save()
-                perfil.save()
+                invalidar_usuario(user.pk)
 
             except json.JSONDecodeError:
                 return JsonResponse({
@@ -346,21 +457,20 @@ def vista_perfil(request):
                     'message': f'Error al actualizar perfil: {str(e)}'
                 }, status=500)
             
-            try:
-                usuario = Usuario.objects.get(correo=request.user.email)
+            if usuario is not None:
                 nombre_completo = usuario.nombre
-            except Usuario.DoesNotExist:
-                nombre_completo = f"{request.user.first_name} {request.user.last_name}"
+            else:
+                nombre_completo = f"{user.first_name} {user.last_name}"
 
             return JsonResponse({
                 'success': True,
                 'message': 'Perfil actualizado correctamente',
                 'user': {
-                    'id': request.user.id,
-                    'username': request.user.username,
-                    'email': request.user.email,
-                    'first_name': request.user.first_name,
-                    'last_name': request.user.last_name,
+                    'id': user.id,
+                    'username': user.username,
+                    'email': user.email,
+                    'first_name': user.first_name,
+                    'last_name': user.last_name,
                     'nombre_completo': nombre_completo
                 },
                 'perfil': {
@@ -368,6 +478,7 @@ def vista_perfil(request):
                     'fecha_nacimiento': perfil.fecha_nacimiento.isoformat() if perfil.fecha_nacimiento else None,
                     'direccion': perfil.direccion,
                     'avatar': perfil.avatar.url if perfil.avatar else None,
+                    'avatar_miniaturas': urls_miniaturas(perfil.avatar_hash),
                     'fecha_creacion': perfil.fecha_creacion.isoformat(),
                     'fecha_actualizacion': perfil.fecha_actualizacion.isoformat()
                 }
@@ -389,3 +500,71 @@ def vista_perfil(request):
             'success': False,
             'message': f'Error al procesar perfil: {str(e)}'
         }, status=500)
+
+
+@csrf_exempt
+@login_required
+@require_http_methods(["POST"])
+def vista_subir_avatar(request):
+    """
+    API para subir el avatar (multipart/form-data, campo avatar). El archivo
+    se escribe a disco por bloques mientras llega (ver subidas.py)
+    """
+    try:
+        # Rechazar sin leer el cuerpo cuando ya se anuncia demasiado grande
+        try:
+            longitud = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            longitud = 0
+        if longitud > max_bytes() + MARGEN_MULTIPART:
+            return JsonResponse({
+                'success': False,
+                'message': f'El avatar supera el tamaño máximo de {max_bytes()} bytes'
+            }, status=413)
+
+        # Antes de acceder a request.FILES; csrf_exempt evita que el middleware lea el cuerpo antes
+        manejador = ManejadorSubidaAvatar(request)
+        request.upload_handlers = [manejador]
+        try:
+            archivo = request.FILES.get(CAMPO)
+        except MultiPartParserError:
+            return JsonResponse({
+                'success': False,
+                'message': 'Cuerpo multipart inválido'
+            }, status=400)
+
+        if manejador.error is not None:
+            return JsonResponse({
+                'success': False,
+                'message': str(manejador.error)
+            }, status=manejador.error.estado)
+        if archivo is None:
+            return JsonResponse({
+                'success': False,
+                'message': f'Envía la imagen en el campo {CAMPO} (multipart/form-data)'
+            }, status=400)
+
+        perfil = _obtener_perfil(request.user)
+        anterior, hash_anterior = perfil.avatar.name, perfil.avatar_hash
+        # El nombre del cliente no es fiable: uno aleatorio con la extensión del formato detectado.
+        # El temporal se mueve al almacenamiento sin copiarlo
+        perfil.avatar.save(f'{uuid.uuid4().hex}.{FORMATOS[manejador.formato]}', archivo, save=False)
+        perfil.save()
+        if anterior:
+            transaction.on_commit(lambda: borrar_avatar(anterior, hash_anterior))
+
+        return JsonResponse({
+            'success': True,
+            'message': 'Avatar actualizado correctamente',
+            'avatar': perfil.avatar.url,
+            # None hasta que el pool genere las miniaturas
+            'avatar_miniaturas': urls_miniaturas(perfil.avatar_hash),
+            'ancho': manejador.ancho,
+            'alto': manejador.alto
+        })
+
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'message': f'Error al subir avatar: {str(e)}'
+        }, status=500)
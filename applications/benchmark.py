@@ -0,0 +1,63 @@
+"""
+Utilidades compartidas por los comandos de benchmark de EduMap.
+
+Los benchmarks se ejecutan siempre sobre una base de datos temporal creada
+con la infraestructura de tests de Django, de modo que nunca tocan los datos
+reales de la base configurada.
+"""
+import contextlib
+import math
+import time
+
+from django.db import connection
+
+
+@contextlib.contextmanager
+def base_datos_temporal(mantener=False, verbosity=0):
+    """Crea una base de datos de pruebas migrada y la destruye al salir"""
+    nombre_original = connection.settings_dict['NAME']
+    connection.creation.create_test_db(
+        verbosity=verbosity, autoclobber=True, serialize=False, keepdb=mantener
+    )
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(nombre_original, verbosity=verbosity, keepdb=mantener)
+
+
+def analizar_tablas():
+    """Actualiza las estadísticas del planificador tras sembrar datos"""
+    with connection.cursor() as cursor:
+        if connection.vendor in ('postgresql', 'sqlite'):
+            cursor.execute('ANALYZE')
+
+
+def percentil(valores, p):
+    """Percentil p (0-100) por el método del rango más cercano"""
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    rango = max(1, math.ceil(p / 100 * len(ordenados)))
+    return ordenados[rango - 1]
+
+
+def cronometrar(funcion, repeticiones):
+    """Ejecuta la función varias veces y devuelve la duración de cada llamada en segundos"""
+    muestras = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        muestras.append(time.perf_counter() - inicio)
+    return muestras
+
+
+def resumen_tiempos(muestras):
+    """Resume una lista de duraciones en segundos como milisegundos"""
+    return {
+        'muestras': len(muestras),
+        'media_ms': round(sum(muestras) / len(muestras) * 1000, 3) if muestras else None,
+        'p50_ms': round(percentil(muestras, 50) * 1000, 3) if muestras else None,
+        'p95_ms': round(percentil(muestras, 95) * 1000, 3) if muestras else None,
+        'p99_ms': round(percentil(muestras, 99) * 1000, 3) if muestras else None,
+    }
+
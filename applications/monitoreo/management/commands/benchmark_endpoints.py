@@ -0,0 +1,412 @@
+import contextlib
+import io
+import itertools
+import json
+import logging
+import platform
+import tempfile
+import time
+import tracemalloc
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django import get_version
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client, override_settings
+from django.urls import URLResolver, get_resolver, reverse
+from django.utils import timezone
+from PIL import Image
+
+from applications.benchmark import analizar_tablas, base_datos_temporal, resumen_tiempos
+from applications.progreso_usuario.models import ProgresoUsuario
+from applications.progreso_usuario.views import _crear_progreso
+from applications.sembrado import CONTRASENA_SINTETICA, sembrar
+
+MODOS = ('wsgi', 'asgi')
+
+MIDDLEWARE_MONITOREO = 'applications.monitoreo.middleware.MonitoreoMiddleware'
+
+
+def rutas_proyecto(patrones=None, prefijo=''):
+    """Nombres con espacio de nombres de las rutas de edumap/urls.py, sin las del admin"""
+    nombres = []
+    for patron in get_resolver().url_patterns if patrones is None else patrones:
+        if isinstance(patron, URLResolver):
+            if patron.namespace == 'admin':
+                continue
+            nombres.extend(rutas_proyecto(
+                patron.url_patterns, f'{prefijo}{patron.namespace}:' if patron.namespace else prefijo
+            ))
+        elif patron.name:
+            nombres.append(prefijo + patron.name)
+    return nombres
+
+
+def _get(url, cliente='usuario', estado=200, cabeceras=None):
+    return {'metodo': 'get', 'url': url, 'datos': None, 'cliente': cliente, 'estado': estado, 'cabeceras': cabeceras}
+
+
+def _post(url, datos=None, cliente='usuario', estado=200, multipart=False):
+    return {'metodo': 'post', 'url': url, 'datos': datos, 'cliente': cliente, 'estado': estado,
+            'multipart': multipart}
+
+
+def _eliminar(ctx, i):
+    # Cada petición borra un progreso distinto, creado fuera de la medición
+    progreso = _crear_progreso(ctx['usuario'], {'actividad': f'Bench eliminar {next(ctx["secuencia"])}', 'progreso': 10})
+    return _post(reverse('progreso_usuario:eliminar', args=[progreso.id]))
+
+
+def _registro(ctx, i):
+    numero = next(ctx['secuencia'])
+    return _post(reverse('inicio_sesion:registro'), {
+        'username': f'registro{numero}', 'email': f'registro{numero}@edumap.test',
+        'password': CONTRASENA_SINTETICA, 'first_name': 'Bench', 'last_name': str(numero)
+    }, cliente='anonimo', estado=201)
+
+
+def _imagen_avatar():
+    """JPEG de 1024 x 1024 con ruido, del tamaño de una foto de móvil recortada"""
+    contenido = io.BytesIO()
+    Image.effect_noise((1024, 1024), 40).convert('RGB').save(contenido, 'JPEG', quality=85)
+    return contenido.getvalue()
+
+
+def _avatar(ctx, i):
+    archivo = SimpleUploadedFile(f'avatar{i}.jpg', ctx['avatar'], content_type='image/jpeg')
+    return _post(reverse('inicio_sesion:avatar'), {'avatar': archivo}, multipart=True)
+
+
+# Token de /metrics durante el benchmark, como lo enviaría el servidor de Prometheus
+TOKEN_METRICAS = 'benchmark'
+
+# Petición de cada ruta en la iteración i; las que escriben usan datos nuevos en cada una.
+# El cliente 'usuario' tiene la sesión del usuario de prueba y 'anonimo' ninguna.
+ESCENARIOS = {
+    'home': lambda ctx, i: _get(reverse('home')),
+    'metricas': lambda ctx, i: _get(reverse('metricas'), cabeceras={'Authorization': f'Bearer {TOKEN_METRICAS}'}),
+    'inicio_sesion:inicio_sesion': lambda ctx, i: _post(
+        reverse('inicio_sesion:inicio_sesion'),
+        {'username': ctx['usuario'].username, 'password': CONTRASENA_SINTETICA}, cliente='anonimo'
+    ),
+    'inicio_sesion:cerrar_sesion': lambda ctx, i: _post(reverse('inicio_sesion:cerrar_sesion'), cliente='anonimo'),
+    'inicio_sesion:registro': _registro,
+    'inicio_sesion:dashboard': lambda ctx, i: _get(reverse('inicio_sesion:dashboard')),
+    'inicio_sesion:perfil': lambda ctx, i: _get(reverse('inicio_sesion:perfil')),
+    'inicio_sesion:avatar': _avatar,
+    'progreso_usuario:lista': lambda ctx, i: _get(reverse('progreso_usuario:lista')),
+    'progreso_usuario:crear': lambda ctx, i: _post(
+        reverse('progreso_usuario:crear'), {'actividad': f'Bench crear {next(ctx["secuencia"])}', 'progreso': 25},
+        estado=201
+    ),
+    'progreso_usuario:lote': lambda ctx, i: _post(reverse('progreso_usuario:lote'), {'progresos': [
+        {'actividad': f'Actividad {a}', 'progreso': (i + a) % 100} for a in range(min(ctx['actividades'], 10))
+    ]}),
+    'progreso_usuario:buscar': lambda ctx, i: _get(reverse('progreso_usuario:buscar') + '?q=Actividad'),
+    'progreso_usuario:resumen': lambda ctx, i: _get(reverse('progreso_usuario:resumen')),
+    'progreso_usuario:clasificacion': lambda ctx, i: _get(
+        reverse('progreso_usuario:clasificacion') + '?actividad=Actividad%200'
+    ),
+    'progreso_usuario:analitica': lambda ctx, i: _get(reverse('progreso_usuario:analitica') + '?periodo=dia'),
+    'progreso_usuario:exportar': lambda ctx, i: _get(reverse('progreso_usuario:exportar', args=['progresos'])),
+    'progreso_usuario:detalle': lambda ctx, i: _get(reverse('progreso_usuario:detalle', args=[ctx['progreso_id']])),
+    'progreso_usuario:logs': lambda ctx, i: _get(reverse('progreso_usuario:logs', args=[ctx['progreso_id']])),
+    'progreso_usuario:editar': lambda ctx, i: _post(
+        reverse('progreso_usuario:editar', args=[ctx['progreso_id']]), {'progreso': i % 100}
+    ),
+    'progreso_usuario:eliminar': _eliminar,
+    'progreso_usuario:actualizar': lambda ctx, i: _post(
+        reverse('progreso_usuario:actualizar', args=[ctx['progreso_id']]), {'progreso': i % 100}
+    ),
+    'progreso_usuario:lista_async': lambda ctx, i: _get(reverse('progreso_usuario:lista_async')),
+    'progreso_usuario:crear_async': lambda ctx, i: _post(
+        reverse('progreso_usuario:crear_async'), {'actividad': f'Bench crear {next(ctx["secuencia"])}', 'progreso': 25},
+        estado=201
+    ),
+    'progreso_usuario:detalle_async': lambda ctx, i: _get(
+        reverse('progreso_usuario:detalle_async', args=[ctx['progreso_id']])
+    ),
+    'progreso_usuario:actualizar_async': lambda ctx, i: _post(
+        reverse('progreso_usuario:actualizar_async', args=[ctx['progreso_id']]), {'progreso': i % 100}
+    ),
+}
+
+
+def _argumentos(peticion):
+    if peticion.get('cabeceras'):
+        return {'headers': peticion['cabeceras'], **_argumentos({**peticion, 'cabeceras': None})}
+    if peticion['datos'] is None:
+        return {}
+    if peticion.get('multipart'):
+        # El cliente de tests codifica los dict como multipart/form-data
+        return {'data': peticion['datos']}
+    return {'data': json.dumps(peticion['datos']), 'content_type': 'application/json'}
+
+
+class Command(BaseCommand):
+    help = (
+        'Siembra un conjunto de datos sintético en una base de datos temporal y recorre todas las rutas '
+        'de edumap/urls.py con el cliente de tests (WSGI) y el manejador ASGI, midiendo p50/p95/p99, '
+        'consultas por petición y pico de memoria'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', type=int, default=200)
+        parser.add_argument('--actividades', type=int, default=20, help='Actividades por usuario')
+        parser.add_argument('--logs', type=int, default=20, help='Logs por progreso')
+        parser.add_argument('--semilla', type=int, default=42)
+        parser.add_argument('--repeticiones', type=int, default=50, help='Peticiones medidas por ruta y modo')
+        parser.add_argument('--calentamiento', type=int, default=5, help='Peticiones previas sin medir')
+        parser.add_argument('--memoria', type=int, default=5,
+                            help='Peticiones por ruta y modo medidas aparte con tracemalloc')
+        parser.add_argument('--modo', choices=[*MODOS, 'ambos'], default='ambos')
+        parser.add_argument('--rutas', help='Nombres de ruta separados por comas; por defecto todas')
+        parser.add_argument('--salida', help='Archivo JSON donde guardar los resultados')
+        parser.add_argument('--comparar', help='Resultados JSON de una ejecución anterior')
+        parser.add_argument('--tolerancia', type=float,
+                            help='Con --comparar, falla si el p95 de alguna ruta empeora más de este porcentaje')
+        parser.add_argument('--hasher-real', action='store_true',
+                            help='Usa PASSWORD_HASHERS de la configuración en lugar de uno rápido')
+        parser.add_argument('--mantener-bd', action='store_true',
+                            help='Reutiliza la base de datos temporal entre ejecuciones')
+
+    def handle(self, *args, **options):
+        if options['repeticiones'] < 1 or options['usuarios'] < 1 or options['actividades'] < 1 or options['logs'] < 1:
+            raise CommandError('--usuarios, --actividades, --logs y --repeticiones deben ser mayores que 0')
+        anterior = self._cargar(options['comparar']) if options['comparar'] else None
+
+        rutas = rutas_proyecto()
+        sin_escenario = [ruta for ruta in rutas if ruta not in ESCENARIOS]
+        if options['rutas']:
+            pedidas = [ruta.strip() for ruta in options['rutas'].split(',') if ruta.strip()]
+            desconocidas = [ruta for ruta in pedidas if ruta not in ESCENARIOS]
+            if desconocidas:
+                raise CommandError(f'Rutas sin escenario: {", ".join(desconocidas)}')
+            rutas = pedidas
+        rutas = [ruta for ruta in rutas if ruta in ESCENARIOS]
+        modos = MODOS if options['modo'] == 'ambos' else (options['modo'],)
+
+        hashers = settings.PASSWORD_HASHERS if options['hasher_real'] else [
+            'django.contrib.auth.hashers.MD5PasswordHasher'
+        ]
+        # Sin la línea JSON por petición del middleware de monitoreo (los avisos de presupuesto sí
+        # se muestran) y sin sumar las peticiones del benchmark a /metrics
+        registro_monitoreo = logging.getLogger('applications.monitoreo')
+        nivel = registro_monitoreo.level
+        registro_monitoreo.setLevel(logging.WARNING)
+        with base_datos_temporal(mantener=options['mantener_bd']), override_settings(
+            PASSWORD_HASHERS=hashers, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+            MONITOREO_METRICAS_DIRECTORIO=None, MONITOREO_METRICAS_TOKEN=TOKEN_METRICAS,
+            # Las consultas las cuenta el middleware en el hilo y la conexión de la vista, también bajo ASGI
+            MIDDLEWARE=[MIDDLEWARE_MONITOREO, *[m for m in settings.MIDDLEWARE if m != MIDDLEWARE_MONITOREO]]
+        ), contextlib.ExitStack() as pila:
+            pila.callback(registro_monitoreo.setLevel, nivel)
+            # Avatares subidos en un directorio temporal; las miniaturas se generan fuera de la
+            # petición y no forman parte de lo que se mide
+            pila.enter_context(override_settings(
+                MEDIA_ROOT=pila.enter_context(tempfile.TemporaryDirectory()), USUARIOS_MINIATURAS_HILOS=None
+            ))
+            if not User.objects.filter(username='bench0').exists():
+                inicio = time.perf_counter()
+                filas = sembrar(options['usuarios'], options['actividades'], options['logs'], options['semilla'],
+                                informar=self._informar_siembra(options))
+                analizar_tablas()
+                self.stdout.write(
+                    f'Sembrados {filas[User]} usuarios, {filas[ProgresoUsuario]} progresos y '
+                    f'{sum(filas.values()) - filas[User] - filas[ProgresoUsuario]} filas más '
+                    f'en {time.perf_counter() - inicio:.1f} s'
+                )
+            # Un usuario del centro del conjunto, con actividades * logs filas propias
+            usuario = User.objects.get(username=f'bench{User.objects.filter(username__startswith="bench").count() // 2}')
+            ctx = {
+                'usuario': usuario,
+                'progreso_id': ProgresoUsuario.objects.filter(usuario=usuario, actividad='Actividad 0').values_list(
+                    'id', flat=True).get(),
+                'actividades': options['actividades'],
+                'secuencia': itertools.count(int(time.time())),
+                'avatar': _imagen_avatar(),
+            }
+
+            resultados = []
+            for modo in modos:
+                if modo == 'wsgi':
+                    resultados.extend(self._pasada_wsgi(ctx, rutas, options))
+                else:
+                    # async_to_sync mantiene el ORM de las vistas en este hilo y su conexión
+                    resultados.extend(async_to_sync(self._pasada_asgi)(ctx, rutas, options))
+
+        informe = {
+            'fecha': timezone.now().isoformat(),
+            'entorno': {
+                'python': platform.python_version(),
+                'django': get_version(),
+                'base_datos': connection.vendor,
+                'plataforma': platform.platform(),
+            },
+            'parametros': {clave: options[clave] for clave in (
+                'usuarios', 'actividades', 'logs', 'semilla', 'repeticiones', 'calentamiento', 'memoria', 'hasher_real'
+            )},
+            'resultados': resultados,
+            'sin_escenario': sin_escenario,
+        }
+        self._mostrar(informe, anterior)
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                json.dump(informe, archivo, indent=2, ensure_ascii=False)
+            self.stdout.write(self.style.SUCCESS(f'Resultados guardados en {options["salida"]}'))
+
+        if anterior is not None and options['tolerancia'] is not None:
+            regresiones = [
+                f'{actual["ruta"]} ({actual["modo"]}) +{cambio:.0f}%'
+                for actual, cambio in self._cambios_p95(informe, anterior)
+                if cambio > options['tolerancia']
+            ]
+            if regresiones:
+                raise CommandError(f'p95 por encima de la tolerancia: {", ".join(regresiones)}')
+
+    def _informar_siembra(self, options):
+        def informar(filas):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{filas[User]} usuarios y {filas[ProgresoUsuario]} progresos sembrados')
+        return informar
+
+    def _cargar(self, ruta):
+        try:
+            with open(ruta, encoding='utf-8') as archivo:
+                return json.load(archivo)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'No se pudo leer {ruta}: {e}')
+
+    def _resultado(self, ruta, modo, peticion, muestras, consultas, picos):
+        return {
+            'ruta': ruta,
+            'modo': modo,
+            'metodo': peticion['metodo'].upper(),
+            **resumen_tiempos(muestras),
+            'consultas': round(sum(consultas) / len(consultas), 2),
+            'consultas_max': max(consultas),
+            'memoria_pico_kb': round(max(picos) / 1024, 1) if picos else None,
+        }
+
+    def _comprobar(self, ruta, peticion, response):
+        if response.status_code != peticion['estado']:
+            raise CommandError(f'{ruta} {peticion["url"]} respondió {response.status_code}, '
+                               f'se esperaba {peticion["estado"]}')
+
+    # Pasada WSGI: django.test.Client atraviesa el manejador WSGI con todo el middleware
+
+    def _peticion_wsgi(self, clientes, ruta, peticion):
+        cliente = clientes[peticion['cliente']]
+        response = getattr(cliente, peticion['metodo'])(peticion['url'], **_argumentos(peticion))
+        # La latencia incluye todo el cuerpo; las consultas de un streaming solo hasta que empieza la respuesta
+        if response.streaming:
+            b''.join(response.streaming_content)
+        self._comprobar(ruta, peticion, response)
+        return response.wsgi_request.metricas_monitoreo['consultas']
+
+    def _pasada_wsgi(self, ctx, rutas, options):
+        clientes = {'usuario': Client(), 'anonimo': Client()}
+        clientes['usuario'].force_login(ctx['usuario'])
+        resultados = []
+        for ruta in rutas:
+            escenario = ESCENARIOS[ruta]
+            for i in range(options['calentamiento']):
+                self._peticion_wsgi(clientes, ruta, escenario(ctx, i))
+
+            muestras, consultas = [], []
+            for i in range(options['repeticiones']):
+                peticion = escenario(ctx, i)
+                inicio = time.perf_counter()
+                consultas.append(self._peticion_wsgi(clientes, ruta, peticion))
+                muestras.append(time.perf_counter() - inicio)
+
+            # tracemalloc ralentiza la ejecución: la memoria se mide en peticiones aparte
+            picos = []
+            tracemalloc.start()
+            try:
+                for i in range(options['memoria']):
+                    peticion = escenario(ctx, i)
+                    tracemalloc.reset_peak()
+                    base = tracemalloc.get_traced_memory()[0]
+                    self._peticion_wsgi(clientes, ruta, peticion)
+                    picos.append(tracemalloc.get_traced_memory()[1] - base)
+            finally:
+                tracemalloc.stop()
+            resultados.append(self._resultado(ruta, 'wsgi', peticion, muestras, consultas, picos))
+        return resultados
+
+    # Pasada ASGI: AsyncClient atraviesa ASGIHandler, como uvicorn con edumap.asgi:application
+
+    async def _peticion_asgi(self, clientes, ruta, peticion):
+        cliente = clientes[peticion['cliente']]
+        response = await getattr(cliente, peticion['metodo'])(peticion['url'], **_argumentos(peticion))
+        if response.streaming:
+            if response.is_async:
+                async for _ in response.streaming_content:
+                    pass
+            else:
+                await sync_to_async(b''.join)(response.streaming_content)
+        self._comprobar(ruta, peticion, response)
+        return response.asgi_request.metricas_monitoreo['consultas']
+
+    async def _pasada_asgi(self, ctx, rutas, options):
+        clientes = {'usuario': AsyncClient(), 'anonimo': AsyncClient()}
+        await clientes['usuario'].aforce_login(ctx['usuario'])
+        resultados = []
+        for ruta in rutas:
+            # Los escenarios pueden preparar datos con el ORM síncrono
+            escenario = sync_to_async(ESCENARIOS[ruta])
+            for i in range(options['calentamiento']):
+                await self._peticion_asgi(clientes, ruta, await escenario(ctx, i))
+
+            muestras, consultas = [], []
+            for i in range(options['repeticiones']):
+                peticion = await escenario(ctx, i)
+                inicio = time.perf_counter()
+                consultas.append(await self._peticion_asgi(clientes, ruta, peticion))
+                muestras.append(time.perf_counter() - inicio)
+
+            picos = []
+            tracemalloc.start()
+            try:
+                for i in range(options['memoria']):
+                    peticion = await escenario(ctx, i)
+                    tracemalloc.reset_peak()
+                    base = tracemalloc.get_traced_memory()[0]
+                    await self._peticion_asgi(clientes, ruta, peticion)
+                    picos.append(tracemalloc.get_traced_memory()[1] - base)
+            finally:
+                tracemalloc.stop()
+            resultados.append(self._resultado(ruta, 'asgi', peticion, muestras, consultas, picos))
+        return resultados
+
+    def _cambios_p95(self, informe, anterior):
+        """(resultado, % de cambio del p95) de las rutas presentes en las dos ejecuciones"""
+        previos = {(r['ruta'], r['modo']): r for r in anterior.get('resultados', [])}
+        for actual in informe['resultados']:
+            previo = previos.get((actual['ruta'], actual['modo']))
+            if previo and previo.get('p95_ms'):
+                yield actual, (actual['p95_ms'] - previo['p95_ms']) / previo['p95_ms'] * 100
+
+    def _mostrar(self, informe, anterior):
+        cambios = {}
+        if anterior is not None:
+            cambios = {(r['ruta'], r['modo']): cambio for r, cambio in self._cambios_p95(informe, anterior)}
+        self.stdout.write(
+            f'{"ruta":38} {"modo":5} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"consultas":>9} {"pico KB":>9}'
+            + (f' {"Δ p95":>8}' if anterior is not None else '')
+        )
+        for r in informe['resultados']:
+            linea = (
+                f'{r["ruta"]:38} {r["modo"]:5} {r["p50_ms"]:9.2f} {r["p95_ms"]:9.2f} {r["p99_ms"]:9.2f} '
+                f'{r["consultas"]:9.2f} {r["memoria_pico_kb"] if r["memoria_pico_kb"] is not None else "-":>9}'
+            )
+            cambio = cambios.get((r['ruta'], r['modo']))
+            if cambio is not None:
+                linea += f' {cambio:+7.1f}%'
+            self.stdout.write(linea)
+        if informe['sin_escenario']:
+            self.stdout.write(self.style.WARNING(f'Rutas sin escenario: {", ".join(informe["sin_escenario"])}'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from applications.monitoreo.metricas import directorio_metricas, limpiar_metricas
+
+
+class Command(BaseCommand):
+    help = 'Borra los archivos de métricas de los workers; ejecutar al arrancar el servidor, antes de los workers'
+
+    def handle(self, *args, **options):
+        directorio = directorio_metricas()
+        if not directorio:
+            self.stdout.write('MONITOREO_METRICAS_DIRECTORIO no está configurado')
+            return
+        limpiar_metricas(directorio)
+        self.stdout.write(self.style.SUCCESS(f'Métricas borradas de {directorio}'))
@@ -0,0 +1,242 @@
+"""
+Contadores e histogramas de latencia por vista y código de estado,
+compartidos entre los procesos de la aplicación.
+
+Cada hilo de cada proceso escribe en su propio archivo mapeado en memoria
+(``<pid>-<hilo>.metricas``) dentro de MONITOREO_METRICAS_DIRECTORIO. Al
+tener un único escritor, registrar una petición no necesita bloqueos: son
+tres sumas sobre una vista de doubles del mmap (unos 400 ns). La vista /metrics lee todos los
+archivos del directorio, suma sus valores y los expone en el formato de
+texto de Prometheus.
+
+Formato del archivo (doubles nativos de 8 bytes): cabecera [versión, bytes
+usados, número de límites, límites...] seguida de una entrada por
+(vista, estado): [longitud de la clave, clave UTF-8 rellenada a 8 bytes,
+suma de segundos, consultas, un contador por cubo del histograma y uno más
+para +Inf]. El número de peticiones es la suma de los cubos. Los bytes usados se actualizan después de
+escribir la entrada, así que un lector nunca ve una entrada a medias.
+
+Los archivos de procesos terminados se conservan para que los contadores no
+retrocedan. limpiar_metricas() vacía el directorio y debe llamarse al
+arrancar el servidor, antes de crear los workers (p. ej. en el hook
+``on_starting`` de gunicorn).
+"""
+import array
+import bisect
+import mmap
+import os
+import threading
+from pathlib import Path
+
+from django.conf import settings
+
+VERSION = 1
+EXTENSION = '.metricas'
+TAMANO_INICIAL = 64 * 1024
+
+LIMITES_POR_DEFECTO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Posición de cada valor dentro de una entrada; detrás van los cubos del histograma
+SEGUNDOS, CONSULTAS, CUBOS = range(3)
+
+
+def _palabras(longitud):
+    return (longitud + 7) // 8
+
+
+def _entradas(valores, datos):
+    """Recorre las entradas de un archivo: ((vista, estado), índice del primer valor)"""
+    limites = int(valores[2])
+    posicion = 3 + limites
+    usados = int(valores[1]) // 8
+    while posicion < usados:
+        longitud = int(valores[posicion])
+        clave = bytes(datos[(posicion + 1) * 8:(posicion + 1) * 8 + longitud]).decode()
+        vista, estado = clave.rsplit('\n', 1)
+        indice = posicion + 1 + _palabras(longitud)
+        yield (vista, int(estado)), indice
+        posicion = indice + CUBOS + limites + 1
+
+
+class RegistroMetricas:
+    """Archivo de métricas de un hilo; solo ese hilo debe llamar a registrar"""
+
+    def __init__(self, ruta, limites=LIMITES_POR_DEFECTO):
+        self.ruta = Path(ruta)
+        self.limites = tuple(float(limite) for limite in limites)
+        self._indices = {}
+        self._archivo = open(self.ruta, 'a+b')
+        tamano = os.fstat(self._archivo.fileno()).st_size
+        if tamano == 0:
+            self._mapear(TAMANO_INICIAL)
+            cabecera = array.array('d', [VERSION, 0, len(self.limites), *self.limites])
+            cabecera[1] = len(cabecera) * 8
+            self._valores[:len(cabecera)] = memoryview(cabecera)
+        else:
+            # Identificador reutilizado: se sigue sumando sobre las entradas del proceso anterior
+            self._mapear(tamano)
+            guardados = tuple(self._valores[3:3 + int(self._valores[2])])
+            if self._valores[0] != VERSION or guardados != self.limites:
+                raise ValueError(f'{self.ruta} tiene otro formato o límites de histograma')
+            self._indices.update(_entradas(self._valores, self._bytes))
+
+    def _mapear(self, tamano):
+        if os.fstat(self._archivo.fileno()).st_size < tamano:
+            self._archivo.truncate(tamano)
+        self._mmap = mmap.mmap(self._archivo.fileno(), tamano)
+        self._bytes = memoryview(self._mmap)
+        self._valores = self._bytes.cast('d')
+
+    def _liberar(self):
+        # El mmap no se puede cerrar ni redimensionar con vistas exportadas
+        self._valores.release()
+        self._bytes.release()
+        self._mmap.close()
+
+    def _crear(self, vista, estado):
+        clave = f'{vista}\n{estado}'.encode()
+        usados = int(self._valores[1])
+        palabras = _palabras(len(clave))
+        fin = usados + 8 * (1 + palabras + CUBOS + len(self.limites) + 1)
+        if fin > len(self._mmap):
+            tamano = len(self._mmap)
+            while tamano < fin:
+                tamano *= 2
+            self._liberar()
+            self._mapear(tamano)
+
+        self._valores[usados // 8] = len(clave)
+        self._bytes[usados + 8:usados + 8 + len(clave)] = clave
+        self._valores[1] = fin
+        indice = usados // 8 + 1 + palabras
+        self._indices[vista, estado] = indice
+        return indice
+
+    def registrar(self, vista, estado, segundos, consultas=0):
+        """Suma una petición de `vista` con código `estado` que tardó `segundos`"""
+        indice = self._indices.get((vista, estado))
+        if indice is None:
+            indice = self._crear(vista, estado)
+        valores = self._valores
+        valores[indice] += segundos
+        valores[indice + CONSULTAS] += consultas
+        valores[indice + CUBOS + bisect.bisect_left(self.limites, segundos)] += 1
+
+    def cerrar(self):
+        self._liberar()
+        self._archivo.close()
+
+
+def leer_metricas(directorio, limites=LIMITES_POR_DEFECTO):
+    """
+    Suma los archivos del directorio. Devuelve {(vista, estado): [segundos,
+    consultas, cubos...]}; se ignoran los archivos con otros límites.
+    """
+    limites = tuple(float(limite) for limite in limites)
+    totales = {}
+    for ruta in sorted(Path(directorio).glob(f'*{EXTENSION}')):
+        try:
+            datos = memoryview(ruta.read_bytes())
+        except FileNotFoundError:
+            continue
+        if len(datos) < 24:
+            continue
+        valores = datos.cast('d')
+        if valores[0] != VERSION or tuple(valores[3:3 + int(valores[2])]) != limites:
+            continue
+        for clave, indice in _entradas(valores, datos):
+            entrada = valores[indice:indice + CUBOS + len(limites) + 1].tolist()
+            acumulado = totales.get(clave)
+            if acumulado is None:
+                totales[clave] = entrada
+            else:
+                for i, valor in enumerate(entrada):
+                    acumulado[i] += valor
+    return totales
+
+
+def _etiqueta(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _numero(valor):
+    return repr(int(valor)) if float(valor).is_integer() else repr(float(valor))
+
+
+def formato_prometheus(totales, limites=LIMITES_POR_DEFECTO):
+    """Texto de exposición de Prometheus (versión 0.0.4) de las métricas sumadas"""
+    lineas = [
+        '# HELP edumap_peticiones_total Peticiones atendidas por vista y código de estado.',
+        '# TYPE edumap_peticiones_total counter',
+    ]
+    claves = sorted(totales)
+    etiquetas = {clave: f'vista="{_etiqueta(clave[0])}",estado="{clave[1]}"' for clave in claves}
+    lineas.extend(f'edumap_peticiones_total{{{etiquetas[c]}}} {_numero(sum(totales[c][CUBOS:]))}' for c in claves)
+
+    lineas += [
+        '# HELP edumap_consultas_sql_total Consultas SQL ejecutadas por vista y código de estado.',
+        '# TYPE edumap_consultas_sql_total counter',
+    ]
+    lineas.extend(f'edumap_consultas_sql_total{{{etiquetas[c]}}} {_numero(totales[c][CONSULTAS])}' for c in claves)
+
+    lineas += [
+        '# HELP edumap_peticion_duracion_segundos Duración de las peticiones por vista y código de estado.',
+        '# TYPE edumap_peticion_duracion_segundos histogram',
+    ]
+    for clave in claves:
+        valores = totales[clave]
+        acumulado = 0
+        for limite, cubo in zip([*limites, '+Inf'], valores[CUBOS:]):
+            acumulado += cubo
+            le = limite if limite == '+Inf' else _numero(limite)
+            lineas.append(f'edumap_peticion_duracion_segundos_bucket{{{etiquetas[clave]},le="{le}"}} {_numero(acumulado)}')
+        lineas.append(f'edumap_peticion_duracion_segundos_sum{{{etiquetas[clave]}}} {_numero(valores[SEGUNDOS])}')
+        lineas.append(f'edumap_peticion_duracion_segundos_count{{{etiquetas[clave]}}} {_numero(acumulado)}')
+    return '\n'.join(lineas) + '\n'
+
+
+def directorio_metricas():
+    return getattr(settings, 'MONITOREO_METRICAS_DIRECTORIO', None)
+
+
+def limites_histograma():
+    return tuple(getattr(settings, 'MONITOREO_HISTOGRAMA_LIMITES', LIMITES_POR_DEFECTO))
+
+
+_locales = threading.local()
+
+
+def obtener_registro():
+    """Registro del hilo actual, o None si MONITOREO_METRICAS_DIRECTORIO no está configurado"""
+    directorio = directorio_metricas()
+    if getattr(_locales, 'directorio', None) == directorio:
+        return getattr(_locales, 'registro', None)
+    # Primera petición del hilo, o el directorio cambió (solo en los tests, con override_settings)
+    registro = getattr(_locales, 'registro', None)
+    if registro is not None:
+        registro.cerrar()
+    _locales.registro = None
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+        nombre = f'{os.getpid()}-{threading.get_ident()}{EXTENSION}'
+        _locales.registro = RegistroMetricas(Path(directorio) / nombre, limites_histograma())
+    _locales.directorio = directorio
+    return _locales.registro
+
+
+def limpiar_metricas(directorio=None):
+    """Borra los archivos de métricas del directorio (por defecto el configurado)"""
+    directorio = directorio or directorio_metricas()
+    if directorio and os.path.isdir(directorio):
+        for ruta in Path(directorio).glob(f'*{EXTENSION}'):
+            ruta.unlink(missing_ok=True)
+
+
+def _reiniciar_tras_fork():
+    # El hijo escribe en sus propios archivos; los mmap heredados siguen siendo del padre
+    global _locales
+    _locales = threading.local()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reiniciar_tras_fork)
@@ -0,0 +1,158 @@
+"""
+Instrumentación por petición: consultas SQL, tiempo de base de datos,
+tiempo de serialización y tiempo total, agrupados por nombre de vista
+resuelto (``progreso_usuario:lista``, ``inicio_sesion:dashboard``...).
+
+MonitoreoMiddleware envuelve las conexiones con ``connection.execute_wrapper``
+mientras se atiende la petición. Las métricas se devuelven en la cabecera
+``Server-Timing`` (MONITOREO_SERVER_TIMING) y se escriben como una línea JSON
+en el logger ``applications.monitoreo``. MONITOREO_PRESUPUESTOS fija un
+máximo de consultas por vista; si se supera se registra un aviso. Además se
+suman a los contadores e histogramas de metricas.py, que /metrics expone
+agregados entre procesos.
+
+El tiempo de serialización lo aportan las vistas con ``medir('serializacion')``.
+
+Bajo ASGI el middleware funciona en modo asíncrono y los wrappers se instalan
+con sync_to_async en el hilo donde Django ejecuta el código síncrono de la
+petición (un hilo por petición, ThreadSensitiveContext).
+"""
+import contextlib
+import contextvars
+import json
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from .metricas import obtener_registro
+
+logger = logging.getLogger('applications.monitoreo')
+
+_medicion_actual = contextvars.ContextVar('medicion_actual', default=None)
+
+
+class Medicion:
+    """Métricas de una petición en curso"""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.tiempo_bd = 0.0
+        self.tramos = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        # Firma de connection.execute_wrapper
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.tiempo_bd += time.perf_counter() - inicio
+            self.consultas += 1
+
+
+@contextlib.contextmanager
+def medir(tramo):
+    """Suma al tramo indicado de la petición en curso el tiempo del bloque"""
+    medicion = _medicion_actual.get()
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        if medicion is not None:
+            medicion.tramos[tramo] = medicion.tramos.get(tramo, 0.0) + time.perf_counter() - inicio
+
+
+def _nombre_vista(request):
+    coincidencia = getattr(request, 'resolver_match', None)
+    if coincidencia is None:
+        return '<sin resolver>'
+    return coincidencia.view_name
+
+
+def _server_timing(metricas):
+    partes = [f'db;dur={metricas["bd_ms"]};desc="{metricas["consultas"]} consultas"']
+    partes.extend(f'{tramo[:3]};dur={valor};desc="{tramo}"' for tramo, valor in metricas['tramos_ms'].items())
+    partes.append(f'total;dur={metricas["total_ms"]}')
+    return ', '.join(partes)
+
+
+def _envolver_conexiones(medicion):
+    # Las conexiones son por hilo: hay que llamarla en el hilo que ejecuta las consultas
+    pila = contextlib.ExitStack()
+    for conexion in connections.all():
+        pila.enter_context(conexion.execute_wrapper(medicion))
+    return pila
+
+
+class MonitoreoMiddleware:
+    """
+    Mide cada petición y publica sus métricas; va al principio de MIDDLEWARE.
+    Admite las dos cadenas de Django: bajo ASGI no obliga a adaptar las vistas
+    asíncronas a un hilo
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        medicion = Medicion()
+        token = _medicion_actual.set(medicion)
+        try:
+            with _envolver_conexiones(medicion):
+                response = self.get_response(request)
+        finally:
+            _medicion_actual.reset(token)
+        return self._publicar(request, response, medicion)
+
+    async def __acall__(self, request):
+        medicion = Medicion()
+        token = _medicion_actual.set(medicion)
+        try:
+            # Bajo ASGI, el ORM de la petición se ejecuta en el hilo de sync_to_async, y ahí se envuelve
+            pila = await sync_to_async(_envolver_conexiones)(medicion)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(pila.close)()
+        finally:
+            _medicion_actual.reset(token)
+        return self._publicar(request, response, medicion)
+
+    def _publicar(self, request, response, medicion):
+        duracion = time.perf_counter() - medicion.inicio
+        vista = _nombre_vista(request)
+
+        registro = obtener_registro()
+        if registro is not None:
+            registro.registrar(vista, response.status_code, duracion, medicion.consultas)
+
+        metricas = {
+            'vista': vista,
+            'metodo': request.method,
+            'estado': response.status_code,
+            'consultas': medicion.consultas,
+            'bd_ms': round(medicion.tiempo_bd * 1000, 2),
+            'tramos_ms': {tramo: round(valor * 1000, 2) for tramo, valor in medicion.tramos.items()},
+            'total_ms': round(duracion * 1000, 2),
+        }
+        request.metricas_monitoreo = metricas
+        if getattr(settings, 'MONITOREO_SERVER_TIMING', True):
+            response['Server-Timing'] = _server_timing(metricas)
+        logger.info(json.dumps(metricas), extra={'monitoreo': metricas})
+
+        presupuesto = getattr(settings, 'MONITOREO_PRESUPUESTOS', {}).get(metricas['vista'])
+        if presupuesto is not None and metricas['consultas'] > presupuesto:
+            logger.warning(
+                'La vista %s hizo %s consultas (presupuesto %s)', metricas['vista'], metricas['consultas'], presupuesto,
+                extra={'monitoreo': metricas}
+            )
+        return response
@@ -0,0 +1,268 @@
+import json
+import multiprocessing
+import os
+import tempfile
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from applications.monitoreo import metricas
+from applications.monitoreo.middleware import MonitoreoMiddleware
+from applications.monitoreo.management.commands.benchmark_endpoints import ESCENARIOS, rutas_proyecto
+from applications.progreso_usuario.models import ProgresoUsuario
+from edumap.settings import base
+
+MIDDLEWARE_MONITOREO = 'applications.monitoreo.middleware.MonitoreoMiddleware'
+
+
+@override_settings(MIDDLEWARE=[MIDDLEWARE_MONITOREO, *[m for m in settings.MIDDLEWARE if m != MIDDLEWARE_MONITOREO]])
+class MonitoreoMiddlewareTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        ProgresoUsuario.objects.create(usuario=self.user, actividad='Aprender Django', progreso=50)
+        self.client.login(username='testuser', password='testpass123')
+
+    def _metricas(self, registros):
+        return [json.loads(registro.getMessage()) for registro in registros.records if registro.levelname == 'INFO']
+
+    def test_metricas_por_vista(self):
+        """Test que se cuentan las consultas de la vista y se publican en log y Server-Timing"""
+        with self.assertLogs('applications.monitoreo', 'INFO') as registros:
+            with CaptureQueriesContext(connection) as consultas:
+                response = self.client.get(reverse('progreso_usuario:lista'))
+
+        medidas, = self._metricas(registros)
+        self.assertEqual(medidas['vista'], 'progreso_usuario:lista')
+        self.assertEqual(medidas['estado'], 200)
+        self.assertEqual(medidas['consultas'], len(consultas))
+        self.assertIn('serializacion', medidas['tramos_ms'])
+        self.assertGreaterEqual(medidas['total_ms'], medidas['bd_ms'])
+
+        cabecera = response['Server-Timing']
+        self.assertIn(f'desc="{len(consultas)} consultas"', cabecera)
+        self.assertIn('ser;dur=', cabecera)
+        self.assertIn('total;dur=', cabecera)
+
+    def test_vistas_de_usuarios_y_sin_resolver(self):
+        """Test del nombre de vista en las rutas de Usuarios y en las que no se resuelven"""
+        with self.assertLogs('applications.monitoreo', 'INFO') as registros:
+            self.client.get(reverse('inicio_sesion:dashboard'))
+            self.client.get('/no-existe/')
+        vistas = [medidas['vista'] for medidas in self._metricas(registros)]
+        self.assertEqual(vistas, ['inicio_sesion:dashboard', '<sin resolver>'])
+
+    @override_settings(MONITOREO_PRESUPUESTOS={'progreso_usuario:lista': 1}, MONITOREO_SERVER_TIMING=False)
+    def test_presupuesto_superado(self):
+        """Test que superar el presupuesto de consultas de una vista registra un aviso"""
+        with self.assertLogs('applications.monitoreo', 'WARNING') as registros:
+            response = self.client.get(reverse('progreso_usuario:lista'))
+        self.assertIn('progreso_usuario:lista', registros.output[0])
+        self.assertNotIn('Server-Timing', response)
+
+    def _peticion_presupuesto(self, vista, progreso, i):
+        """Petición a una vista de MONITOREO_PRESUPUESTOS; las de escritura cambian los datos en cada i"""
+        if vista in ('progreso_usuario:detalle', 'progreso_usuario:editar', 'progreso_usuario:actualizar'):
+            url = reverse(vista, args=[progreso.id])
+        elif vista == 'progreso_usuario:eliminar':
+            otro = ProgresoUsuario.objects.create(usuario=self.user, actividad=f'Eliminar {i}', progreso=10)
+            url = reverse(vista, args=[otro.id])
+        else:
+            url = reverse(vista)
+        datos = {
+            'progreso_usuario:crear': {'actividad': f'Crear {i}', 'progreso': 20},
+            'progreso_usuario:editar': {'progreso': 30 + i},
+            'progreso_usuario:actualizar': {'progreso': 40 + i},
+            'progreso_usuario:lote': {'progresos': [
+                {'actividad': 'Aprender Django', 'progreso': 60 + i}, {'actividad': 'Aprender SQL', 'progreso': 10 + i}
+            ]},
+        }
+        if vista in datos:
+            return self.client.post(url, json.dumps(datos[vista]), content_type='application/json')
+        if vista == 'progreso_usuario:eliminar':
+            return self.client.post(url)
+        if vista == 'progreso_usuario:clasificacion':
+            return self.client.get(url, {'actividad': 'Aprender Django'})
+        return self.client.get(url)
+
+    def test_presupuestos_configurados(self):
+        """Test que las vistas principales, de lectura y de escritura, caben en los presupuestos de settings/base.py"""
+        presupuestos = base.MONITOREO_PRESUPUESTOS
+        progreso = ProgresoUsuario.objects.get(usuario=self.user)
+        # TestCase convierte la transacción de las escrituras en SAVEPOINT/RELEASE; el SAVEPOINT
+        # ocupa el lugar del BEGIN y el RELEASE no existe fuera de los tests
+        savepoints = []
+        with self.assertLogs('applications.monitoreo', 'INFO') as registros:
+            # Dos veces cada una: el presupuesto es para la caché ya caliente
+            for i, vista in enumerate([*presupuestos, *presupuestos]):
+                with CaptureQueriesContext(connection) as consultas:
+                    self.assertLess(self._peticion_presupuesto(vista, progreso, i).status_code, 300, vista)
+                savepoints.append(len([q for q in consultas if q['sql'].startswith('RELEASE SAVEPOINT')]))
+        for medidas, control in list(zip(self._metricas(registros), savepoints))[len(presupuestos):]:
+            self.assertLessEqual(medidas['consultas'] - control, presupuestos[medidas['vista']], medidas)
+
+    async def test_vista_asincrona_sin_adaptar(self):
+        """Test que bajo ASGI el middleware se queda en la cadena asíncrona y mide las consultas del ORM asíncrono"""
+        async def vista(request):
+            pass
+        self.assertTrue(iscoroutinefunction(MonitoreoMiddleware(vista)))
+
+        await self.async_client.aforce_login(self.user)
+        with self.assertLogs('applications.monitoreo', 'INFO') as registros:
+            response = await self.async_client.get(reverse('progreso_usuario:lista_async'))
+
+        medidas, = self._metricas(registros)
+        self.assertEqual(medidas['vista'], 'progreso_usuario:lista_async')
+        self.assertGreater(medidas['consultas'], 0)
+        self.assertIn(f'desc="{medidas["consultas"]} consultas"', response['Server-Timing'])
+
+
+def _registrar_en_proceso(peticiones):
+    # Se ejecuta en un proceso hijo creado con fork
+    registro = metricas.obtener_registro()
+    for segundos in peticiones:
+        registro.registrar('progreso_usuario:lista', 200, segundos, 2)
+
+
+class MetricasTest(TestCase):
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory()
+        self.limites = (0.01, 0.1, 1.0)
+
+    def tearDown(self):
+        # Cierra el registro del hilo antes de borrar el directorio
+        with override_settings(MONITOREO_METRICAS_DIRECTORIO=None):
+            metricas.obtener_registro()
+        self.directorio.cleanup()
+
+    def _ruta(self, nombre):
+        return os.path.join(self.directorio.name, nombre + metricas.EXTENSION)
+
+    def test_agregacion_entre_archivos(self):
+        """Test que se suman los archivos de varios workers y se continúa un archivo existente"""
+        primero = metricas.RegistroMetricas(self._ruta('1'), self.limites)
+        primero.registrar('progreso_usuario:lista', 200, 0.005, 3)
+        primero.registrar('progreso_usuario:lista', 200, 0.05, 3)
+        primero.registrar('progreso_usuario:crear', 400, 2.0)
+        primero.cerrar()
+        segundo = metricas.RegistroMetricas(self._ruta('2'), self.limites)
+        segundo.registrar('progreso_usuario:lista', 200, 0.01, 1)
+        # Un identificador reutilizado sigue sumando sobre sus entradas
+        reabierto = metricas.RegistroMetricas(self._ruta('1'), self.limites)
+        reabierto.registrar('progreso_usuario:lista', 200, 0.5, 0)
+
+        totales = metricas.leer_metricas(self.directorio.name, self.limites)
+        segundos, consultas, *cubos = totales['progreso_usuario:lista', 200]
+        self.assertAlmostEqual(segundos, 0.565)
+        self.assertEqual(consultas, 7)
+        # El límite es inclusivo: 0.01 cae en el cubo le="0.01"
+        self.assertEqual(cubos, [2, 1, 1, 0])
+        self.assertEqual(totales['progreso_usuario:crear', 400][2:], [0, 0, 0, 1])
+
+        # Otros límites de histograma no se mezclan
+        self.assertEqual(metricas.leer_metricas(self.directorio.name, (1.0,)), {})
+        with self.assertRaises(ValueError):
+            metricas.RegistroMetricas(self._ruta('1'), (1.0,))
+        segundo.cerrar()
+        reabierto.cerrar()
+
+    def test_crecimiento_del_archivo(self):
+        """Test que el archivo crece cuando no caben más entradas sin perder las anteriores"""
+        registro = metricas.RegistroMetricas(self._ruta('1'), self.limites)
+        vistas = [f'vista_{i}:' + 'x' * 50 for i in range(1000)]
+        for vista in vistas:
+            registro.registrar(vista, 200, 0.2)
+        registro.registrar(vistas[0], 200, 0.2)
+        self.assertGreater(os.path.getsize(self._ruta('1')), metricas.TAMANO_INICIAL)
+
+        totales = metricas.leer_metricas(self.directorio.name, self.limites)
+        self.assertEqual(len(totales), 1000)
+        self.assertEqual(sum(totales[vistas[0], 200][2:]), 2)
+        registro.cerrar()
+
+    def test_procesos_hijos(self):
+        """Test que los procesos creados con fork escriben su propio archivo y se agregan"""
+        contexto = multiprocessing.get_context('fork')
+        with override_settings(MONITOREO_METRICAS_DIRECTORIO=self.directorio.name,
+                               MONITOREO_HISTOGRAMA_LIMITES=self.limites):
+            metricas.obtener_registro().registrar('progreso_usuario:lista', 200, 0.001, 2)
+            procesos = [contexto.Process(target=_registrar_en_proceso, args=([0.05] * 10,)) for _ in range(3)]
+            for proceso in procesos:
+                proceso.start()
+            for proceso in procesos:
+                proceso.join()
+                self.assertEqual(proceso.exitcode, 0)
+
+        self.assertEqual(len(os.listdir(self.directorio.name)), 4)
+        totales = metricas.leer_metricas(self.directorio.name, self.limites)
+        self.assertEqual(totales['progreso_usuario:lista', 200][2:], [1, 30, 0, 0])
+
+    def test_formato_prometheus(self):
+        """Test del texto de exposición: contadores, cubos acumulados, suma y cuenta"""
+        texto = metricas.formato_prometheus({
+            ('progreso_usuario:lista', 200): [0.565, 7, 2, 1, 1, 0],
+        }, self.limites)
+        etiquetas = 'vista="progreso_usuario:lista",estado="200"'
+        self.assertIn('# TYPE edumap_peticiones_total counter', texto)
+        self.assertIn(f'edumap_peticiones_total{{{etiquetas}}} 4\n', texto)
+        self.assertIn(f'edumap_consultas_sql_total{{{etiquetas}}} 7\n', texto)
+        self.assertIn('# TYPE edumap_peticion_duracion_segundos histogram', texto)
+        self.assertIn(f'edumap_peticion_duracion_segundos_bucket{{{etiquetas},le="0.01"}} 2\n', texto)
+        self.assertIn(f'edumap_peticion_duracion_segundos_bucket{{{etiquetas},le="1"}} 4\n', texto)
+        self.assertIn(f'edumap_peticion_duracion_segundos_bucket{{{etiquetas},le="+Inf"}} 4\n', texto)
+        self.assertIn(f'edumap_peticion_duracion_segundos_sum{{{etiquetas}}} 0.565\n', texto)
+        self.assertIn(f'edumap_peticion_duracion_segundos_count{{{etiquetas}}} 4\n', texto)
+
+    def test_endpoint_metricas(self):
+        """Test que /metrics expone las peticiones medidas por el middleware y las de otros workers"""
+        otro_worker = metricas.RegistroMetricas(self._ruta('otro'), metricas.LIMITES_POR_DEFECTO)
+        otro_worker.registrar('progreso_usuario:lista', 200, 0.02, 4)
+        otro_worker.cerrar()
+
+        User.objects.create_user(username='testuser', email='test@example.com', password='testpass123')
+        cliente = Client()
+        middleware = [MIDDLEWARE_MONITOREO, *[m for m in settings.MIDDLEWARE if m != MIDDLEWARE_MONITOREO]]
+        with override_settings(MIDDLEWARE=middleware, MONITOREO_METRICAS_TOKEN='secreto',
+                               MONITOREO_METRICAS_DIRECTORIO=self.directorio.name):
+            cliente.login(username='testuser', password='testpass123')
+            with self.assertLogs('applications.monitoreo', 'INFO'):
+                cliente.get(reverse('progreso_usuario:lista'))
+                cliente.get('/no-existe/')
+                response = cliente.get(reverse('metricas'), HTTP_AUTHORIZATION='Bearer secreto')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        texto = response.content.decode()
+        self.assertIn('edumap_peticiones_total{vista="progreso_usuario:lista",estado="200"} 2\n', texto)
+        self.assertIn('edumap_peticiones_total{vista="<sin resolver>",estado="404"} 1\n', texto)
+        self.assertIn('edumap_peticion_duracion_segundos_count{vista="progreso_usuario:lista",estado="200"} 2\n',
+                      texto)
+
+    @override_settings(MONITOREO_METRICAS_TOKEN='secreto')
+    def test_endpoint_metricas_restringido(self):
+        """Test que /metrics solo responde al token, a las IPs permitidas o al personal, y no a localhost por defecto"""
+        User.objects.create_user(username='testuser', password='testpass123')
+        User.objects.create_user(username='staff', password='testpass123', is_staff=True)
+        cliente = Client()
+        cliente.login(username='testuser', password='testpass123')
+        # El cliente de pruebas llega desde 127.0.0.1, como las peticiones detrás de un proxy local
+        self.assertEqual(cliente.get(reverse('metricas')).status_code, 403)
+        self.assertEqual(cliente.get(reverse('metricas'), HTTP_AUTHORIZATION='Bearer otro').status_code, 403)
+        self.assertEqual(cliente.get(reverse('metricas'), HTTP_AUTHORIZATION='Bearer secreto').status_code, 200)
+        with override_settings(MONITOREO_METRICAS_IPS=['127.0.0.1']):
+            self.assertEqual(cliente.get(reverse('metricas')).status_code, 200)
+        cliente.login(username='staff', password='testpass123')
+        self.assertEqual(cliente.get(reverse('metricas')).status_code, 200)
+
+
+class BenchmarkEndpointsTest(TestCase):
+    def test_escenarios_cubren_todas_las_rutas(self):
+        """Test que benchmark_endpoints tiene una petición para cada ruta del proyecto salvo el admin"""
+        self.assertEqual(sorted(rutas_proyecto()), sorted(ESCENARIOS))
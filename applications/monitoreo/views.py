@@ -0,0 +1,43 @@
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.http import require_GET
+
+from . import metricas as metricas_proceso
+
+
+def _token_valido(request):
+    """Compara el token Bearer de Authorization con MONITOREO_METRICAS_TOKEN, si está configurado"""
+    esperado = getattr(settings, 'MONITOREO_METRICAS_TOKEN', None)
+    tipo, _, token = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    if not esperado or tipo.lower() != 'bearer' or not token:
+        return False
+    return hmac.compare_digest(token.encode(), esperado.encode())
+
+
+@require_GET
+def metricas(request):
+    """Contadores e histogramas de todos los procesos en formato de texto de Prometheus"""
+    try:
+        # Detrás de un proxy en la misma máquina REMOTE_ADDR es la del proxy: ahí solo sirve el token
+        permitidas = getattr(settings, 'MONITOREO_METRICAS_IPS', [])
+        if not (request.user.is_staff or _token_valido(request) or request.META.get('REMOTE_ADDR') in permitidas):
+            return JsonResponse({
+                'success': False,
+                'message': 'No tienes permiso para consultar las métricas'
+            }, status=403)
+
+        directorio = metricas_proceso.directorio_metricas()
+        limites = metricas_proceso.limites_histograma()
+        totales = metricas_proceso.leer_metricas(directorio, limites) if directorio else {}
+        return HttpResponse(
+            metricas_proceso.formato_prometheus(totales, limites),
+            content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
+
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'message': f'Error al obtener las métricas: {str(e)}'
+        }, status=500)
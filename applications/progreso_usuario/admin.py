@@ -1,12 +1,14 @@
 from django.contrib import admin
 from .models import ProgresoUsuario, LogProgreso
+from .busqueda import filtrar_actividad
 
 
 @admin.register(ProgresoUsuario)
 class ProgresoUsuarioAdmin(admin.ModelAdmin):
     list_display = ['usuario', 'actividad', 'progreso', 'completado', 'fecha_actualizacion']
     list_filter = ['completado', 'actividad', 'fecha_inicio', 'fecha_actualizacion']
-    search_fields = ['usuario__username', 'usuario__email', 'actividad']
+    # La actividad se busca con el índice de búsqueda en get_search_results
+    search_fields = ['=usuario__username', '=usuario__email']
     readonly_fields = ['fecha_inicio', 'fecha_actualizacion']
     list_editable = ['progreso', 'completado']
     ordering = ['-fecha_actualizacion']
@@ -25,6 +27,12 @@ class ProgresoUsuarioAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_search_results(self, request, queryset, search_term):
+        queryset_filtrado, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term:
+            queryset_filtrado |= filtrar_actividad(queryset, search_term)
+        return queryset_filtrado, may_have_duplicates
+
 @admin.register(LogProgreso)
 class LogProgresoAdmin(admin.ModelAdmin):
     list_display = ['progreso_usuario', 'progreso_anterior', 'progreso_nuevo', 'fecha_cambio']
@@ -0,0 +1,163 @@
+"""
+Series temporales de progreso construidas a partir de LogProgreso.
+
+Los logs se agrupan por día o semana con Trunc en la base de datos, que
+también calcula los agregados de cada periodo y, con una función de
+ventana, el avance acumulado. La respuesta es compacta: un array de
+marcas de tiempo y un array por métrica.
+
+Los periodos terminados no cambian, así que su tramo de la serie se guarda
+en la caché PROGRESO_CACHE_ALIAS; solo el periodo en curso se consulta en
+cada petición. Un periodo se considera terminado cuando han pasado
+MARGEN_CIERRE desde su fin, para dar tiempo a los logs diferidos.
+
+La excepción es compactar_logs, que reescribe logs de periodos cerrados.
+Las claves llevan una versión global e invalidar() la sube después de cada
+lote compactado, igual que las versiones por usuario de Usuarios/cache.py.
+"""
+import hashlib
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Avg, Count, DecimalField, F, Func, Max, Sum, Window
+from django.db.models.functions import TruncDay, TruncWeek
+from django.utils import timezone
+
+from .models import LogProgreso
+
+PERIODOS = {
+    'dia': (TruncDay, timedelta(days=1)),
+    'semana': (TruncWeek, timedelta(weeks=1)),
+}
+
+METRICAS = ('cambios', 'progresos', 'progreso_medio', 'progreso_maximo', 'avance', 'avance_acumulado')
+
+# Periodos devueltos si no se indica desde, y máximo permitido por petición
+PERIODOS_POR_DEFECTO = 30
+MAX_PERIODOS = 400
+
+MARGEN_CIERRE = timedelta(minutes=5)
+
+
+class _SumaSobreAgregado(Func):
+    # Sum() no admite un agregado como argumento; SUM(SUM(...)) OVER (...) es SQL válido
+    function = 'SUM'
+    window_compatible = True
+
+
+def inicio_periodo(fecha, periodo):
+    """Medianoche local del día, o del lunes de la semana, que contiene a fecha"""
+    local = timezone.localtime(fecha).replace(hour=0, minute=0, second=0, microsecond=0)
+    if periodo == 'semana':
+        local -= timedelta(days=local.weekday())
+    return local
+
+
+def _avance():
+    return F('progreso_nuevo') - F('progreso_anterior')
+
+
+def _consultar(logs, periodo, desde, hasta):
+    trunc, _ = PERIODOS[periodo]
+    filas = (
+        logs.filter(fecha_cambio__gte=desde, fecha_cambio__lt=hasta)
+        .annotate(periodo=trunc('fecha_cambio'))
+        .values('periodo')
+        .annotate(
+            cambios=Count('id'),
+            progresos=Count('progreso_usuario', distinct=True),
+            progreso_medio=Avg('progreso_nuevo'),
+            progreso_maximo=Max('progreso_nuevo'),
+            avance=Sum(_avance()),
+        )
+        # En un annotate() aparte: junto a los agregados, Django añadiría la ventana al GROUP BY
+        .annotate(
+            avance_acumulado=Window(
+                _SumaSobreAgregado(Sum(_avance()), output_field=DecimalField()),
+                order_by=F('periodo').asc()
+            ),
+        )
+        .order_by('periodo')
+    )
+    serie = {'timestamps': []}
+    serie.update((metrica, []) for metrica in METRICAS)
+    for fila in filas:
+        serie['timestamps'].append(timezone.localtime(fila['periodo']).isoformat())
+        serie['cambios'].append(fila['cambios'])
+        serie['progresos'].append(fila['progresos'])
+        for metrica in ('progreso_medio', 'progreso_maximo', 'avance', 'avance_acumulado'):
+            serie[metrica].append(round(float(fila[metrica]), 2))
+    return serie
+
+
+def _cache():
+    return caches[getattr(settings, 'PROGRESO_CACHE_ALIAS', 'default')]
+
+
+CLAVE_VERSION = 'progreso:analitica:version'
+
+
+def _version(cache):
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(CLAVE_VERSION, version, None):
+            # Otro proceso la creó a la vez: se usa la suya
+            version = cache.get(CLAVE_VERSION, version)
+    return version
+
+
+def _clave(version, alcance, actividad, periodo, desde, hasta):
+    firma = hashlib.md5(f'{alcance}|{actividad}|{periodo}|{desde.isoformat()}|{hasta.isoformat()}'.encode())
+    return f'progreso:analitica:{version}:{firma.hexdigest()}'
+
+
+def _subir_version():
+    cache = _cache()
+    try:
+        cache.incr(CLAVE_VERSION)
+    except ValueError:
+        # Sin versión guardada: una nueva del reloj deja atrás las anteriores
+        cache.set(CLAVE_VERSION, time.time_ns(), None)
+
+
+def invalidar():
+    """Descarta las series cacheadas cuando la transacción en curso se confirma"""
+    transaction.on_commit(_subir_version)
+
+
+def serie_progreso(alcance, periodo, desde, hasta, actividad=None):
+    """
+    Serie de los logs de `alcance` (id de usuario, o None para todos) entre
+    el inicio del periodo de `desde` y `hasta`, opcionalmente de una sola actividad.
+    """
+    logs = LogProgreso.objects.all()
+    if alcance is not None:
+        logs = logs.filter(progreso_usuario__usuario_id=alcance)
+    if actividad:
+        logs = logs.filter(progreso_usuario__actividad=actividad)
+
+    desde = inicio_periodo(desde, periodo)
+    corte = min(inicio_periodo(timezone.now() - MARGEN_CIERRE, periodo), hasta)
+
+    serie = None
+    if desde < corte:
+        cache = _cache()
+        clave = _clave(_version(cache), alcance, actividad, periodo, desde, corte)
+        serie = cache.get(clave)
+        if serie is None:
+            serie = _consultar(logs, periodo, desde, corte)
+            cache.set(clave, serie, getattr(settings, 'PROGRESO_ANALITICA_TIMEOUT', 86400))
+    if corte < hasta:
+        en_curso = _consultar(logs, periodo, max(desde, corte), hasta)
+        if serie is None:
+            serie = en_curso
+        else:
+            # La ventana del tramo en curso empieza en cero: se desplaza con el acumulado cacheado
+            base = serie['avance_acumulado'][-1] if serie['avance_acumulado'] else 0
+            en_curso['avance_acumulado'] = [round(base + valor, 2) for valor in en_curso['avance_acumulado']]
+            serie = {nombre: serie[nombre] + en_curso[nombre] for nombre in serie}
+    return serie
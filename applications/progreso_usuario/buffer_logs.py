@@ -0,0 +1,163 @@
+"""
+Escritura diferida (write-behind) de LogProgreso.
+
+Con PROGRESO_LOGS_DIFERIDOS = True las vistas no insertan el log dentro de
+la petición: al confirmarse la transacción lo encolan en memoria y un hilo
+del proceso los vuelca con bulk_create cuando la cola alcanza
+PROGRESO_LOGS_LOTE entradas o cada PROGRESO_LOGS_INTERVALO segundos.
+
+Durabilidad: los logs encolados se pierden si el proceso muere sin
+terminar ordenadamente. Al salir (atexit) se vuelca lo pendiente, y
+PROGRESO_LOGS_MAX_PENDIENTES limita cuántos pueden estar en riesgo: al
+alcanzarlo, la propia petición vuelca la cola antes de continuar. Con el
+modo desactivado (por defecto) los logs se escriben en la misma
+transacción que el progreso.
+"""
+import atexit
+import collections
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, close_old_connections, transaction
+
+from .models import LogProgreso
+
+logger = logging.getLogger(__name__)
+
+
+class BufferLogs:
+    """Cola en memoria de LogProgreso pendientes de insertar"""
+
+    def __init__(self, lote=200, intervalo=1.0, max_pendientes=10000):
+        self.lote = lote
+        self.intervalo = intervalo
+        self.max_pendientes = max_pendientes
+        self._pendientes = collections.deque()
+        self._condicion = threading.Condition()
+        self._escritura = threading.Lock()
+        self._hilo = None
+        self._detenido = False
+
+    def __len__(self):
+        return len(self._pendientes)
+
+    def iniciar(self):
+        """Arranca el hilo de volcado periódico"""
+        self._hilo = threading.Thread(target=self._ejecutar, name='buffer-logs-progreso', daemon=True)
+        self._hilo.start()
+
+    def detener(self, timeout=10):
+        """Detiene el hilo y vuelca lo que quede en la cola"""
+        with self._condicion:
+            self._detenido = True
+            self._condicion.notify()
+        if self._hilo is not None:
+            self._hilo.join(timeout)
+        self.volcar()
+
+    def agregar(self, logs):
+        """Encola los logs; si la cola supera el máximo se vuelca en el hilo que llama"""
+        with self._condicion:
+            self._pendientes.extend(logs)
+            pendientes = len(self._pendientes)
+            if pendientes >= self.lote:
+                self._condicion.notify()
+        if pendientes >= self.max_pendientes:
+            self.volcar()
+
+    def volcar(self):
+        """Inserta todos los logs pendientes; devuelve cuántos se escribieron"""
+        with self._escritura:
+            with self._condicion:
+                lote = list(self._pendientes)
+                self._pendientes.clear()
+            if not lote:
+                return 0
+            return self._escribir(lote)
+
+    def _escribir(self, lote):
+        try:
+            LogProgreso.objects.bulk_create(lote, batch_size=self.lote)
+            return len(lote)
+        except IntegrityError:
+            # Algún progreso se eliminó antes del volcado: se guardan los demás uno a uno
+            escritos = 0
+            for log in lote:
+                try:
+                    with transaction.atomic():
+                        log.save(force_insert=True)
+                    escritos += 1
+                except IntegrityError:
+                    logger.warning('Log descartado: el progreso %s ya no existe', log.progreso_usuario_id)
+            return escritos
+        except DatabaseError:
+            # Base de datos no disponible: se reintenta en el siguiente volcado
+            logger.exception('No se pudieron volcar %s logs de progreso', len(lote))
+            with self._condicion:
+                hueco = max(self.max_pendientes - len(self._pendientes), 0)
+                self._pendientes.extendleft(reversed(lote[:hueco]))
+            if hueco < len(lote):
+                logger.error('Descartados %s logs de progreso por cola llena', len(lote) - hueco)
+            return 0
+
+    def _ejecutar(self):
+        while True:
+            with self._condicion:
+                if not self._detenido and len(self._pendientes) < self.lote:
+                    self._condicion.wait(self.intervalo)
+                if self._detenido:
+                    return
+            try:
+                self.volcar()
+            except Exception:
+                logger.exception('Error inesperado al volcar logs de progreso')
+            finally:
+                close_old_connections()
+
+
+_buffer = None
+_bloqueo = threading.Lock()
+
+
+def obtener_buffer():
+    """Devuelve el buffer del proceso, creándolo y arrancando su hilo la primera vez"""
+    global _buffer
+    with _bloqueo:
+        if _buffer is None:
+            _buffer = BufferLogs(
+                lote=getattr(settings, 'PROGRESO_LOGS_LOTE', 200),
+                intervalo=getattr(settings, 'PROGRESO_LOGS_INTERVALO', 1.0),
+                max_pendientes=getattr(settings, 'PROGRESO_LOGS_MAX_PENDIENTES', 10000),
+            )
+            _buffer.iniciar()
+            atexit.register(_buffer.detener)
+        return _buffer
+
+
+def _reiniciar_tras_fork():
+    # El hijo no hereda el hilo y la copia de la cola la vuelca el padre; se vacía
+    # para que el atexit heredado no la escriba dos veces
+    global _buffer, _bloqueo
+    if _buffer is not None:
+        _buffer._pendientes.clear()
+    _buffer = None
+    _bloqueo = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reiniciar_tras_fork)
+
+
+def registrar_logs(logs):
+    """
+    Guarda los logs en la transacción actual o, en modo diferido, los encola
+    cuando esta se confirme (si se revierte, no se escriben).
+    """
+    if not logs:
+        return
+    if getattr(settings, 'PROGRESO_LOGS_DIFERIDOS', False):
+        transaction.on_commit(lambda: obtener_buffer().agregar(logs))
+    else:
+        LogProgreso.objects.bulk_create(logs)
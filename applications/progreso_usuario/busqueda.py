@@ -0,0 +1,89 @@
+"""
+Búsqueda indexada por nombre de actividad.
+
+- PostgreSQL: índice GIN con ``gin_trgm_ops`` sobre ``UPPER(actividad)``
+  (migración 0003). Sirve el ``icontains`` de Django sin cambiar la consulta
+  y el ranking usa la similitud de trigramas de ``pg_trgm``.
+- SQLite: tabla virtual FTS5 con tokenizador ``trigram`` mantenida por
+  triggers, que resuelve búsquedas de subcadenas y se ordena con ``bm25``.
+- Otros backends, o términos de menos de tres caracteres (el mínimo que
+  indexa un trigrama): ``icontains`` sin índice.
+"""
+from django.db import connection
+from django.db.models import Case, IntegerField, Value, When
+from django.db.models.expressions import RawSQL
+
+from .models import ProgresoUsuario
+
+TABLA_FTS = 'progreso_usuario_actividad_fts'
+TRIGGERS_FTS = {'progreso_actividad_fts_ai', 'progreso_actividad_fts_ad', 'progreso_actividad_fts_au'}
+LONGITUD_MINIMA = 3
+
+# Disponibilidad del índice FTS5 por alias de conexión
+_fts_disponible = {}
+
+
+def fts_disponible():
+    """Indica si la tabla FTS5 y sus triggers de sincronización existen (solo SQLite)"""
+    if connection.vendor != 'sqlite':
+        return False
+    if connection.alias not in _fts_disponible:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' OR name = %s", [TABLA_FTS]
+            )
+            nombres = {fila[0] for fila in cursor.fetchall()}
+        _fts_disponible[connection.alias] = TABLA_FTS in nombres and TRIGGERS_FTS <= nombres
+    return _fts_disponible[connection.alias]
+
+
+def _expresion_fts(termino):
+    """Convierte el término en una frase FTS5 literal (sin operadores)"""
+    return '"' + termino.replace('"', '""') + '"'
+
+
+def filtrar_actividad(progresos, termino):
+    """Filtra un queryset de ProgresoUsuario por subcadena de la actividad usando el índice disponible"""
+    if len(termino) >= LONGITUD_MINIMA and fts_disponible():
+        return progresos.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s', [_expresion_fts(termino)]
+        ))
+    return progresos.filter(actividad__icontains=termino)
+
+
+def buscar_actividades(termino, usuario=None, limite=20):
+    """
+    Devuelve hasta ``limite`` progresos cuya actividad contiene el término,
+    primero los que empiezan por él y después por relevancia.
+    """
+    progresos = ProgresoUsuario.objects.all()
+    if usuario is not None:
+        progresos = progresos.filter(usuario=usuario)
+
+    if len(termino) >= LONGITUD_MINIMA and fts_disponible():
+        sql = (
+            f'SELECT rowid FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s'
+            + (' AND usuario_id = %s' if usuario is not None else '')
+            + " ORDER BY actividad LIKE %s ESCAPE '\\' DESC, rank LIMIT %s"
+        )
+        prefijo = termino.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        params = [_expresion_fts(termino)]
+        if usuario is not None:
+            params.append(usuario.pk)
+        params += [prefijo, limite]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            ids = [fila[0] for fila in cursor.fetchall()]
+        encontrados = progresos.in_bulk(ids)
+        return [encontrados[pk] for pk in ids if pk in encontrados]
+
+    progresos = progresos.filter(actividad__icontains=termino).annotate(
+        es_prefijo=Case(When(actividad__istartswith=termino, then=Value(1)),
+                        default=Value(0), output_field=IntegerField())
+    )
+    if connection.vendor == 'postgresql' and len(termino) >= LONGITUD_MINIMA:
+        from django.contrib.postgres.search import TrigramSimilarity
+
+        progresos = progresos.annotate(relevancia=TrigramSimilarity('actividad', termino))
+        return list(progresos.order_by('-es_prefijo', '-relevancia', 'actividad')[:limite])
+    return list(progresos.order_by('-es_prefijo', 'actividad')[:limite])
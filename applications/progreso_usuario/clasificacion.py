@@ -0,0 +1,193 @@
+"""
+Clasificación (top K) de progresos por actividad.
+
+ClasificacionActividad guarda, por actividad, los PROGRESO_CLASIFICACION_TAMANO
+mejores pares [usuario_id, progreso] ordenados por progreso descendente y
+usuario, y si la lista es completa (la actividad no tiene más progresos).
+Las lecturas pasan por la caché PROGRESO_CACHE_ALIAS y, si falta la fila,
+la calculan con el índice progreso_clasificacion_idx.
+
+Las vistas de escritura llaman a registrar_cambios dentro de su
+transacción. Primero se descartan sin bloqueo los cambios que no alteran la
+lista (progresos por debajo del último puesto) y solo para el resto se
+bloquea la fila con select_for_update. Una lista completa no descarta
+ningún cambio, así que la caché guarda qué actividades tenían la lista
+completa y para ellas se bloquea directamente, sin la lectura previa; el
+aviso se comprueba sobre la fila bloqueada. Si al bajar o eliminar progresos la
+lista incompleta se queda por debajo de la mitad de su tamaño, se vuelve a
+calcular desde la tabla. Las filas que aún no existen no se crean en las
+escrituras: las calcula la primera lectura. ``reconstruir_clasificacion``
+lo recalcula todo y corrige cualquier desviación.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import ClasificacionActividad, ProgresoUsuario
+
+
+def capacidad():
+    return getattr(settings, 'PROGRESO_CLASIFICACION_TAMANO', 100)
+
+
+def limite_maximo():
+    """Puestos que se pueden pedir: la otra mitad de la lista amortigua las bajadas"""
+    return max(capacidad() // 2, 1)
+
+
+def _orden(entrada):
+    return -entrada[1], entrada[0]
+
+
+def _cache():
+    return caches[getattr(settings, 'PROGRESO_CACHE_ALIAS', 'default')]
+
+
+def _clave(actividad):
+    return f'progreso:clasificacion:{hashlib.md5(actividad.encode()).hexdigest()}'
+
+
+def _clave_completa(actividad):
+    return f'{_clave(actividad)}:completa'
+
+
+def _recordar_completas(filas):
+    # Sin esperar al commit: un aviso equivocado solo cuesta un bloqueo o una lectura de más
+    if filas:
+        _cache().set_many({_clave_completa(fila.actividad): fila.completa for fila in filas},
+                          getattr(settings, 'PROGRESO_CLASIFICACION_TIMEOUT', 300))
+
+
+def _invalidar(actividades):
+    claves = [_clave(actividad) for actividad in actividades]
+    transaction.on_commit(lambda: _cache().delete_many(claves))
+
+
+def _calcular(actividad):
+    """Entradas y completitud de una actividad leídas de ProgresoUsuario"""
+    filas = list(
+        ProgresoUsuario.objects.filter(actividad=actividad)
+        .order_by('-progreso', 'usuario_id')
+        .values_list('usuario_id', 'progreso')[:capacidad() + 1]
+    )
+    return [[usuario_id, float(progreso)] for usuario_id, progreso in filas[:capacidad()]], len(filas) <= capacidad()
+
+
+def reconstruir_clasificaciones(actividades=None):
+    """Recalcula las clasificaciones indicadas, o todas; devuelve {actividad: entradas}"""
+    todas = actividades is None
+    if todas:
+        actividades = ProgresoUsuario.objects.order_by('actividad').values_list('actividad', flat=True).distinct()
+    ahora = timezone.now()
+    calculadas = {}
+    filas = []
+    for actividad in actividades:
+        entradas, completa = _calcular(actividad)
+        calculadas[actividad] = entradas
+        if entradas:
+            filas.append(ClasificacionActividad(actividad=actividad, entradas=entradas, completa=completa,
+                                                fecha_actualizacion=ahora))
+
+    with transaction.atomic():
+        obsoletas = ClasificacionActividad.objects.exclude(
+            Exists(ProgresoUsuario.objects.filter(actividad=OuterRef('actividad')))
+        )
+        if not todas:
+            obsoletas = obsoletas.filter(actividad__in=list(calculadas))
+        obsoletas.delete()
+        _recordar_completas(filas)
+        ClasificacionActividad.objects.bulk_create(
+            filas,
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=['actividad'],
+            update_fields=['entradas', 'completa', 'fecha_actualizacion']
+        )
+        _invalidar(calculadas)
+    return calculadas
+
+
+def _aplicar(entradas, completa, usuario_id, valor):
+    """Aplica un cambio a la lista; valor None elimina al usuario. Devuelve (entradas, completa)"""
+    entradas = [entrada for entrada in entradas if entrada[0] != usuario_id]
+    if valor is not None:
+        nueva = [usuario_id, float(valor)]
+        # Sin la lista completa, un valor por detrás del último puesto puede tener otros delante fuera de ella
+        if completa or (entradas and _orden(nueva) < _orden(entradas[-1])):
+            entradas.append(nueva)
+            entradas.sort(key=_orden)
+            if len(entradas) > capacidad():
+                entradas.pop()
+                completa = False
+    return entradas, completa
+
+
+def _afecta(fila, usuario_id, valor):
+    if any(entrada[0] == usuario_id for entrada in fila.entradas):
+        return True
+    if valor is None:
+        return False
+    return fila.completa or (bool(fila.entradas) and _orden([usuario_id, float(valor)]) < _orden(fila.entradas[-1]))
+
+
+def registrar_cambios(usuario_id, cambios):
+    """
+    Actualiza las clasificaciones con los nuevos progresos del usuario.
+
+    `cambios` es un iterable de (actividad, progreso); progreso None indica
+    que el usuario ya no tiene progreso en esa actividad.
+    """
+    cambios = dict(cambios)
+    avisos = _cache().get_many([_clave_completa(actividad) for actividad in cambios])
+    directas = [actividad for actividad in cambios if avisos.get(_clave_completa(actividad))]
+    resto = [actividad for actividad in cambios if actividad not in directas]
+    relevantes = list(directas)
+    if resto:
+        existentes = ClasificacionActividad.objects.filter(actividad__in=resto)
+        relevantes += [fila.actividad for fila in existentes if _afecta(fila, usuario_id, cambios[fila.actividad])]
+    if not relevantes:
+        return
+
+    # Orden fijo de bloqueo para que dos lotes concurrentes no se interbloqueen
+    bloqueadas = ClasificacionActividad.objects.select_for_update().filter(actividad__in=relevantes).order_by('actividad')
+    ahora = timezone.now()
+    modificadas = []
+    desactualizadas = []
+    recalcular = []
+    for fila in bloqueadas:
+        if fila.actividad in directas and not _afecta(fila, usuario_id, cambios[fila.actividad]):
+            # El aviso de lista completa estaba desactualizado
+            desactualizadas.append(fila)
+            continue
+        fila.entradas, fila.completa = _aplicar(fila.entradas, fila.completa, usuario_id, cambios[fila.actividad])
+        if not fila.completa and len(fila.entradas) < limite_maximo():
+            recalcular.append(fila.actividad)
+        else:
+            fila.fecha_actualizacion = ahora
+            modificadas.append(fila)
+
+    ClasificacionActividad.objects.bulk_update(modificadas, ['entradas', 'completa', 'fecha_actualizacion'])
+    _recordar_completas(modificadas + desactualizadas)
+    if recalcular:
+        reconstruir_clasificaciones(recalcular)
+    _invalidar(relevantes)
+
+
+def obtener_clasificacion(actividad):
+    """Entradas [usuario_id, progreso] de la actividad, de la caché, la tabla o calculadas"""
+    cache = _cache()
+    clave = _clave(actividad)
+    entradas = cache.get(clave)
+    if entradas is None:
+        fila = ClasificacionActividad.objects.filter(actividad=actividad).first()
+        if fila is not None:
+            entradas = fila.entradas
+            _recordar_completas([fila])
+        else:
+            entradas = reconstruir_clasificaciones([actividad])[actividad]
+        cache.set(clave, entradas, getattr(settings, 'PROGRESO_CLASIFICACION_TIMEOUT', 300))
+    return entradas
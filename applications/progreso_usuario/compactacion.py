@@ -0,0 +1,109 @@
+"""
+Compactación de LogProgreso antiguos.
+
+Los logs anteriores al límite de retención se agrupan por progreso y día
+(zona horaria del proyecto). En cada grupo con más de un log se conserva el
+último, que pasa a llevar el progreso_anterior del primero y una descripción
+de resumen, y se borran los demás. El recorrido usa un cursor por
+(progreso_usuario, fecha_cambio, id) sobre log_progreso_fecha_idx y cada
+lote se escribe en su propia transacción corta, así que el proceso puede
+ejecutarse con la aplicación en uso y retomarse si se interrumpe. Los
+progresos no se modifican: fecha_actualizacion solo cambia cuando el usuario
+edita el progreso, y el ETag del detalle ya incluye el número de logs. Las
+series de analitica.py sí se invalidan al confirmar cada lote.
+"""
+import time
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import analitica
+from .models import LogProgreso
+
+
+def _leer(limite, cursor, lote):
+    logs = LogProgreso.objects.filter(fecha_cambio__lt=limite).order_by('progreso_usuario_id', 'fecha_cambio', 'id')
+    if cursor is not None:
+        progreso_id, fecha, log_id = cursor
+        logs = logs.filter(
+            Q(progreso_usuario_id__gt=progreso_id) |
+            Q(progreso_usuario_id=progreso_id, fecha_cambio__gt=fecha) |
+            Q(progreso_usuario_id=progreso_id, fecha_cambio=fecha, id__gt=log_id)
+        )
+    return list(logs.values_list('id', 'progreso_usuario_id', 'fecha_cambio', 'progreso_anterior')[:lote])
+
+
+def _compactar_lote(filas, abierto, simular):
+    """
+    Añade las filas al grupo abierto o a grupos nuevos y escribe el estado en una transacción.
+
+    De cada grupo solo se guarda la clave, el id del último log (el que se
+    conserva), el progreso_anterior del primero y el número de cambios. Cada
+    fila que continúa un grupo deja el log anterior para borrar, así que una
+    transacción borra como mucho len(filas) logs aunque el día tenga más.
+    Devuelve (grupo abierto, grupos cerrados, logs borrados).
+    """
+    resumenes = {}
+    borrar = []
+    cerrados = 0
+    for log_id, progreso_id, fecha, anterior in filas:
+        clave = progreso_id, timezone.localtime(fecha).date()
+        if abierto is not None and abierto['clave'] == clave:
+            borrar.append(abierto['id'])
+            resumenes.pop(abierto['id'], None)
+            abierto['id'] = log_id
+            abierto['cambios'] += 1
+            resumenes[log_id] = abierto
+        else:
+            if abierto is not None and abierto['cambios'] > 1:
+                cerrados += 1
+            abierto = {'clave': clave, 'id': log_id, 'anterior': anterior, 'cambios': 1}
+
+    if borrar and not simular:
+        # El último log leído de cada grupo ya lleva el resumen: si el proceso se corta aquí, el historial es correcto
+        with transaction.atomic():
+            LogProgreso.objects.bulk_update([
+                LogProgreso(
+                    id=log_id,
+                    progreso_anterior=grupo['anterior'],
+                    descripcion=f'Resumen del {grupo["clave"][1].isoformat()}: {grupo["cambios"]} cambios'
+                )
+                for log_id, grupo in resumenes.items()
+            ], ['progreso_anterior', 'descripcion'])
+            LogProgreso.objects.filter(id__in=borrar).delete()
+            analitica.invalidar()
+    return abierto, cerrados, len(borrar)
+
+
+def compactar_logs(limite, lote=5000, pausa=0, simular=False, informar=None):
+    """
+    Compacta por día los logs con fecha_cambio anterior a `limite`.
+
+    Lee como mucho `lote` logs por transacción y borra como mucho otros
+    tantos, aunque un mismo día tenga más, y espera `pausa` segundos entre
+    lotes. Devuelve un dict con los logs leídos, los grupos compactados y
+    los logs borrados.
+    """
+    totales = {'leidos': 0, 'grupos': 0, 'borrados': 0}
+    cursor = None
+    # El último grupo puede continuar en el siguiente lote
+    abierto = None
+    while True:
+        filas = _leer(limite, cursor, lote)
+        if filas:
+            cursor = filas[-1][1], filas[-1][2], filas[-1][0]
+            totales['leidos'] += len(filas)
+        fin = len(filas) < lote
+
+        abierto, cerrados, borrados = _compactar_lote(filas, abierto, simular)
+        totales['grupos'] += cerrados
+        totales['borrados'] += borrados
+        if fin and abierto is not None and abierto['cambios'] > 1:
+            totales['grupos'] += 1
+        if informar is not None:
+            informar(totales)
+        if fin:
+            return totales
+        if pausa:
+            time.sleep(pausa)
@@ -0,0 +1,130 @@
+"""
+Exportación en streaming de ProgresoUsuario y LogProgreso.
+
+Las filas se leen con ``values_list().iterator(chunk_size=...)`` (cursor de
+servidor en PostgreSQL) y se codifican a CSV o NDJSON en bloques de unos
+64 KB, opcionalmente comprimidos con gzip. Ni la vista ni el comando llegan
+a tener en memoria más de un bloque de filas, exporten cien filas o diez
+millones.
+
+Bajo ASGI, la vista entrega los bloques con iterar_async(): una respuesta en
+streaming con un iterador síncrono se consumiría entera con list() antes de
+enviar el primer byte.
+"""
+import csv
+import io
+import json
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .models import ProgresoUsuario, LogProgreso
+from .serializadores import Proyeccion
+
+FORMATOS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Bytes acumulados antes de entregar un bloque al servidor o al archivo
+TAMANO_BLOQUE = 64 * 1024
+
+EXPORTACIONES = {
+    'progresos': (
+        Proyeccion(ProgresoUsuario, [
+            'id', 'usuario', 'actividad', 'progreso', 'completado',
+            'fecha_inicio', 'fecha_actualizacion', 'resultado'
+        ]),
+        'fecha_actualizacion',
+    ),
+    'logs': (
+        Proyeccion(LogProgreso, [
+            'id', 'progreso_usuario', 'progreso_anterior', 'progreso_nuevo', 'descripcion', 'fecha_cambio'
+        ]),
+        'fecha_cambio',
+    ),
+}
+
+
+def consulta(tipo, usuario_id=None, desde=None, hasta=None):
+    """Queryset de tuplas a exportar, filtrado por usuario y por [desde, hasta) en su campo de fecha"""
+    proyeccion, campo_fecha = EXPORTACIONES[tipo]
+    if tipo == 'progresos':
+        queryset = ProgresoUsuario.objects.all()
+        if usuario_id is not None:
+            queryset = queryset.filter(usuario_id=usuario_id)
+    else:
+        queryset = LogProgreso.objects.all()
+        if usuario_id is not None:
+            queryset = queryset.filter(progreso_usuario__usuario_id=usuario_id)
+    if desde is not None:
+        queryset = queryset.filter(**{f'{campo_fecha}__gte': desde})
+    if hasta is not None:
+        queryset = queryset.filter(**{f'{campo_fecha}__lt': hasta})
+    # Orden por clave primaria: estable y sin ordenación adicional en la base de datos
+    return proyeccion.filas(queryset.order_by('id'))
+
+
+def _filas_csv(proyeccion, filas):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(proyeccion.campos)
+    convertir = proyeccion.fila
+    for fila in filas:
+        escritor.writerow(convertir(fila).values())
+        if buffer.tell() >= TAMANO_BLOQUE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _filas_ndjson(proyeccion, filas):
+    partes = []
+    tamano = 0
+    convertir = proyeccion.fila
+    for fila in filas:
+        linea = json.dumps(convertir(fila), ensure_ascii=False) + '\n'
+        partes.append(linea)
+        tamano += len(linea)
+        if tamano >= TAMANO_BLOQUE:
+            yield ''.join(partes)
+            partes = []
+            tamano = 0
+    yield ''.join(partes)
+
+
+def _comprimir(bloques):
+    # wbits=31 produce un flujo gzip completo (cabecera y CRC), legible con gunzip
+    compresor = zlib.compressobj(wbits=31)
+    for bloque in bloques:
+        comprimido = compresor.compress(bloque)
+        if comprimido:
+            yield comprimido
+    yield compresor.flush()
+
+
+def exportar(tipo, formato='csv', comprimir=False, **filtros):
+    """Generador de bloques de bytes con las filas exportadas"""
+    proyeccion, _ = EXPORTACIONES[tipo]
+    filas = consulta(tipo, **filtros).iterator(
+        chunk_size=getattr(settings, 'PROGRESO_EXPORTACION_CHUNK', 2000)
+    )
+    codificar = _filas_csv if formato == 'csv' else _filas_ndjson
+    bloques = (bloque.encode() for bloque in codificar(proyeccion, filas) if bloque)
+    return _comprimir(bloques) if comprimir else bloques
+
+
+async def iterar_async(bloques):
+    """
+    Iterador asíncrono sobre los bloques de exportar(). Cada bloque se produce
+    con sync_to_async en el hilo de la petición, donde vive el cursor
+    """
+    siguiente = sync_to_async(next)
+    try:
+        while (bloque := await siguiente(bloques, None)) is not None:
+            yield bloque
+    finally:
+        # Cliente desconectado: cerrar el generador libera el cursor en su hilo
+        await sync_to_async(bloques.close)()
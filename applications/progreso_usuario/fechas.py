@@ -0,0 +1,24 @@
+"""
+Lectura de fechas de los parámetros de la API y de los comandos.
+
+Las vistas (filtros desde/hasta de logs, exportación y analítica) y los
+comandos de gestión aceptan el mismo formato: una fecha o fecha-hora ISO
+8601, que sin zona horaria se interpreta en la del proyecto.
+"""
+from datetime import datetime
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+
+def parsear_fecha(valor):
+    """Convierte una fecha o fecha-hora ISO 8601 en un datetime con zona horaria; lanza ValueError"""
+    fecha = parse_datetime(valor)
+    if fecha is None:
+        dia = parse_date(valor)
+        if dia is None:
+            raise ValueError(f'Fecha inválida: {valor}')
+        fecha = datetime(dia.year, dia.month, dia.day)
+    if timezone.is_naive(fecha):
+        fecha = timezone.make_aware(fecha)
+    return fecha
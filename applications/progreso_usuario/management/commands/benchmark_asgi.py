@@ -0,0 +1,98 @@
+import asyncio
+import time
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, override_settings
+from django.urls import reverse
+
+from applications.benchmark import analizar_tablas, base_datos_temporal, resumen_tiempos
+from applications.progreso_usuario.models import ProgresoUsuario, LogProgreso
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara el rendimiento de las vistas síncronas y asíncronas de progreso_usuario '
+        'servidas por el manejador ASGI con distintos niveles de concurrencia'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--actividades', type=int, default=200, help='Progresos del usuario de prueba')
+        parser.add_argument('--logs', type=int, default=30, help='Logs por progreso')
+        parser.add_argument('--peticiones', type=int, default=400, help='Peticiones por medición')
+        parser.add_argument('--concurrencia', default='1,10,50,100',
+                            help='Niveles de concurrencia separados por comas')
+        parser.add_argument('--mantener-bd', action='store_true',
+                            help='Reutiliza la base de datos temporal entre ejecuciones')
+
+    def handle(self, *args, **options):
+        try:
+            niveles = [int(n) for n in options['concurrencia'].split(',') if n.strip()]
+        except ValueError:
+            raise CommandError('--concurrencia debe ser una lista de enteros, por ejemplo 1,10,50')
+        if not niveles or min(niveles) < 1:
+            raise CommandError('--concurrencia debe contener enteros positivos')
+
+        with base_datos_temporal(mantener=options['mantener_bd']):
+            usuario = User.objects.filter(username='bench_asgi').first()
+            if usuario is None:
+                usuario = self._sembrar(options)
+                analizar_tablas()
+            # async_to_sync mantiene el ORM de las vistas en este hilo y su conexión
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                async_to_sync(self._medir)(usuario, niveles, options)
+
+    def _sembrar(self, options):
+        usuario = User.objects.create(username='bench_asgi', password=make_password(None))
+        ProgresoUsuario.objects.bulk_create(
+            [ProgresoUsuario(usuario=usuario, actividad=f'Actividad {a}', progreso=a % 101,
+                             completado=a % 101 == 100)
+             for a in range(options['actividades'])],
+            batch_size=1000
+        )
+        LogProgreso.objects.bulk_create(
+            [LogProgreso(progreso_usuario_id=progreso_id, progreso_anterior=0, progreso_nuevo=0)
+             for progreso_id in ProgresoUsuario.objects.filter(usuario=usuario).values_list('id', flat=True)
+             for _ in range(options['logs'])],
+            batch_size=1000
+        )
+        return usuario
+
+    async def _medir(self, usuario, niveles, options):
+        cliente = AsyncClient()
+        await cliente.aforce_login(usuario)
+        progreso = await ProgresoUsuario.objects.filter(usuario=usuario).afirst()
+
+        rutas = [
+            ('lista', reverse('progreso_usuario:lista'), reverse('progreso_usuario:lista_async')),
+            ('detalle', reverse('progreso_usuario:detalle', args=[progreso.id]),
+             reverse('progreso_usuario:detalle_async', args=[progreso.id])),
+        ]
+        for nombre, url_sincrona, url_asincrona in rutas:
+            for concurrencia in niveles:
+                for modo, url in (('sync', url_sincrona), ('async', url_asincrona)):
+                    rendimiento, tiempos = await self._carga(cliente, url, concurrencia, options['peticiones'])
+                    self.stdout.write(
+                        f'{nombre} {modo:5} c={concurrencia:<4} {rendimiento:8.1f} req/s | '
+                        f'p50 {tiempos["p50_ms"]} ms, p95 {tiempos["p95_ms"]} ms, p99 {tiempos["p99_ms"]} ms'
+                    )
+
+    async def _carga(self, cliente, url, concurrencia, peticiones):
+        """Lanza las peticiones con a lo sumo `concurrencia` en vuelo; devuelve req/s y latencias"""
+        semaforo = asyncio.Semaphore(concurrencia)
+        muestras = []
+
+        async def peticion():
+            async with semaforo:
+                inicio = time.perf_counter()
+                response = await cliente.get(url)
+                muestras.append(time.perf_counter() - inicio)
+                if response.status_code != 200:
+                    raise CommandError(f'{url} respondió {response.status_code}')
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(peticion() for _ in range(peticiones)))
+        return peticiones / (time.perf_counter() - inicio), resumen_tiempos(muestras)
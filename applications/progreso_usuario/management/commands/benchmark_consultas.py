@@ -0,0 +1,108 @@
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from applications.benchmark import analizar_tablas, base_datos_temporal, cronometrar, resumen_tiempos
+from applications.progreso_usuario.models import ProgresoUsuario, LogProgreso
+
+
+class Command(BaseCommand):
+    help = (
+        'Siembra un conjunto de datos grande en una base de datos temporal y mide el plan '
+        '(EXPLAIN) y el tiempo de las consultas de lista_progreso y detalle_progreso'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', type=int, default=200)
+        parser.add_argument('--actividades', type=int, default=50, help='Actividades por usuario')
+        parser.add_argument('--logs', type=int, default=20, help='Logs por progreso')
+        parser.add_argument('--repeticiones', type=int, default=50)
+        parser.add_argument('--semilla', type=int, default=42)
+        parser.add_argument('--verificar', action='store_true',
+                            help='Falla si alguna consulta no usa el índice esperado')
+        parser.add_argument('--mantener-bd', action='store_true',
+                            help='Reutiliza la base de datos temporal entre ejecuciones')
+
+    def handle(self, *args, **options):
+        with base_datos_temporal(mantener=options['mantener_bd']):
+            if not ProgresoUsuario.objects.exists():
+                self._sembrar(options)
+                analizar_tablas()
+            fallos = self._medir(options)
+
+        if fallos and options['verificar']:
+            raise CommandError(f'Consultas sin el índice esperado: {", ".join(fallos)}')
+
+    def _sembrar(self, options):
+        rng = random.Random(options['semilla'])
+        contrasena = make_password(None)
+
+        User.objects.bulk_create(
+            [User(username=f'bench{i}', email=f'bench{i}@edumap.test', password=contrasena)
+             for i in range(options['usuarios'])],
+            batch_size=1000
+        )
+        usuarios = list(User.objects.values_list('id', flat=True))
+
+        progresos = []
+        for usuario_id in usuarios:
+            for a in range(options['actividades']):
+                valor = rng.choice([100, rng.randint(0, 99)])
+                progresos.append(ProgresoUsuario(
+                    usuario_id=usuario_id, actividad=f'Actividad {a}',
+                    progreso=valor, completado=valor >= 100
+                ))
+        ProgresoUsuario.objects.bulk_create(progresos, batch_size=1000)
+
+        logs = []
+        for progreso_id in ProgresoUsuario.objects.values_list('id', flat=True).iterator(chunk_size=2000):
+            for _ in range(options['logs']):
+                logs.append(LogProgreso(progreso_usuario_id=progreso_id, progreso_anterior=0, progreso_nuevo=0))
+            if len(logs) >= 10000:
+                LogProgreso.objects.bulk_create(logs, batch_size=1000)
+                logs = []
+        LogProgreso.objects.bulk_create(logs, batch_size=1000)
+
+        self.stdout.write(
+            f'Sembrados {len(usuarios)} usuarios, {len(progresos)} progresos y '
+            f'{len(progresos) * options["logs"]} logs'
+        )
+
+    def _consultas(self):
+        """Consultas de las vistas junto al índice que deberían usar"""
+        usuario = User.objects.order_by('id')[User.objects.count() // 2]
+        progreso = ProgresoUsuario.objects.filter(usuario=usuario).first()
+        ultimo = ProgresoUsuario.objects.filter(usuario=usuario).order_by('-fecha_actualizacion', '-id')[5]
+        base = ProgresoUsuario.objects.filter(usuario=usuario)
+
+        return [
+            ('lista', base[:10], 'progreso_usuario_fecha_idx'),
+            ('lista completados', base.filter(completado=True)[:10], 'progreso_completado_idx'),
+            ('lista en curso', base.filter(completado=False)[:10], 'progreso_en_curso_idx'),
+            ('lista cursor', base.order_by('-fecha_actualizacion', '-id').filter(
+                Q(fecha_actualizacion__lt=ultimo.fecha_actualizacion) |
+                Q(fecha_actualizacion=ultimo.fecha_actualizacion, id__lt=ultimo.id)
+            )[:11], 'progreso_usuario_fecha_idx'),
+            ('detalle logs', LogProgreso.objects.filter(progreso_usuario=progreso), 'log_progreso_fecha_idx'),
+        ]
+
+    def _medir(self, options):
+        fallos = []
+        for nombre, queryset, indice in self._consultas():
+            plan = queryset.explain()
+            usa_indice = indice in plan
+            tiempos = resumen_tiempos(cronometrar(lambda: list(queryset.all()), options['repeticiones']))
+
+            estilo = self.style.SUCCESS if usa_indice else self.style.ERROR
+            self.stdout.write(estilo(
+                f'{nombre}: {"usa" if usa_indice else "NO usa"} {indice} | '
+                f'media {tiempos["media_ms"]} ms, p95 {tiempos["p95_ms"]} ms'
+            ))
+            if options['verbosity'] > 1:
+                self.stdout.write(plan)
+            if not usa_indice:
+                fallos.append(nombre)
+        return fallos
@@ -0,0 +1,83 @@
+import json
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+
+from applications.benchmark import base_datos_temporal, cronometrar, resumen_tiempos
+from applications.progreso_usuario.models import ProgresoUsuario
+from applications.progreso_usuario.serializadores import PROGRESO
+
+
+def _dict_desde_modelo(progreso):
+    """Conversión campo a campo que hacían las vistas antes de las proyecciones"""
+    return {
+        'id': progreso.id,
+        'actividad': progreso.actividad,
+        'progreso': float(progreso.progreso),
+        'completado': progreso.completado,
+        'fecha_inicio': progreso.fecha_inicio.isoformat(),
+        'fecha_actualizacion': progreso.fecha_actualizacion.isoformat(),
+        'resultado': progreso.resultado
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide filas por segundo al serializar progresos: instancias de modelo frente a '
+        'proyecciones de values_list(), y el codificador JSON por defecto frente al configurado'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=10000)
+        parser.add_argument('--repeticiones', type=int, default=10)
+        parser.add_argument('--mantener-bd', action='store_true',
+                            help='Reutiliza la base de datos temporal entre ejecuciones')
+
+    def handle(self, *args, **options):
+        with base_datos_temporal(mantener=options['mantener_bd']):
+            usuario = User.objects.filter(username='bench_serializacion').first()
+            if usuario is None:
+                usuario = User.objects.create(username='bench_serializacion')
+                ProgresoUsuario.objects.bulk_create(
+                    [ProgresoUsuario(usuario=usuario, actividad=f'Actividad {i}', progreso=i % 101,
+                                     completado=i % 101 == 100, resultado='Notas de la actividad')
+                     for i in range(options['filas'])],
+                    batch_size=1000
+                )
+            self._medir(ProgresoUsuario.objects.filter(usuario=usuario), options)
+
+    def _medir(self, queryset, options):
+        repeticiones = options['repeticiones']
+        instancias = list(queryset)
+        tuplas = list(PROGRESO.filas(queryset))
+        payload = PROGRESO.serializar(tuplas)
+        filas = len(tuplas)
+
+        mediciones = [
+            ('consulta + dicts desde modelos', lambda: [_dict_desde_modelo(p) for p in queryset.all()]),
+            ('consulta + proyección', lambda: PROGRESO.serializar(PROGRESO.filas(queryset))),
+            ('dicts desde modelos (sin consulta)', lambda: [_dict_desde_modelo(p) for p in instancias]),
+            ('proyección (sin consulta)', lambda: PROGRESO.serializar(tuplas)),
+            ('json.dumps + DjangoJSONEncoder', lambda: json.dumps(payload, cls=DjangoJSONEncoder)),
+        ]
+        codificadores = ['orjson.dumps']
+        if getattr(settings, 'PROGRESO_JSON_DUMPS', None):
+            codificadores.insert(0, settings.PROGRESO_JSON_DUMPS)
+        for ruta in dict.fromkeys(codificadores):
+            try:
+                dumps = import_string(ruta)
+            except ImportError:
+                self.stdout.write(self.style.WARNING(f'{ruta} no está disponible'))
+                continue
+            mediciones.append((ruta, lambda dumps=dumps: dumps(payload)))
+
+        for nombre, funcion in mediciones:
+            tiempos = resumen_tiempos(cronometrar(funcion, repeticiones))
+            por_segundo = filas / (tiempos['media_ms'] / 1000)
+            self.stdout.write(
+                f'{nombre:38} {por_segundo:14,.0f} filas/s | media {tiempos["media_ms"]} ms, '
+                f'p95 {tiempos["p95_ms"]} ms ({filas} filas)'
+            )
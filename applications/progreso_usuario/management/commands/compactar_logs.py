@@ -0,0 +1,39 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from applications.progreso_usuario.compactacion import compactar_logs
+
+
+class Command(BaseCommand):
+    help = (
+        'Agrupa los LogProgreso más antiguos que la retención en un log por día y progreso, '
+        'borrando los originales por lotes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=getattr(settings, 'PROGRESO_LOGS_RETENCION_DIAS', 90),
+                            help='Días de historial que se conservan completos')
+        parser.add_argument('--lote', type=int, default=5000, help='Logs leídos y escritos por transacción')
+        parser.add_argument('--pausa', type=float, default=0, help='Segundos de espera entre lotes')
+        parser.add_argument('--simular', action='store_true', help='Calcula lo que se compactaría sin escribir')
+
+    def handle(self, *args, **options):
+        if options['dias'] < 1 or options['lote'] < 2:
+            raise CommandError('--dias debe ser mayor que 0 y --lote mayor que 1')
+
+        # Solo días completos: el límite es la medianoche local de hace `dias` días
+        limite = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=options['dias'])
+
+        def informar(totales):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{totales["leidos"]} logs leídos, {totales["borrados"]} por borrar o borrados')
+
+        totales = compactar_logs(limite, options['lote'], options['pausa'], options['simular'], informar)
+        accion = 'se compactarían' if options['simular'] else 'compactados'
+        self.stdout.write(self.style.SUCCESS(
+            f'Logs anteriores a {limite:%Y-%m-%d}: {totales["leidos"]} leídos, {totales["grupos"]} días {accion}, '
+            f'{totales["borrados"]} logs {"a borrar" if options["simular"] else "borrados"}'
+        ))
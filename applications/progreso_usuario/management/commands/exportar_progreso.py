@@ -0,0 +1,53 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from applications.progreso_usuario import exportacion
+from applications.progreso_usuario.fechas import parsear_fecha
+
+
+class Command(BaseCommand):
+    help = (
+        'Exporta en streaming ProgresoUsuario o LogProgreso a CSV o NDJSON, '
+        'opcionalmente comprimido con gzip, con memoria constante'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('tipo', choices=sorted(exportacion.EXPORTACIONES))
+        parser.add_argument('--formato', choices=sorted(exportacion.FORMATOS), default='csv')
+        parser.add_argument('--usuario', type=int, help='Id de usuario; por defecto toda la institución')
+        parser.add_argument('--desde', help='Fecha ISO 8601 inicial (inclusive)')
+        parser.add_argument('--hasta', help='Fecha ISO 8601 final (exclusive)')
+        parser.add_argument('--gzip', action='store_true', help='Comprime la salida con gzip')
+        parser.add_argument('--salida', default='-', help="Archivo de destino, o '-' para la salida estándar")
+
+    def handle(self, *args, **options):
+        try:
+            desde = parsear_fecha(options['desde']) if options['desde'] else None
+            hasta = parsear_fecha(options['hasta']) if options['hasta'] else None
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        bloques = exportacion.exportar(
+            options['tipo'], options['formato'], options['gzip'],
+            usuario_id=options['usuario'], desde=desde, hasta=hasta
+        )
+        inicio = time.perf_counter()
+        escritos = 0
+        destino = sys.stdout.buffer if options['salida'] == '-' else open(options['salida'], 'wb')
+        try:
+            for bloque in bloques:
+                destino.write(bloque)
+                escritos += len(bloque)
+        finally:
+            if destino is sys.stdout.buffer:
+                destino.flush()
+            else:
+                destino.close()
+
+        if options['salida'] != '-':
+            self.stdout.write(self.style.SUCCESS(
+                f'{escritos / 1024:,.0f} KB escritos en {options["salida"]} '
+                f'({time.perf_counter() - inicio:.1f} s)'
+            ))
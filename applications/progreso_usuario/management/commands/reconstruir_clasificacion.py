@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from applications.progreso_usuario.clasificacion import reconstruir_clasificaciones
+
+
+class Command(BaseCommand):
+    help = 'Recalcula ClasificacionActividad a partir de ProgresoUsuario para reparar desviaciones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--actividad', action='append', dest='actividades',
+                            help='Actividad a reconstruir (se puede repetir); por defecto todas')
+
+    def handle(self, *args, **options):
+        total = len(reconstruir_clasificaciones(options['actividades']))
+        self.stdout.write(self.style.SUCCESS(f'{total} clasificaciones reconstruidas'))
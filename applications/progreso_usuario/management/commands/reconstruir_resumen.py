@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from applications.progreso_usuario.resumen import reconstruir_resumenes
+
+
+class Command(BaseCommand):
+    help = 'Recalcula ResumenProgreso a partir de ProgresoUsuario para reparar desviaciones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuario', type=int, action='append', dest='usuarios',
+                            help='Id de usuario a reconstruir (se puede repetir); por defecto todos')
+
+    def handle(self, *args, **options):
+        total = reconstruir_resumenes(options['usuarios'])
+        self.stdout.write(self.style.SUCCESS(f'{total} resúmenes reconstruidos'))
@@ -0,0 +1,66 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from applications.benchmark import analizar_tablas
+from applications.progreso_usuario.fechas import parsear_fecha
+from applications.sembrado import CONTRASENA_SINTETICA, sembrar
+from applications.Usuarios.models import Usuario
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera usuarios, progresos y logs sintéticos reproducibles en la base de datos configurada, '
+        'con COPY en PostgreSQL o INSERT por lotes, e informa de las filas por segundo'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', type=int, default=1000)
+        parser.add_argument('--actividades', type=int, default=20, help='Progresos por usuario')
+        parser.add_argument('--logs', type=int, default=10, help='Logs por progreso')
+        parser.add_argument('--semilla', type=int, default=42)
+        parser.add_argument('--dias', type=int, default=90, help='Días de historial de los logs')
+        parser.add_argument('--referencia', help='Fecha ISO 8601 final del historial; por defecto ahora')
+        parser.add_argument('--prefijo', default='bench', help='Prefijo de los username (<prefijo>0, <prefijo>1...)')
+        parser.add_argument('--lote', type=int, default=10000, help='Filas por inserción')
+        parser.add_argument('--sin-copy', action='store_true', help='Usa INSERT por lotes también en PostgreSQL')
+
+    def handle(self, *args, **options):
+        if min(options['usuarios'], options['actividades'], options['logs'], options['dias'], options['lote']) < 1:
+            raise CommandError('--usuarios, --actividades, --logs, --dias y --lote deben ser mayores que 0')
+        try:
+            referencia = parsear_fecha(options['referencia']) if options['referencia'] else None
+        except ValueError as e:
+            raise CommandError(str(e))
+        # Usuario sobrevive al borrado de su User (SET_NULL) y su correo también es único
+        if (User.objects.filter(username=f'{options["prefijo"]}0').exists()
+                or Usuario.objects.filter(correo=f'{options["prefijo"]}0@edumap.test').exists()):
+            raise CommandError(f'Ya existen usuarios {options["prefijo"]}N: usa otro --prefijo')
+
+        inicio = time.perf_counter()
+
+        def informar(filas):
+            if options['verbosity'] > 1:
+                total = sum(filas.values())
+                self.stdout.write(f'{filas[User]} usuarios, {total} filas, '
+                                  f'{total / (time.perf_counter() - inicio):,.0f} filas/s')
+
+        filas = sembrar(
+            options['usuarios'], options['actividades'], options['logs'], semilla=options['semilla'],
+            dias=options['dias'], referencia=referencia, prefijo=options['prefijo'], lote=options['lote'],
+            copy=not options['sin_copy'], informar=informar
+        )
+        insercion = time.perf_counter() - inicio
+        analizar_tablas()
+
+        total = sum(filas.values())
+        for modelo, cantidad in filas.items():
+            self.stdout.write(f'{modelo._meta.label:32} {cantidad:>12,}')
+        metodo = 'COPY' if connection.vendor == 'postgresql' and not options['sin_copy'] else 'INSERT por lotes'
+        self.stdout.write(self.style.SUCCESS(
+            f'{total:,} filas con {metodo} en {insercion:.1f} s ({total / insercion:,.0f} filas/s), '
+            f'resúmenes y clasificaciones incluidos; total {time.perf_counter() - inicio:.1f} s. '
+            f'Contraseña de los usuarios: {CONTRASENA_SINTETICA}'
+        ))
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('progreso_usuario', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Crear primero los índices compuestos para no dejar las FK sin índice
+        migrations.AddIndex(
+            model_name='logprogreso',
+            index=models.Index(fields=['progreso_usuario', '-fecha_cambio', '-id'], name='log_progreso_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='progresousuario',
+            index=models.Index(fields=['usuario', '-fecha_actualizacion', '-id'], name='progreso_usuario_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='progresousuario',
+            index=models.Index(condition=models.Q(('completado', True)), fields=['usuario', '-fecha_actualizacion', '-id'], name='progreso_completado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='progresousuario',
+            index=models.Index(condition=models.Q(('completado', False)), fields=['usuario', '-fecha_actualizacion', '-id'], name='progreso_en_curso_idx'),
+        ),
+        migrations.AlterField(
+            model_name='logprogreso',
+            name='progreso_usuario',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='logs', to='progreso_usuario.progresousuario'),
+        ),
+        migrations.AlterField(
+            model_name='progresousuario',
+            name='usuario',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Usuario'),
+        ),
+    ]
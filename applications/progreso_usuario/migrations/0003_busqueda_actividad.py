@@ -0,0 +1,73 @@
+from django.db import migrations
+
+
+TABLA_FTS = 'progreso_usuario_actividad_fts'
+
+SQL_POSTGRESQL = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    # Sirve directamente el UPPER("actividad"::text) LIKE UPPER(%s) que genera icontains
+    'CREATE INDEX IF NOT EXISTS progreso_actividad_trgm_idx '
+    'ON progreso_usuario_progresousuario USING gin (UPPER(actividad) gin_trgm_ops)',
+]
+
+SQL_POSTGRESQL_REVERSO = [
+    'DROP INDEX IF EXISTS progreso_actividad_trgm_idx',
+]
+
+SQL_SQLITE = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA_FTS} USING fts5(
+        actividad, usuario_id UNINDEXED,
+        content='progreso_usuario_progresousuario', content_rowid='id',
+        tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS progreso_actividad_fts_ai
+        AFTER INSERT ON progreso_usuario_progresousuario BEGIN
+            INSERT INTO {TABLA_FTS}(rowid, actividad, usuario_id)
+            VALUES (new.id, new.actividad, new.usuario_id);
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS progreso_actividad_fts_ad
+        AFTER DELETE ON progreso_usuario_progresousuario BEGIN
+            INSERT INTO {TABLA_FTS}({TABLA_FTS}, rowid, actividad, usuario_id)
+            VALUES ('delete', old.id, old.actividad, old.usuario_id);
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS progreso_actividad_fts_au
+        AFTER UPDATE OF actividad, usuario_id ON progreso_usuario_progresousuario BEGIN
+            INSERT INTO {TABLA_FTS}({TABLA_FTS}, rowid, actividad, usuario_id)
+            VALUES ('delete', old.id, old.actividad, old.usuario_id);
+            INSERT INTO {TABLA_FTS}(rowid, actividad, usuario_id)
+            VALUES (new.id, new.actividad, new.usuario_id);
+        END""",
+    # Indexar las filas que ya existían
+    f"INSERT INTO {TABLA_FTS}({TABLA_FTS}) VALUES ('rebuild')",
+]
+
+SQL_SQLITE_REVERSO = [
+    'DROP TRIGGER IF EXISTS progreso_actividad_fts_ai',
+    'DROP TRIGGER IF EXISTS progreso_actividad_fts_ad',
+    'DROP TRIGGER IF EXISTS progreso_actividad_fts_au',
+    f'DROP TABLE IF EXISTS {TABLA_FTS}',
+]
+
+
+def _ejecutar(schema_editor, sentencias_por_backend):
+    for sentencia in sentencias_por_backend.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sentencia, params=None)
+
+
+def crear_indices_busqueda(apps, schema_editor):
+    _ejecutar(schema_editor, {'postgresql': SQL_POSTGRESQL, 'sqlite': SQL_SQLITE})
+
+
+def eliminar_indices_busqueda(apps, schema_editor):
+    _ejecutar(schema_editor, {'postgresql': SQL_POSTGRESQL_REVERSO, 'sqlite': SQL_SQLITE_REVERSO})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('progreso_usuario', '0002_indices_consultas'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indices_busqueda, eliminar_indices_busqueda),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def poblar_resumenes(apps, schema_editor):
+    """Calcula el resumen inicial de los usuarios que ya tienen progreso"""
+    ProgresoUsuario = apps.get_model('progreso_usuario', 'ProgresoUsuario')
+    ResumenProgreso = apps.get_model('progreso_usuario', 'ResumenProgreso')
+    totales = (ProgresoUsuario.objects.order_by().values('usuario')
+               .annotate(actividades=Count('id'),
+                         completadas=Count('id', filter=Q(completado=True)),
+                         suma=Sum('progreso')))
+    resumenes = [
+        ResumenProgreso(usuario_id=fila['usuario'], actividades=fila['actividades'],
+                        completadas=fila['completadas'], suma_progreso=fila['suma'] or 0)
+        for fila in totales.iterator(chunk_size=2000)
+    ]
+    ResumenProgreso.objects.bulk_create(resumenes, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('progreso_usuario', '0003_busqueda_actividad'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenProgreso',
+            fields=[
+                ('usuario', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='resumen_progreso', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Usuario')),
+                ('actividades', models.PositiveIntegerField(default=0, verbose_name='Actividades Iniciadas')),
+                ('completadas', models.PositiveIntegerField(default=0, verbose_name='Actividades Completadas')),
+                ('suma_progreso', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Suma de Progreso')),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True, verbose_name='Última Actualización')),
+            ],
+            options={
+                'verbose_name': 'Resumen de Progreso',
+                'verbose_name_plural': 'Resúmenes de Progreso',
+            },
+        ),
+        migrations.RunPython(poblar_resumenes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:39
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('progreso_usuario', '0004_resumen_progreso'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='logprogreso',
+            name='fecha_cambio',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Fecha de Cambio'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('progreso_usuario', '0005_fecha_cambio_por_defecto'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClasificacionActividad',
+            fields=[
+                ('actividad', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='Actividad')),
+                ('entradas', models.JSONField(default=list, verbose_name='Entradas')),
+                ('completa', models.BooleanField(default=True, verbose_name='Completa')),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True, verbose_name='Última Actualización')),
+            ],
+            options={
+                'verbose_name': 'Clasificación de Actividad',
+                'verbose_name_plural': 'Clasificaciones de Actividades',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='progresousuario',
+            index=models.Index(fields=['actividad', '-progreso', 'usuario'], name='progreso_clasificacion_idx'),
+        ),
+    ]
@@ -1,11 +1,13 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 
 class ProgresoUsuario(models.Model):
     """Modelo para almacenar el progreso de los usuarios en diferentes actividades"""
     
-    usuario = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Usuario")
+    # Sin índice propio: lo cubren unique_together y los índices compuestos que empiezan por usuario
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False, verbose_name="Usuario")
     actividad = models.CharField(max_length=100, verbose_name="Actividad")
     progreso = models.DecimalField(max_digits=5, decimal_places=2, default=0.00, verbose_name="Progreso (%)")
     fecha_inicio = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Inicio")
@@ -18,6 +20,17 @@ class ProgresoUsuario(models.Model):
         verbose_name_plural = "Progresos de Usuarios"
         unique_together = ['usuario', 'actividad']
         ordering = ['-fecha_actualizacion']
+        indexes = [
+            # lista_progreso y su paginación por cursor: usuario = ? ORDER BY fecha DESC, id DESC
+            models.Index(fields=['usuario', '-fecha_actualizacion', '-id'], name='progreso_usuario_fecha_idx'),
+            # Mismo recorrido con el filtro completado (índices parciales donde el backend los soporta)
+            models.Index(fields=['usuario', '-fecha_actualizacion', '-id'], name='progreso_completado_idx',
+                         condition=models.Q(completado=True)),
+            models.Index(fields=['usuario', '-fecha_actualizacion', '-id'], name='progreso_en_curso_idx',
+                         condition=models.Q(completado=False)),
+            # Clasificación por actividad: actividad = ? ORDER BY progreso DESC, usuario
+            models.Index(fields=['actividad', '-progreso', 'usuario'], name='progreso_clasificacion_idx'),
+        ]
     
     def __str__(self):
         return f"{self.usuario.username} - {self.actividad} ({self.progreso}%)"
@@ -26,16 +39,64 @@ class ProgresoUsuario(models.Model):
 class LogProgreso(models.Model):
     """Modelo para registrar el historial de cambios en el progreso"""
     
-    progreso_usuario = models.ForeignKey(ProgresoUsuario, on_delete=models.CASCADE, related_name='logs')
+    # Sin índice propio: lo cubre log_progreso_fecha_idx
+    progreso_usuario = models.ForeignKey(ProgresoUsuario, on_delete=models.CASCADE, related_name='logs', db_index=False)
     progreso_anterior = models.DecimalField(max_digits=5, decimal_places=2, verbose_name="Progreso Anterior")
     progreso_nuevo = models.DecimalField(max_digits=5, decimal_places=2, verbose_name="Progreso Nuevo")
-    fecha_cambio = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Cambio")
+    # Se fija al construir el log y no al insertarlo, para que los logs diferidos conserven la hora del cambio
+    fecha_cambio = models.DateTimeField(default=timezone.now, editable=False, verbose_name="Fecha de Cambio")
     descripcion = models.TextField(blank=True, null=True, verbose_name="Descripción del Cambio")
     
     class Meta:
         verbose_name = "Log de Progreso"
         verbose_name_plural = "Logs de Progreso"
         ordering = ['-fecha_cambio']
+        indexes = [
+            # Historial de detalle_progreso: progreso_usuario = ? ORDER BY fecha_cambio DESC, id DESC
+            models.Index(fields=['progreso_usuario', '-fecha_cambio', '-id'], name='log_progreso_fecha_idx'),
+        ]
     
     def __str__(self):
         return f"Log {self.progreso_usuario} - {self.fecha_cambio}"
+
+
+class ResumenProgreso(models.Model):
+    """Resumen por usuario que las vistas de escritura mantienen de forma incremental"""
+    
+    usuario = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True,
+                                   related_name='resumen_progreso', verbose_name="Usuario")
+    actividades = models.PositiveIntegerField(default=0, verbose_name="Actividades Iniciadas")
+    completadas = models.PositiveIntegerField(default=0, verbose_name="Actividades Completadas")
+    suma_progreso = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Suma de Progreso")
+    fecha_actualizacion = models.DateTimeField(auto_now=True, verbose_name="Última Actualización")
+    
+    class Meta:
+        verbose_name = "Resumen de Progreso"
+        verbose_name_plural = "Resúmenes de Progreso"
+    
+    @property
+    def promedio_progreso(self):
+        if not self.actividades:
+            return 0.0
+        return float(self.suma_progreso) / self.actividades
+    
+    def __str__(self):
+        return f"Resumen de {self.usuario.username}: {self.completadas}/{self.actividades}"
+
+
+class ClasificacionActividad(models.Model):
+    """Mejores progresos de una actividad, mantenidos de forma incremental (ver clasificacion.py)"""
+    
+    actividad = models.CharField(max_length=100, primary_key=True, verbose_name="Actividad")
+    # Pares [usuario_id, progreso] ordenados por progreso descendente y usuario
+    entradas = models.JSONField(default=list, verbose_name="Entradas")
+    # True si la actividad no tiene progresos fuera de las entradas
+    completa = models.BooleanField(default=True, verbose_name="Completa")
+    fecha_actualizacion = models.DateTimeField(auto_now=True, verbose_name="Última Actualización")
+    
+    class Meta:
+        verbose_name = "Clasificación de Actividad"
+        verbose_name_plural = "Clasificaciones de Actividades"
+    
+    def __str__(self):
+        return f"Clasificación de {self.actividad} ({len(self.entradas)} entradas)"
@@ -0,0 +1,112 @@
+"""
+Mantenimiento incremental de ResumenProgreso.
+
+Las vistas de escritura llaman a estas funciones dentro de la misma
+transacción que modifica ProgresoUsuario. Los cambios se aplican como deltas
+atómicos con F(), así que escrituras concurrentes del mismo usuario no se
+pisan. reconstruir_resumenes recalcula los resúmenes desde cero para reparar
+desviaciones (ediciones desde el admin, cargas masivas, etc.).
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+from django.db.models import Count, Exists, F, OuterRef, Q, Sum
+from django.utils import timezone
+
+from .models import ProgresoUsuario, ResumenProgreso
+
+CENTESIMA = Decimal('0.01')
+
+
+def _decimal(valor):
+    """Normaliza un progreso a Decimal con dos decimales, como se guarda en la base de datos"""
+    return Decimal(str(valor)).quantize(CENTESIMA, rounding=ROUND_HALF_UP)
+
+
+def aplicar_delta(usuario_id, actividades=0, completadas=0, suma_progreso=0):
+    """Suma los deltas al resumen del usuario, creándolo si todavía no existe"""
+    suma_progreso = _decimal(suma_progreso)
+    if not (actividades or completadas or suma_progreso):
+        return
+
+    actualizados = ResumenProgreso.objects.filter(usuario_id=usuario_id).update(
+        actividades=F('actividades') + actividades,
+        completadas=F('completadas') + completadas,
+        suma_progreso=F('suma_progreso') + suma_progreso,
+        fecha_actualizacion=timezone.now()
+    )
+    if not actualizados:
+        # Sin resumen previo (progresos creados desde el admin o antes del backfill) el delta
+        # no sirve como valor inicial: se calcula desde la tabla, que ya incluye este cambio
+        reconstruir_resumenes([usuario_id])
+
+
+def registrar_creacion(progreso):
+    aplicar_delta(progreso.usuario_id, 1, int(progreso.completado), progreso.progreso)
+
+
+def registrar_cambio(usuario_id, progreso_anterior, completado_anterior, progreso_nuevo, completado_nuevo):
+    aplicar_delta(
+        usuario_id,
+        completadas=int(completado_nuevo) - int(completado_anterior),
+        suma_progreso=_decimal(progreso_nuevo) - _decimal(progreso_anterior)
+    )
+
+
+def registrar_lote(usuario_id, cambios):
+    """Aplica en un solo UPDATE los cambios (anterior, nuevo) de un lote; anterior es None si se creó"""
+    actividades = completadas = 0
+    suma_progreso = Decimal(0)
+    for anterior, nuevo in cambios:
+        completadas += int(nuevo.completado)
+        suma_progreso += _decimal(nuevo.progreso)
+        if anterior is None:
+            actividades += 1
+        else:
+            completadas -= int(anterior.completado)
+            suma_progreso -= _decimal(anterior.progreso)
+    aplicar_delta(usuario_id, actividades, completadas, suma_progreso)
+
+
+def registrar_eliminacion(progreso):
+    aplicar_delta(progreso.usuario_id, -1, -int(progreso.completado), -_decimal(progreso.progreso))
+
+
+def obtener_resumen(usuario):
+    """Lee el resumen del usuario con una única consulta por clave primaria"""
+    resumen = ResumenProgreso.objects.filter(usuario=usuario).first()
+    return resumen or ResumenProgreso(usuario=usuario)
+
+
+def reconstruir_resumenes(usuario_ids=None):
+    """Recalcula los resúmenes a partir de ProgresoUsuario; devuelve cuántos se escribieron"""
+    progresos = ProgresoUsuario.objects.order_by()
+    resumenes = ResumenProgreso.objects.all()
+    if usuario_ids is not None:
+        progresos = progresos.filter(usuario_id__in=usuario_ids)
+        resumenes = resumenes.filter(usuario_id__in=usuario_ids)
+
+    totales = progresos.values('usuario').annotate(
+        actividades=Count('id'),
+        completadas=Count('id', filter=Q(completado=True)),
+        suma=Sum('progreso')
+    )
+    ahora = timezone.now()
+    nuevos = [
+        ResumenProgreso(usuario_id=fila['usuario'], actividades=fila['actividades'],
+                        completadas=fila['completadas'], suma_progreso=fila['suma'] or 0,
+                        fecha_actualizacion=ahora)
+        for fila in totales
+    ]
+
+    with transaction.atomic():
+        # Usuarios que ya no tienen ningún progreso
+        resumenes.exclude(Exists(ProgresoUsuario.objects.filter(usuario_id=OuterRef('usuario_id')))).delete()
+        ResumenProgreso.objects.bulk_create(
+            nuevos,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['usuario'],
+            update_fields=['actividades', 'completadas', 'suma_progreso', 'fecha_actualizacion']
+        )
+    return len(nuevos)
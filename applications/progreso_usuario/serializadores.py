@@ -0,0 +1,107 @@
+"""
+Serialización de progresos y logs a partir de proyecciones.
+
+Cada Proyeccion fija los campos de una respuesta y prepara, una sola vez al
+importar el módulo, la función que convierte una tupla de ``values_list()``
+en el dict del payload (Decimal a float, fechas a ISO 8601). Las listas se
+leen como tuplas, sin instanciar modelos; las vistas que ya tienen la
+instancia (creación, edición) usan ``Proyeccion.instancia``.
+
+El codificador JSON se configura con PROGRESO_JSON_DUMPS (ruta a una
+función como ``orjson.dumps``); sin configurar se usa el de JsonResponse.
+"""
+import datetime
+import operator
+
+from django.conf import settings
+from django.db import models
+from django.http import HttpResponse, JsonResponse
+from django.utils.module_loading import import_string
+
+from applications.monitoreo.middleware import medir
+
+from .models import ProgresoUsuario, LogProgreso
+
+
+def _conversor(campo):
+    """Función que pasa el valor de un campo a un tipo JSON, o None si ya lo es"""
+    if isinstance(campo, models.DecimalField):
+        return float
+    if isinstance(campo, models.DateTimeField):
+        return datetime.datetime.isoformat
+    if isinstance(campo, models.DateField):
+        return datetime.date.isoformat
+    return None
+
+
+def _construir_fila(campos, conversores):
+    """
+    Función que convierte una tupla de values_list() en el dict del payload:
+    el dict se arma con dict(zip()) y después solo se tocan los campos que
+    necesitan conversión (los None se dejan tal cual)
+    """
+    if not conversores:
+        return lambda valores: dict(zip(campos, valores))
+
+    def fila(valores):
+        payload = dict(zip(campos, valores))
+        for nombre, conversor in conversores:
+            valor = payload[nombre]
+            if valor is not None:
+                payload[nombre] = conversor(valor)
+        return payload
+    return fila
+
+
+class Proyeccion:
+    """Campos de un payload y su conversión precalculada desde filas de values_list()"""
+
+    def __init__(self, modelo, campos):
+        self.campos = tuple(campos)
+        conversores = []
+        for nombre in self.campos:
+            conversor = _conversor(modelo._meta.get_field(nombre))
+            if conversor is not None:
+                conversores.append((nombre, conversor))
+        self.fila = _construir_fila(self.campos, tuple(conversores))
+        atributos = [modelo._meta.get_field(nombre).attname for nombre in self.campos]
+        self._atributos = operator.attrgetter(*atributos)
+        self._varios = len(atributos) > 1
+
+    def filas(self, queryset):
+        """Queryset de tuplas con los campos de la proyección"""
+        return queryset.values_list(*self.campos)
+
+    def serializar(self, filas):
+        """Convierte un iterable de tuplas de values_list() en una lista de dicts"""
+        fila = self.fila
+        return [fila(valores) for valores in filas]
+
+    def instancia(self, objeto):
+        """Convierte una instancia ya cargada del modelo"""
+        valores = self._atributos(objeto)
+        return self.fila(valores if self._varios else (valores,))
+
+
+PROGRESO = Proyeccion(ProgresoUsuario, [
+    'id', 'actividad', 'progreso', 'completado', 'fecha_inicio', 'fecha_actualizacion', 'resultado'
+])
+
+# Respuesta de actualizar_progreso
+PROGRESO_ACTUALIZADO = Proyeccion(ProgresoUsuario, ['id', 'progreso', 'completado', 'fecha_actualizacion'])
+
+# Respuesta de actualizar_progreso_lote
+PROGRESO_LOTE = Proyeccion(ProgresoUsuario, [
+    'id', 'actividad', 'progreso', 'completado', 'fecha_actualizacion', 'resultado'
+])
+
+LOG = Proyeccion(LogProgreso, ['id', 'progreso_anterior', 'progreso_nuevo', 'descripcion', 'fecha_cambio'])
+
+
+def respuesta_json(datos, status=200):
+    """JsonResponse con el codificador configurado en PROGRESO_JSON_DUMPS"""
+    ruta = getattr(settings, 'PROGRESO_JSON_DUMPS', None)
+    with medir('serializacion'):
+        if not ruta:
+            return JsonResponse(datos, status=status)
+        return HttpResponse(import_string(ruta)(datos), status=status, content_type='application/json')
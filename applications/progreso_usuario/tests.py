@@ -1,7 +1,33 @@
-from django.test import TestCase, Client
+import csv
+import gzip
+import io
+import json
+import os
+import random
+import re
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from asgiref.sync import sync_to_async
+from unittest import mock, skipUnless
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
+from django.utils import timezone
+from django.db import connection, transaction
 from django.urls import reverse
-from .models import ProgresoUsuario, LogProgreso
+from .models import ProgresoUsuario, LogProgreso, ResumenProgreso
+from .busqueda import buscar_actividades, filtrar_actividad, fts_disponible
+from .resumen import reconstruir_resumenes
+from . import exportacion
+from .buffer_logs import BufferLogs, registrar_logs
+from .serializadores import LOG, PROGRESO
+from .compactacion import compactar_logs
+from .clasificacion import _calcular, obtener_clasificacion, registrar_cambios
+from .models import ClasificacionActividad
+from applications.Usuarios.models import Usuario
 
 
 class ProgresoUsuarioModelTest(TestCase):
@@ -139,3 +165,1010 @@ class LogProgresoTest(TestCase):
         self.assertEqual(log.progreso_anterior, 50.00)
         self.assertEqual(log.progreso_nuevo, 75.00)
         self.assertEqual(log.descripcion, 'Progreso actualizado')
+
+
+class ActualizacionLoteTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.progreso = ProgresoUsuario.objects.create(
+            usuario=self.user,
+            actividad='Aprender Django',
+            progreso=50.00
+        )
+        self.client.login(username='testuser', password='testpass123')
+
+    def _enviar_lote(self, elementos):
+        return self.client.post(
+            reverse('progreso_usuario:lote'),
+            json.dumps({'progresos': elementos}),
+            content_type='application/json'
+        )
+
+    def test_lote_crea_y_actualiza(self):
+        """Test que el lote inserta actividades nuevas y actualiza las existentes"""
+        response = self._enviar_lote([
+            {'actividad': 'Aprender Django', 'progreso': 100},
+            {'actividad': 'Aprender Python', 'progreso': 30, 'resultado': 'Inicio'},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['creados'], 1)
+        self.assertEqual(data['actualizados'], 1)
+
+        self.progreso.refresh_from_db()
+        self.assertEqual(self.progreso.progreso, 100)
+        self.assertTrue(self.progreso.completado)
+        nuevo = ProgresoUsuario.objects.get(usuario=self.user, actividad='Aprender Python')
+        self.assertEqual(nuevo.resultado, 'Inicio')
+        self.assertEqual({p['id'] for p in data['progresos']}, {self.progreso.pk, nuevo.pk})
+
+        log = LogProgreso.objects.get(progreso_usuario=self.progreso)
+        self.assertEqual(log.progreso_anterior, 50)
+        self.assertEqual(log.progreso_nuevo, 100)
+        self.assertFalse(LogProgreso.objects.filter(progreso_usuario=nuevo).exists())
+
+    def test_lote_numero_constante_de_consultas(self):
+        """Test que el número de consultas no depende del tamaño del lote"""
+        self._enviar_lote([
+            {'actividad': f'Actividad {i}', 'progreso': 10} for i in range(40)
+        ])
+        with CaptureQueriesContext(connection) as pequeno:
+            self._enviar_lote([
+                {'actividad': f'Actividad {i}', 'progreso': 20} for i in range(2)
+            ])
+        with CaptureQueriesContext(connection) as grande:
+            self._enviar_lote([
+                {'actividad': f'Actividad {i}', 'progreso': 30} for i in range(40)
+            ])
+
+        self.assertEqual(len(pequeno), len(grande))
+        self.assertEqual(LogProgreso.objects.filter(progreso_usuario__usuario=self.user).count(), 42)
+
+    def test_lote_elemento_invalido(self):
+        """Test que un elemento sin progreso invalida el lote completo"""
+        response = self._enviar_lote([
+            {'actividad': 'Aprender Python', 'progreso': 30},
+            {'actividad': 'Aprender Go'},
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ProgresoUsuario.objects.filter(actividad='Aprender Python').exists())
+
+    def test_crear_valida_con_la_misma_regla(self):
+        """Test que crear_progreso rechaza el mismo progreso fuera de rango que el lote"""
+        response = self.client.post(reverse('progreso_usuario:crear'),
+                                    json.dumps({'actividad': 'Aprender Go', 'progreso': 150}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ProgresoUsuario.objects.filter(actividad='Aprender Go').exists())
+
+    def test_lote_valida_cada_elemento(self):
+        """Test que un progreso fuera de rango o una actividad demasiado larga devuelven 400 sin escribir"""
+        for invalido in ({'actividad': 'Aprender Go', 'progreso': 150},
+                         {'actividad': 'Aprender Go', 'progreso': -1},
+                         {'actividad': 'x' * 101, 'progreso': 10}):
+            with CaptureQueriesContext(connection) as consultas:
+                response = self._enviar_lote([{'actividad': 'Aprender Python', 'progreso': 30}, invalido])
+            self.assertEqual(response.status_code, 400, invalido)
+            self.assertIn('Elemento 1', response.json()['message'])
+            self.assertFalse([q for q in consultas if 'progreso_usuario_progresousuario' in q['sql']])
+        self.assertFalse(ProgresoUsuario.objects.filter(actividad='Aprender Python').exists())
+
+
+class PaginacionCursorTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        for i in range(25):
+            ProgresoUsuario.objects.create(
+                usuario=self.user,
+                actividad=f'Actividad {i}',
+                progreso=i
+            )
+        self.client.login(username='testuser', password='testpass123')
+
+    def _recorrer(self, **params):
+        ids = []
+        cursor = ''
+        while True:
+            response = self.client.get(reverse('progreso_usuario:lista'), {'cursor': cursor, **params})
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            ids.extend(p['id'] for p in data['progresos'])
+            cursor = data['pagination']['next_cursor']
+            if not data['pagination']['has_next']:
+                self.assertIsNone(cursor)
+                return ids
+
+    def test_recorrido_completo_con_cursor(self):
+        """Test que el cursor recorre todos los progresos en orden sin repetir"""
+        ids = self._recorrer()
+        esperados = list(ProgresoUsuario.objects.filter(usuario=self.user)
+                         .order_by('-fecha_actualizacion', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, esperados)
+
+    def test_cursor_con_fechas_empatadas(self):
+        """Test que el id desempata filas con la misma fecha de actualización"""
+        primero = ProgresoUsuario.objects.filter(usuario=self.user).first()
+        ProgresoUsuario.objects.filter(usuario=self.user).update(
+            fecha_actualizacion=primero.fecha_actualizacion
+        )
+        ids = self._recorrer()
+        self.assertEqual(len(ids), 25)
+        self.assertEqual(ids, sorted(ids, reverse=True))
+
+    def test_total_opcional(self):
+        """Test que el total solo se incluye cuando se solicita"""
+        response = self.client.get(reverse('progreso_usuario:lista'), {'cursor': ''})
+        self.assertIsNone(response.json()['pagination']['total_items'])
+        response = self.client.get(reverse('progreso_usuario:lista'), {'cursor': '', 'incluir_total': 'true'})
+        self.assertEqual(response.json()['pagination']['total_items'], 25)
+
+    def test_cursor_invalido(self):
+        """Test que un cursor malformado devuelve 400"""
+        response = self.client.get(reverse('progreso_usuario:lista'), {'cursor': 'no-es-un-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'El plan esperado depende del planificador de SQLite')
+class IndicesConsultasTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.progreso = ProgresoUsuario.objects.create(
+            usuario=self.user,
+            actividad='Aprender Django',
+            progreso=50.00
+        )
+
+    def test_lista_usa_indice_compuesto(self):
+        """Test que la consulta de lista_progreso se resuelve con el índice por fecha"""
+        plan = ProgresoUsuario.objects.filter(usuario=self.user)[:10].explain()
+        self.assertIn('progreso_usuario_fecha_idx', plan)
+
+    def test_filtro_completado_usa_indice_parcial(self):
+        """Test que el filtro por completado usa el índice parcial correspondiente"""
+        plan = ProgresoUsuario.objects.filter(usuario=self.user, completado=False)[:10].explain()
+        self.assertIn('progreso_en_curso_idx', plan)
+
+    def test_logs_usan_indice_por_fecha(self):
+        """Test que el historial de logs se lee con el índice (progreso_usuario, fecha_cambio)"""
+        plan = LogProgreso.objects.filter(progreso_usuario=self.progreso).explain()
+        self.assertIn('log_progreso_fecha_idx', plan)
+
+
+class BusquedaActividadTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.otro = User.objects.create_user(username='otro', password='testpass123')
+        for actividad in ['Aprender Django', 'Django avanzado', 'Matemáticas', 'Historia']:
+            ProgresoUsuario.objects.create(usuario=self.user, actividad=actividad, progreso=10)
+        ProgresoUsuario.objects.create(usuario=self.otro, actividad='Django para otros', progreso=10)
+        self.client.login(username='testuser', password='testpass123')
+
+    def _actividades(self, queryset):
+        return sorted(queryset.values_list('actividad', flat=True))
+
+    def test_filtro_por_subcadena(self):
+        """Test que el filtro encuentra subcadenas sin distinguir mayúsculas"""
+        if connection.vendor == 'sqlite':
+            self.assertTrue(fts_disponible())
+        progresos = ProgresoUsuario.objects.filter(usuario=self.user)
+        self.assertEqual(self._actividades(filtrar_actividad(progresos, 'djan')),
+                         ['Aprender Django', 'Django avanzado'])
+        self.assertEqual(self._actividades(filtrar_actividad(progresos, 'to')), ['Historia'])
+
+    def test_indice_sigue_cambios(self):
+        """Test que el índice refleja renombres y eliminaciones"""
+        progreso = ProgresoUsuario.objects.get(actividad='Historia')
+        progreso.actividad = 'Historia del arte'
+        progreso.save()
+        ProgresoUsuario.objects.filter(actividad='Matemáticas').delete()
+
+        progresos = ProgresoUsuario.objects.filter(usuario=self.user)
+        self.assertEqual(self._actividades(filtrar_actividad(progresos, 'arte')), ['Historia del arte'])
+        self.assertFalse(filtrar_actividad(progresos, 'temát').exists())
+
+    def test_busqueda_ordena_prefijos_primero(self):
+        """Test que las actividades que empiezan por el término aparecen primero"""
+        resultados = buscar_actividades('django', usuario=self.user)
+        self.assertEqual([p.actividad for p in resultados], ['Django avanzado', 'Aprender Django'])
+
+    def test_vista_buscar(self):
+        """Test que la vista de búsqueda solo devuelve actividades del usuario"""
+        response = self.client.get(reverse('progreso_usuario:buscar'), {'q': 'django'})
+        self.assertEqual(response.status_code, 200)
+        actividades = [p['actividad'] for p in response.json()['progresos']]
+        self.assertNotIn('Django para otros', actividades)
+        self.assertEqual(len(actividades), 2)
+
+        response = self.client.get(reverse('progreso_usuario:buscar'))
+        self.assertEqual(response.status_code, 400)
+
+
+class HistorialLogsTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.progreso = ProgresoUsuario.objects.create(
+            usuario=self.user,
+            actividad='Aprender Django',
+            progreso=50.00
+        )
+        LogProgreso.objects.bulk_create([
+            LogProgreso(progreso_usuario=self.progreso, progreso_anterior=i, progreso_nuevo=i + 1)
+            for i in range(60)
+        ])
+        self.client.login(username='testuser', password='testpass123')
+
+    def test_detalle_limita_logs_embebidos(self):
+        """Test que el detalle solo incluye los logs más recientes"""
+        response = self.client.get(reverse('progreso_usuario:detalle', args=[self.progreso.pk]))
+        progreso = response.json()['progreso']
+        self.assertEqual(len(progreso['logs']), 20)
+        self.assertTrue(progreso['hay_mas_logs'])
+
+    def test_logs_paginados_por_cursor(self):
+        """Test que el endpoint de logs recorre todo el historial sin repetir"""
+        ids = []
+        params = {'limite': 25}
+        while True:
+            response = self.client.get(reverse('progreso_usuario:logs', args=[self.progreso.pk]), params)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            ids.extend(log['id'] for log in data['logs'])
+            if not data['pagination']['has_next']:
+                break
+            params['cursor'] = data['pagination']['next_cursor']
+
+        self.assertEqual(len(ids), 60)
+        self.assertEqual(len(set(ids)), 60)
+
+    def test_logs_filtrados_por_fecha(self):
+        """Test que los filtros desde/hasta acotan el historial"""
+        antiguo = LogProgreso.objects.order_by('id').first()
+        LogProgreso.objects.filter(pk=antiguo.pk).update(fecha_cambio='2020-01-01T00:00:00Z')
+        url = reverse('progreso_usuario:logs', args=[self.progreso.pk])
+
+        response = self.client.get(url, {'hasta': '2021-01-01'})
+        self.assertEqual([log['id'] for log in response.json()['logs']], [antiguo.pk])
+        response = self.client.get(url, {'desde': '2021-01-01', 'limite': 200})
+        self.assertEqual(len(response.json()['logs']), 59)
+        response = self.client.get(url, {'desde': 'ayer'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_logs_de_otro_usuario(self):
+        """Test que no se pueden leer los logs de otro usuario"""
+        User.objects.create_user(username='otro', password='testpass123')
+        self.client.login(username='otro', password='testpass123')
+        response = self.client.get(reverse('progreso_usuario:logs', args=[self.progreso.pk]))
+        self.assertEqual(response.status_code, 404)
+
+
+class ResumenProgresoTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.client.login(username='testuser', password='testpass123')
+
+    def _post(self, nombre, data, args=None):
+        return self.client.post(reverse(f'progreso_usuario:{nombre}', args=args),
+                                json.dumps(data), content_type='application/json')
+
+    def _resumen(self):
+        return self.client.get(reverse('progreso_usuario:resumen')).json()['resumen']
+
+    def test_resumen_sigue_las_escrituras(self):
+        """Test que crear, editar, actualizar, lote y eliminar mantienen el resumen"""
+        self.assertEqual(self._resumen()['actividades'], 0)
+
+        primero = self._post('crear', {'actividad': 'Aprender Django', 'progreso': 40}).json()['progreso']
+        segundo = self._post('crear', {'actividad': 'Aprender Python', 'progreso': 100}).json()['progreso']
+        self._post('editar', {'progreso': 60}, args=[primero['id']])
+        self._post('actualizar', {'progreso': 50}, args=[segundo['id']])
+        self._post('lote', {'progresos': [
+            {'actividad': 'Aprender Django', 'progreso': 100},
+            {'actividad': 'Aprender Go', 'progreso': 20},
+        ]})
+        self._post('eliminar', {}, args=[segundo['id']])
+
+        self.assertEqual(self._resumen(), {
+            'actividades': 2,
+            'completadas': 1,
+            'en_progreso': 1,
+            'promedio_progreso': 60.0
+        })
+
+        reconstruir_resumenes()
+        self.assertEqual(self._resumen()['promedio_progreso'], 60.0)
+
+    def test_reconstruir_repara_desviaciones(self):
+        """Test que la reconstrucción corrige resúmenes desviados y elimina huérfanos"""
+        ProgresoUsuario.objects.create(usuario=self.user, actividad='Aprender Django', progreso=100, completado=True)
+        otro = User.objects.create_user(username='otro', password='testpass123')
+        ResumenProgreso.objects.create(usuario=self.user, actividades=7, completadas=0, suma_progreso=3)
+        ResumenProgreso.objects.create(usuario=otro, actividades=1, completadas=1, suma_progreso=100)
+
+        self.assertEqual(reconstruir_resumenes(), 1)
+        resumen = ResumenProgreso.objects.get(usuario=self.user)
+        self.assertEqual((resumen.actividades, resumen.completadas, resumen.suma_progreso), (1, 1, 100))
+        self.assertFalse(ResumenProgreso.objects.filter(usuario=otro).exists())
+
+    def test_eliminar_sin_resumen_previo(self):
+        """Test que eliminar un progreso de un usuario sin resumen lo calcula desde la tabla"""
+        primero = ProgresoUsuario.objects.create(usuario=self.user, actividad='Aprender Django', progreso=100,
+                                                 completado=True)
+        ProgresoUsuario.objects.create(usuario=self.user, actividad='Aprender Python', progreso=40)
+        self.assertFalse(ResumenProgreso.objects.exists())
+
+        response = self._post('eliminar', {}, args=[primero.id])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._resumen(), {
+            'actividades': 1,
+            'completadas': 0,
+            'en_progreso': 1,
+            'promedio_progreso': 40.0
+        })
+
+
+class VistasAsincronasTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        for i in range(12):
+            ProgresoUsuario.objects.create(usuario=self.user, actividad=f'Actividad {i}', progreso=i * 5)
+
+    async def _post(self, nombre, data, args=None):
+        return await self.async_client.post(reverse(f'progreso_usuario:{nombre}', args=args),
+                                            json.dumps(data), content_type='application/json')
+
+    async def test_lista_coincide_con_la_sincrona(self):
+        """Test que la lista asíncrona devuelve lo mismo que la síncrona en ambos modos de paginación"""
+        await self.async_client.aforce_login(self.user)
+        await sync_to_async(self.client.force_login)(self.user)
+        for params in ({'page': 2}, {'cursor': ''}, {'actividad': 'Actividad 1', 'completado': 'false'}):
+            asincrona = await self.async_client.get(reverse('progreso_usuario:lista_async'), params)
+            sincrona = await sync_to_async(self.client.get)(reverse('progreso_usuario:lista'), params)
+            self.assertEqual(asincrona.status_code, 200)
+            self.assertEqual(asincrona.json(), sincrona.json())
+
+    async def test_detalle_y_usuario_ajeno(self):
+        """Test que el detalle asíncrono incluye los logs y no expone progresos de otros usuarios"""
+        progreso = await ProgresoUsuario.objects.filter(usuario=self.user).afirst()
+        otro = await User.objects.acreate(username='otro')
+        await self.async_client.aforce_login(otro)
+        response = await self.async_client.get(reverse('progreso_usuario:detalle_async', args=[progreso.id]))
+        self.assertEqual(response.status_code, 404)
+
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('progreso_usuario:detalle_async', args=[progreso.id]))
+        self.assertEqual(response.json()['progreso']['id'], progreso.id)
+        self.assertEqual(response.json()['progreso']['logs'], [])
+
+    async def test_peticiones_condicionales(self):
+        """Test que la lista y el detalle asíncronos envían el mismo ETag que los síncronos y responden 304"""
+        progreso = await ProgresoUsuario.objects.filter(usuario=self.user).afirst()
+        await self.async_client.aforce_login(self.user)
+        await sync_to_async(self.client.force_login)(self.user)
+        for asincrona, sincrona in ((reverse('progreso_usuario:lista_async'), reverse('progreso_usuario:lista')),
+                                    (reverse('progreso_usuario:detalle_async', args=[progreso.id]),
+                                     reverse('progreso_usuario:detalle', args=[progreso.id]))):
+            etag = (await self.async_client.get(asincrona))['ETag']
+            self.assertEqual(etag, (await sync_to_async(self.client.get)(sincrona))['ETag'])
+            response = await self.async_client.get(asincrona, headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b'')
+
+        await self._post('actualizar_async', {'progreso': 90}, args=[progreso.id])
+        response = await self.async_client.get(asincrona, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    async def test_crear_y_actualizar_mantienen_resumen(self):
+        """Test que las escrituras asíncronas crean el log y actualizan el resumen"""
+        await self.async_client.aforce_login(self.user)
+        response = await self._post('crear_async', {'actividad': 'Aprender Django', 'progreso': 40})
+        self.assertEqual(response.status_code, 201)
+        pk = response.json()['progreso']['id']
+
+        response = await self._post('actualizar_async', {'progreso': 100}, args=[pk])
+        self.assertTrue(response.json()['data']['completado'])
+        self.assertEqual(await LogProgreso.objects.filter(progreso_usuario_id=pk).acount(), 1)
+
+        # Los progresos de setUp no pasaron por las vistas: el resumen se calcula desde la tabla
+        resumen = await ResumenProgreso.objects.aget(usuario=self.user)
+        self.assertEqual((resumen.actividades, resumen.completadas), (13, 1))
+
+        response = await self._post('actualizar_async', {'progreso': 'abc'}, args=[pk])
+        self.assertEqual(response.status_code, 400)
+        response = await self._post('actualizar_async', {'progreso': 10}, args=[pk + 1000])
+        self.assertEqual(response.status_code, 404)
+
+
+class LogsDiferidosTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.progreso = ProgresoUsuario.objects.create(usuario=self.user, actividad='Aprender Django', progreso=10)
+        self.client.login(username='testuser', password='testpass123')
+        # Sin hilo: los volcados se disparan a mano o por max_pendientes
+        self.buffer = BufferLogs(lote=100, intervalo=3600, max_pendientes=3)
+        parche = mock.patch('applications.progreso_usuario.buffer_logs.obtener_buffer', return_value=self.buffer)
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def _log(self, valor):
+        return LogProgreso(progreso_usuario=self.progreso, progreso_anterior=0, progreso_nuevo=valor)
+
+    def _actualizar(self, valor):
+        return self.client.post(reverse('progreso_usuario:actualizar', args=[self.progreso.id]),
+                                json.dumps({'progreso': valor}), content_type='application/json')
+
+    def test_desactivado_escribe_en_la_peticion(self):
+        """Test que por defecto el log se inserta en la misma transacción"""
+        self._actualizar(50)
+        self.assertEqual(LogProgreso.objects.filter(progreso_usuario=self.progreso).count(), 1)
+        self.assertEqual(len(self.buffer), 0)
+
+    @override_settings(PROGRESO_LOGS_DIFERIDOS=True)
+    def test_encola_al_confirmar_y_conserva_la_fecha(self):
+        """Test que en modo diferido el log se encola tras el commit y se vuelca con su hora original"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self._actualizar(50)
+        self.assertFalse(LogProgreso.objects.exists())
+        self.assertEqual(len(self.buffer), 1)
+        fecha = self.buffer._pendientes[0].fecha_cambio
+
+        self.assertEqual(self.buffer.volcar(), 1)
+        log = LogProgreso.objects.get()
+        self.assertEqual((log.progreso_nuevo, log.fecha_cambio), (50, fecha))
+
+    @override_settings(PROGRESO_LOGS_DIFERIDOS=True)
+    def test_transaccion_revertida_no_encola(self):
+        """Test que los logs de una transacción revertida nunca llegan a la cola"""
+        with self.captureOnCommitCallbacks() as callbacks:
+            try:
+                with transaction.atomic():
+                    registrar_logs([self._log(20)])
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(callbacks, [])
+
+    def test_cola_llena_vuelca_en_el_llamador(self):
+        """Test que al alcanzar max_pendientes la cola se vuelca sin esperar al hilo"""
+        self.buffer.agregar([self._log(20), self._log(30)])
+        self.assertEqual(len(self.buffer), 2)
+        self.buffer.agregar([self._log(40)])
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(LogProgreso.objects.count(), 3)
+
+    def test_detener_vuelca_lo_pendiente(self):
+        """Test que al cerrar el proceso se escriben los logs encolados"""
+        self.buffer.agregar([self._log(20)])
+        self.buffer.detener()
+        self.assertEqual(LogProgreso.objects.count(), 1)
+
+
+class ConsultaCondicionalTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.progreso = ProgresoUsuario.objects.create(usuario=self.user, actividad='Aprender Django', progreso=10)
+        self.otro = ProgresoUsuario.objects.create(usuario=self.user, actividad='Aprender Python', progreso=20)
+        self.client.login(username='testuser', password='testpass123')
+
+    def _actualizar(self, valor):
+        self.client.post(reverse('progreso_usuario:actualizar', args=[self.progreso.id]),
+                         json.dumps({'progreso': valor}), content_type='application/json')
+
+    def test_lista_responde_304_sin_serializar(self):
+        """Test que la lista sin cambios responde 304 con una sola consulta de progresos"""
+        url = reverse('progreso_usuario:lista')
+        etag = self.client.get(url)['ETag']
+
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(len([q for q in consultas if 'progreso_usuario_' in q['sql']]), 1)
+
+        # Otros parámetros son otra representación
+        self.assertEqual(self.client.get(url, {'page': 2}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_lista_cambia_etag_al_editar_o_eliminar(self):
+        """Test que actualizar o eliminar un progreso invalida el ETag de la lista"""
+        url = reverse('progreso_usuario:lista')
+        etag = self.client.get(url)['ETag']
+        self._actualizar(30)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        etag = self.client.get(url)['ETag']
+        self.client.post(reverse('progreso_usuario:eliminar', args=[self.otro.id]))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['progresos']), 1)
+
+    def test_detalle_etag(self):
+        """Test que el detalle admite If-None-Match y cambia al actualizar"""
+        url = reverse('progreso_usuario:detalle', args=[self.progreso.id])
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertFalse(response.has_header('Last-Modified'))
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self._actualizar(30)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['progreso']['logs']), 1)
+
+
+class SerializadoresTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.progreso = ProgresoUsuario.objects.create(usuario=self.user, actividad='Aprender Django',
+                                                       progreso=42.5, resultado='Notas')
+        self.client.login(username='testuser', password='testpass123')
+
+    def test_proyeccion_desde_tuplas_e_instancias(self):
+        """Test que la proyección da el mismo payload desde values_list() y desde la instancia"""
+        self.progreso.refresh_from_db()
+        esperado = {
+            'id': self.progreso.id,
+            'actividad': 'Aprender Django',
+            'progreso': 42.5,
+            'completado': False,
+            'fecha_inicio': self.progreso.fecha_inicio.isoformat(),
+            'fecha_actualizacion': self.progreso.fecha_actualizacion.isoformat(),
+            'resultado': 'Notas'
+        }
+        self.assertEqual(PROGRESO.serializar(PROGRESO.filas(ProgresoUsuario.objects.all())), [esperado])
+        self.assertEqual(PROGRESO.instancia(self.progreso), esperado)
+
+        log = LogProgreso.objects.create(progreso_usuario=self.progreso, progreso_anterior=10, progreso_nuevo=42.5)
+        self.assertEqual(LOG.instancia(log)['descripcion'], None)
+        self.assertEqual(LOG.serializar(LOG.filas(LogProgreso.objects.all()))[0]['progreso_nuevo'], 42.5)
+
+    @override_settings(PROGRESO_JSON_DUMPS='json.dumps')
+    def test_codificador_configurable(self):
+        """Test que PROGRESO_JSON_DUMPS sustituye al codificador de JsonResponse"""
+        response = self.client.get(reverse('progreso_usuario:lista'))
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.json()['progresos'][0]['progreso'], 42.5)
+
+
+class ExportacionTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.otro = User.objects.create_user(username='otro', password='testpass123')
+        for i in range(3):
+            progreso = ProgresoUsuario.objects.create(usuario=self.user, actividad=f'Actividad, {i}', progreso=10 * i)
+            LogProgreso.objects.create(progreso_usuario=progreso, progreso_anterior=0, progreso_nuevo=10 * i)
+        ProgresoUsuario.objects.create(usuario=self.otro, actividad='Ajena', progreso=5)
+        ProgresoUsuario.objects.filter(actividad='Actividad, 0').update(fecha_actualizacion='2024-01-01T00:00:00Z')
+        self.client.login(username='testuser', password='testpass123')
+
+    def _contenido(self, response):
+        contenido = b''.join(response.streaming_content)
+        if response['Content-Type'] == 'application/gzip':
+            contenido = gzip.decompress(contenido)
+        return contenido.decode()
+
+    def test_exportar_csv_del_usuario(self):
+        """Test que el CSV en streaming solo incluye los progresos del usuario"""
+        response = self.client.get(reverse('progreso_usuario:exportar', args=['progresos']))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment; filename="progresos-', response['Content-Disposition'])
+
+        filas = list(csv.DictReader(io.StringIO(self._contenido(response))))
+        self.assertEqual([fila['actividad'] for fila in filas], ['Actividad, 0', 'Actividad, 1', 'Actividad, 2'])
+        self.assertEqual(filas[2]['progreso'], '20.0')
+
+    def test_exportar_ndjson_gzip_con_fechas(self):
+        """Test del NDJSON comprimido y filtrado por rango de fechas"""
+        response = self.client.get(reverse('progreso_usuario:exportar', args=['progresos']), {
+            'formato': 'ndjson', 'gzip': 'true', 'desde': '2024-01-01', 'hasta': '2024-01-02'
+        })
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        lineas = self._contenido(response).splitlines()
+        self.assertEqual([json.loads(linea)['actividad'] for linea in lineas], ['Actividad, 0'])
+
+        response = self.client.get(reverse('progreso_usuario:exportar', args=['logs']), {'formato': 'ndjson'})
+        self.assertEqual(len(self._contenido(response).splitlines()), 3)
+
+    def test_exportar_toda_la_institucion(self):
+        """Test que solo el personal puede exportar datos de otros usuarios"""
+        url = reverse('progreso_usuario:exportar', args=['progresos'])
+        self.assertEqual(self.client.get(url, {'todos': 'true'}).status_code, 403)
+        self.assertEqual(self.client.get(url, {'formato': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'desde': 'ayer'}).status_code, 400)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(url, {'todos': 'true', 'formato': 'ndjson'})
+        self.assertEqual(len(self._contenido(response).splitlines()), 4)
+        response = self.client.get(url, {'usuario': self.otro.id, 'formato': 'ndjson'})
+        self.assertEqual(json.loads(self._contenido(response))['actividad'], 'Ajena')
+
+    async def test_exportar_en_streaming_bajo_asgi(self):
+        """Test que bajo ASGI la respuesta es asíncrona y entrega los bloques a medida que se generan"""
+        await self.async_client.aforce_login(self.user)
+        with mock.patch.object(exportacion, 'TAMANO_BLOQUE', 1):
+            response = await self.async_client.get(reverse('progreso_usuario:exportar', args=['progresos']),
+                                                   {'formato': 'ndjson'})
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.is_async)
+            bloques = [bloque async for bloque in response.streaming_content]
+        self.assertEqual(len(bloques), 3)
+        self.assertEqual([json.loads(bloque)['actividad'] for bloque in bloques],
+                         ['Actividad, 0', 'Actividad, 1', 'Actividad, 2'])
+
+    def test_comando_exportar_progreso(self):
+        """Test del comando exportar_progreso escribiendo a un archivo gzip"""
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta = os.path.join(directorio, 'logs.csv.gz')
+            call_command('exportar_progreso', 'logs', '--gzip', '--usuario', str(self.user.id),
+                         '--salida', ruta, stdout=io.StringIO())
+            with gzip.open(ruta, 'rt') as archivo:
+                filas = list(csv.DictReader(archivo))
+        self.assertEqual(len(filas), 3)
+        self.assertEqual(set(filas[0]), {'id', 'progreso_usuario', 'progreso_anterior', 'progreso_nuevo',
+                                         'descripcion', 'fecha_cambio'})
+
+
+class CompactacionLogsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.progreso = ProgresoUsuario.objects.create(usuario=self.user, actividad='Aprender Django', progreso=90)
+        self.otro = ProgresoUsuario.objects.create(usuario=self.user, actividad='Aprender SQL', progreso=30)
+        self.limite = datetime(2024, 3, 1, tzinfo=dt_timezone.utc)
+
+    def _log(self, progreso, fecha, anterior, nuevo):
+        return LogProgreso.objects.create(progreso_usuario=progreso, fecha_cambio=fecha,
+                                          progreso_anterior=anterior, progreso_nuevo=nuevo)
+
+    def _historial(self, progreso):
+        return list(progreso.logs.order_by('fecha_cambio').values_list('progreso_anterior', 'progreso_nuevo'))
+
+    def test_compacta_por_dia_y_progreso(self):
+        """Test que cada día antiguo queda en un log con el primer anterior y el último nuevo"""
+        dia = datetime(2024, 1, 10, 8, tzinfo=dt_timezone.utc)
+        for i in range(5):
+            self._log(self.progreso, dia + timedelta(hours=i), 10 * i, 10 * (i + 1))
+        self._log(self.progreso, dia + timedelta(days=1), 50, 60)
+        self._log(self.otro, dia, 0, 10)
+        self._log(self.otro, dia + timedelta(minutes=5), 10, 30)
+        reciente = [self._log(self.progreso, self.limite + timedelta(hours=i), 60, 90) for i in range(2)]
+
+        # Lotes pequeños para que los grupos se partan entre lotes
+        totales = compactar_logs(self.limite, lote=2)
+        self.assertEqual(totales, {'leidos': 8, 'grupos': 2, 'borrados': 5})
+
+        self.assertEqual([(float(a), float(n)) for a, n in self._historial(self.progreso)],
+                         [(0, 50), (50, 60), (60, 90), (60, 90)])
+        self.assertEqual([(float(a), float(n)) for a, n in self._historial(self.otro)], [(0, 30)])
+        resumen = self.progreso.logs.order_by('fecha_cambio').first()
+        self.assertEqual(resumen.descripcion, 'Resumen del 2024-01-10: 5 cambios')
+        self.assertEqual(resumen.fecha_cambio, dia + timedelta(hours=4))
+        self.assertEqual(LogProgreso.objects.filter(id__in=[log.id for log in reciente]).count(), 2)
+
+        # Una segunda pasada no encuentra nada que compactar
+        self.assertEqual(compactar_logs(self.limite, lote=2)['borrados'], 0)
+
+    def test_compactar_cambia_el_etag_del_detalle(self):
+        """Test que compactar cambia el ETag del detalle sin tocar fecha_actualizacion ni el orden de la lista"""
+        for i in range(3):
+            self._log(self.progreso, datetime(2024, 1, 1, i, tzinfo=dt_timezone.utc), i, i + 1)
+        self.client.login(username='testuser', password='testpass123')
+        url = reverse('progreso_usuario:detalle', args=[self.progreso.id])
+        etag = self.client.get(url)['ETag']
+        fechas = dict(ProgresoUsuario.objects.values_list('id', 'fecha_actualizacion'))
+        orden = [p['id'] for p in self.client.get(reverse('progreso_usuario:lista')).json()['progresos']]
+
+        compactar_logs(self.limite)
+        self.assertEqual(self.progreso.logs.count(), 1)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(dict(ProgresoUsuario.objects.values_list('id', 'fecha_actualizacion')), fechas)
+        self.assertEqual([p['id'] for p in self.client.get(reverse('progreso_usuario:lista')).json()['progresos']],
+                         orden)
+
+    def test_dia_con_mas_logs_que_el_lote(self):
+        """Test que un día con más logs que el lote se borra en DELETE de como mucho `lote` filas"""
+        dia = datetime(2024, 1, 10, 8, tzinfo=dt_timezone.utc)
+        for i in range(10):
+            self._log(self.progreso, dia + timedelta(minutes=i), i, i + 1)
+
+        with CaptureQueriesContext(connection) as consultas:
+            totales = compactar_logs(self.limite, lote=3)
+        self.assertEqual(totales, {'leidos': 10, 'grupos': 1, 'borrados': 9})
+
+        borrados = [re.search(r'IN \(([^)]*)\)', q['sql']).group(1).split(',')
+                    for q in consultas if q['sql'].startswith('DELETE')]
+        self.assertEqual([len(ids) for ids in borrados], [2, 3, 3, 1])
+        resumen = self.progreso.logs.get()
+        self.assertEqual((float(resumen.progreso_anterior), float(resumen.progreso_nuevo)), (0, 10))
+        self.assertEqual(resumen.descripcion, 'Resumen del 2024-01-10: 10 cambios')
+
+    def test_simular_no_escribe(self):
+        """Test que --simular calcula los borrados sin tocar la tabla"""
+        for i in range(3):
+            self._log(self.progreso, datetime(2024, 1, 1, i, tzinfo=dt_timezone.utc), i, i + 1)
+        salida = io.StringIO()
+        call_command('compactar_logs', '--dias', '1', '--simular', stdout=salida)
+        self.assertIn('2 logs a borrar', salida.getvalue())
+        self.assertEqual(LogProgreso.objects.count(), 3)
+
+        call_command('compactar_logs', '--dias', '1', stdout=io.StringIO())
+        self.assertEqual(LogProgreso.objects.count(), 1)
+
+
+class AnaliticaProgresoTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        otro = User.objects.create_user(username='otro', password='testpass123')
+        self.progreso = ProgresoUsuario.objects.create(usuario=self.user, actividad='Aprender Django', progreso=60)
+        ajeno = ProgresoUsuario.objects.create(usuario=otro, actividad='Aprender Django', progreso=50)
+        dia = datetime(2024, 1, 1, 10, tzinfo=dt_timezone.utc)
+        for i, (anterior, nuevo) in enumerate([(0, 10), (10, 30), (30, 40), (40, 60)]):
+            LogProgreso.objects.create(progreso_usuario=self.progreso, fecha_cambio=dia + timedelta(days=i // 2),
+                                       progreso_anterior=anterior, progreso_nuevo=nuevo)
+        LogProgreso.objects.create(progreso_usuario=ajeno, fecha_cambio=dia, progreso_anterior=0, progreso_nuevo=50)
+        self.url = reverse('progreso_usuario:analitica')
+        self.client.login(username='testuser', password='testpass123')
+
+    def test_serie_diaria_del_usuario(self):
+        """Test de las series por día con el avance acumulado calculado por ventana"""
+        response = self.client.get(self.url, {'desde': '2024-01-01', 'hasta': '2024-01-04'})
+        self.assertEqual(response.status_code, 200)
+        series = response.json()['series']
+        self.assertEqual(series['timestamps'], ['2024-01-01T00:00:00+00:00', '2024-01-02T00:00:00+00:00'])
+        self.assertEqual(series['cambios'], [2, 2])
+        self.assertEqual(series['progreso_maximo'], [30.0, 60.0])
+        self.assertEqual(series['avance'], [30.0, 30.0])
+        self.assertEqual(series['avance_acumulado'], [30.0, 60.0])
+
+    def test_periodos_terminados_desde_cache(self):
+        """Test que una serie de periodos terminados se sirve desde la caché"""
+        parametros = {'desde': '2024-01-01', 'hasta': '2024-01-08', 'periodo': 'semana'}
+        primera = self.client.get(self.url, parametros).json()
+        with CaptureQueriesContext(connection) as consultas:
+            segunda = self.client.get(self.url, parametros).json()
+        self.assertEqual(primera, segunda)
+        self.assertEqual(segunda['series']['cambios'], [4])
+        self.assertFalse([q for q in consultas if 'logprogreso' in q['sql']])
+
+    def test_compactar_invalida_la_cache(self):
+        """Test que compactar logs de periodos cerrados descarta las series cacheadas"""
+        parametros = {'desde': '2024-01-01', 'hasta': '2024-01-04'}
+        self.assertEqual(self.client.get(self.url, parametros).json()['series']['cambios'], [2, 2])
+        with self.captureOnCommitCallbacks(execute=True):
+            compactar_logs(datetime(2024, 3, 1, tzinfo=dt_timezone.utc))
+        series = self.client.get(self.url, parametros).json()['series']
+        self.assertEqual(series['cambios'], [1, 1])
+        self.assertEqual(series['avance_acumulado'], [30.0, 60.0])
+
+    def test_periodo_en_curso_continua_el_acumulado(self):
+        """Test que el periodo en curso se consulta aparte y continúa el acumulado cacheado"""
+        LogProgreso.objects.create(progreso_usuario=self.progreso, progreso_anterior=60, progreso_nuevo=70)
+        desde = timezone.now() - timedelta(days=3)
+        LogProgreso.objects.create(progreso_usuario=self.progreso, fecha_cambio=desde + timedelta(hours=1),
+                                   progreso_anterior=55, progreso_nuevo=60)
+        series = self.client.get(self.url, {'desde': desde.isoformat()}).json()['series']
+        self.assertEqual(series['avance'], [5.0, 10.0])
+        self.assertEqual(series['avance_acumulado'], [5.0, 15.0])
+
+    def test_cohorte_solo_personal(self):
+        """Test que la serie de toda la cohorte exige is_staff"""
+        parametros = {'desde': '2024-01-01', 'hasta': '2024-01-02', 'todos': 'true', 'actividad': 'Aprender Django'}
+        self.assertEqual(self.client.get(self.url, parametros).status_code, 403)
+        self.assertEqual(self.client.get(self.url, {'periodo': 'mes'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'desde': '2000-01-01'}).status_code, 400)
+
+        self.user.is_staff = True
+        self.user.save()
+        series = self.client.get(self.url, parametros).json()['series']
+        self.assertEqual(series['progresos'], [2])
+        self.assertEqual(series['progreso_medio'], [30.0])
+
+
+@override_settings(PROGRESO_CLASIFICACION_TAMANO=4)
+class ClasificacionActividadTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.usuarios = [
+            User.objects.create_user(username=f'alumno{i}', password='testpass123') for i in range(8)
+        ]
+        self.user = self.usuarios[0]
+        for i, usuario in enumerate(self.usuarios):
+            ProgresoUsuario.objects.create(usuario=usuario, actividad='Aprender Django', progreso=10 * i)
+        self.client.login(username='alumno0', password='testpass123')
+
+    def _post(self, nombre, datos, *args):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse(f'progreso_usuario:{nombre}', args=args), json.dumps(datos),
+                                    content_type='application/json')
+
+    def test_clasificacion_y_posicion(self):
+        """Test de la clasificación calculada en la primera lectura y servida después desde caché"""
+        url = reverse('progreso_usuario:clasificacion')
+        response = self.client.get(url, {'actividad': 'Aprender Django', 'limite': 50})
+        self.assertEqual(response.status_code, 200)
+        datos = response.json()
+        self.assertEqual([p['username'] for p in datos['clasificacion']], ['alumno7', 'alumno6'])
+        self.assertIsNone(datos['mi_posicion'])
+        self.assertFalse(ClasificacionActividad.objects.get(actividad='Aprender Django').completa)
+
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get(url, {'actividad': 'Aprender Django'})
+        self.assertFalse([q for q in consultas if 'clasificacion' in q['sql'] or 'progresousuario' in q['sql']])
+        self.assertEqual(self.client.get(url).status_code, 400)
+
+    def test_escrituras_actualizan_la_clasificacion(self):
+        """Test que crear, actualizar, editar y eliminar mantienen la clasificación de forma incremental"""
+        obtener_clasificacion('Aprender Django')
+        progreso = ProgresoUsuario.objects.get(usuario=self.user)
+
+        self._post('actualizar', {'progreso': 95}, progreso.id)
+        self.assertEqual(obtener_clasificacion('Aprender Django')[0], [self.user.id, 95.0])
+
+        self._post('editar', {'actividad': 'Aprender SQL'}, progreso.id)
+        self.assertNotIn(self.user.id, [u for u, _ in obtener_clasificacion('Aprender Django')])
+
+        self._post('lote', {'progresos': [{'actividad': 'Aprender Django', 'progreso': 65}]})
+        self.assertEqual(obtener_clasificacion('Aprender Django')[1], [self.user.id, 65.0])
+
+        nuevo = ProgresoUsuario.objects.get(usuario=self.user, actividad='Aprender Django')
+        self._post('eliminar', {}, nuevo.id)
+        # La lista incompleta pierde un puesto sin recalcularse mientras conserve la mitad
+        self.assertEqual(obtener_clasificacion('Aprender Django'), _calcular('Aprender Django')[0][:3])
+
+    @override_settings(PROGRESO_CLASIFICACION_TAMANO=100)
+    def test_lista_completa_sin_lectura_previa(self):
+        """Test que con la lista completa se bloquea la fila directamente, sin la lectura previa"""
+        obtener_clasificacion('Aprender Django')
+        ProgresoUsuario.objects.filter(usuario=self.user).update(progreso=95)
+        with CaptureQueriesContext(connection) as consultas:
+            registrar_cambios(self.user.id, [('Aprender Django', 95)])
+        self.assertEqual(len([q for q in consultas if q['sql'].startswith('SELECT')]), 1)
+        fila = ClasificacionActividad.objects.get(actividad='Aprender Django')
+        self.assertEqual(fila.entradas, _calcular('Aprender Django')[0])
+
+    def test_cambios_aleatorios_coinciden_con_la_tabla(self):
+        """Test que tras muchos cambios incrementales la lista coincide con la calculada desde la tabla"""
+        obtener_clasificacion('Aprender Django')
+        aleatorio = random.Random(7)
+        for _ in range(200):
+            usuario = aleatorio.choice(self.usuarios)
+            if aleatorio.random() < 0.1:
+                ProgresoUsuario.objects.filter(usuario=usuario, actividad='Aprender Django').delete()
+                registrar_cambios(usuario.id, [('Aprender Django', None)])
+            else:
+                valor = aleatorio.randint(0, 100)
+                ProgresoUsuario.objects.update_or_create(usuario=usuario, actividad='Aprender Django',
+                                                         defaults={'progreso': valor})
+                registrar_cambios(usuario.id, [('Aprender Django', valor)])
+            fila = ClasificacionActividad.objects.get(actividad='Aprender Django')
+            esperado = _calcular('Aprender Django')[0]
+            self.assertEqual(fila.entradas, esperado[:len(fila.entradas)])
+            self.assertGreaterEqual(len(fila.entradas), 2 if len(esperado) >= 2 else len(esperado))
+
+    def test_comando_reconstruir(self):
+        """Test del comando que recalcula todas las clasificaciones"""
+        ClasificacionActividad.objects.create(actividad='Obsoleta', entradas=[[1, 50.0]])
+        salida = io.StringIO()
+        call_command('reconstruir_clasificacion', stdout=salida)
+        self.assertIn('1 clasificaciones reconstruidas', salida.getvalue())
+        self.assertEqual(list(ClasificacionActividad.objects.values_list('actividad', flat=True)), ['Aprender Django'])
+
+
+class SembrarDatosTest(TestCase):
+    def _sembrar(self, *argumentos):
+        salida = io.StringIO()
+        call_command('sembrar_datos', '--usuarios', '3', '--actividades', '2', '--logs', '4',
+                     '--referencia', '2024-01-31T00:00:00Z', *argumentos, stdout=salida)
+        return salida.getvalue()
+
+    def _firma(self):
+        return (
+            list(ProgresoUsuario.objects.order_by('usuario__username', 'actividad')
+                 .values_list('usuario__username', 'actividad', 'progreso')),
+            list(LogProgreso.objects.order_by('progreso_usuario__usuario__username', 'progreso_usuario__actividad',
+                                              'fecha_cambio')
+                 .values_list('progreso_anterior', 'progreso_nuevo', 'fecha_cambio')),
+        )
+
+    def test_sembrar_datos(self):
+        """Test que el comando crea usuarios enlazados, progresos, logs coherentes y resúmenes"""
+        salida = self._sembrar()
+        self.assertIn('filas/s', salida)
+        self.assertEqual(User.objects.filter(username__startswith='bench').count(), 3)
+        user = User.objects.select_related('perfil', 'usuario_personalizado').get(username='bench1')
+        self.assertTrue(user.check_password('edumap-bench'))
+        self.assertEqual(user.usuario_personalizado.correo, user.email)
+        self.assertEqual(user.perfil.last_name, '1')
+
+        progreso = ProgresoUsuario.objects.get(usuario=user, actividad='Actividad 1')
+        logs = list(progreso.logs.order_by('fecha_cambio'))
+        self.assertEqual(len(logs), 4)
+        # Historial encadenado que termina en el progreso actual, dentro de los 90 días previos
+        self.assertEqual(logs[-1].progreso_nuevo, progreso.progreso)
+        for anterior, siguiente in zip(logs, logs[1:]):
+            self.assertEqual(siguiente.progreso_anterior, anterior.progreso_nuevo)
+        self.assertLess(logs[-1].fecha_cambio, datetime(2024, 1, 31, tzinfo=dt_timezone.utc))
+        self.assertGreater(logs[0].fecha_cambio, datetime(2023, 11, 1, tzinfo=dt_timezone.utc))
+
+        self.assertEqual(ResumenProgreso.objects.get(usuario=user).actividades, 2)
+        self.assertEqual(len(obtener_clasificacion('Actividad 0')), 3)
+
+    def test_semilla_reproducible(self):
+        """Test que la misma semilla y referencia generan los mismos datos y que no se repiten usuarios"""
+        self._sembrar()
+        firma = self._firma()
+        with self.assertRaisesMessage(CommandError, 'usa otro --prefijo'):
+            self._sembrar()
+
+        User.objects.filter(username__startswith='bench').delete()
+        with self.assertRaisesMessage(CommandError, 'usa otro --prefijo'):
+            self._sembrar()
+        Usuario.objects.filter(correo__endswith='@edumap.test').delete()
+        self._sembrar()
+        self.assertEqual(self._firma(), firma)
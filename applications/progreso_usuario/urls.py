@@ -6,8 +6,20 @@ app_name = 'progreso_usuario'
 urlpatterns = [
     path('', views.lista_progreso, name='lista'),
     path('crear/', views.crear_progreso, name='crear'),
+    path('lote/', views.actualizar_progreso_lote, name='lote'),
+    path('buscar/', views.buscar_progreso, name='buscar'),
+    path('resumen/', views.resumen_progreso, name='resumen'),
+    path('clasificacion/', views.clasificacion_progreso, name='clasificacion'),
+    path('analitica/', views.analitica_progreso, name='analitica'),
+    path('exportar/<slug:tipo>/', views.exportar_datos, name='exportar'),
     path('<int:pk>/', views.detalle_progreso, name='detalle'),
+    path('<int:pk>/logs/', views.logs_progreso, name='logs'),
     path('<int:pk>/editar/', views.editar_progreso, name='editar'),
     path('<int:pk>/eliminar/', views.eliminar_progreso, name='eliminar'),
     path('<int:pk>/actualizar/', views.actualizar_progreso, name='actualizar'),
+    # Versiones asíncronas para despliegues ASGI
+    path('async/', views.lista_progreso_async, name='lista_async'),
+    path('async/crear/', views.crear_progreso_async, name='crear_async'),
+    path('async/<int:pk>/', views.detalle_progreso_async, name='detalle_async'),
+    path('async/<int:pk>/actualizar/', views.actualizar_progreso_async, name='actualizar_async'),
 ]
@@ -1,16 +1,100 @@
+import base64
+import hashlib
+import json
+import math
+from functools import wraps
+from datetime import datetime
+from urllib.parse import urlencode
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.models import User
 from django.contrib import messages
-from django.http import JsonResponse
-from django.views.decorators.http import require_http_methods
+from django.db import connections, transaction
+from django.db.models import Count, Max, OuterRef, Q, Subquery
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.views.decorators.http import condition, require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from django.core.paginator import Paginator
 from .models import ProgresoUsuario, LogProgreso
 from .forms import ProgresoUsuarioForm
+from .busqueda import buscar_actividades, filtrar_actividad, fts_disponible
+from .fechas import parsear_fecha
+from . import analitica, buffer_logs, clasificacion, exportacion, resumen
+from .serializadores import LOG, PROGRESO, PROGRESO_ACTUALIZADO, PROGRESO_LOTE, respuesta_json
+
+# Número máximo de actividades aceptadas en una actualización por lote
+MAX_ELEMENTOS_LOTE = 500
+
+# Elementos por página en la lista de progresos
+TAMANO_PAGINA = 10
+
+# Logs más recientes incluidos en detalle_progreso; el resto se consulta en el endpoint de logs
+LOGS_EMBEBIDOS = 20
+
+# Tamaño de página por defecto y máximo del endpoint de logs
+TAMANO_PAGINA_LOGS = 50
+MAX_PAGINA_LOGS = 200
+
+
+def _codificar_cursor(fecha, pk):
+    """Genera un cursor opaco a partir de la clave de ordenación (fecha ISO 8601, id)"""
+    valor = f'{fecha}|{pk}'
+    return base64.urlsafe_b64encode(valor.encode()).decode().rstrip('=')
+
+
+def _decodificar_cursor(cursor):
+    """Recupera la clave (fecha, id) de un cursor; lanza ValueError si es inválido"""
+    relleno = '=' * (-len(cursor) % 4)
+    fecha, pk = base64.urlsafe_b64decode(cursor + relleno).decode().split('|')
+    return datetime.fromisoformat(fecha), int(pk)
+
+
+def _validadores_lista(request):
+    """MAX(fecha_actualizacion) y número de progresos del usuario, calculados una vez por petición"""
+    if not hasattr(request, '_validadores_lista'):
+        request._validadores_lista = ProgresoUsuario.objects.filter(usuario=request.user).aggregate(
+            ultima=Max('fecha_actualizacion'), total=Count('id')
+        )
+    return request._validadores_lista
+
+
+def _etag_lista(request):
+    # Se calcula sobre todos los progresos del usuario (cualquier cambio invalida todas las
+    # páginas y filtros) más los parámetros de la petición; el recuento detecta eliminaciones
+    datos = _validadores_lista(request)
+    parametros = urlencode(sorted(request.GET.lists()), doseq=True)
+    clave = f'{request.user.pk}|{datos["ultima"]}|{datos["total"]}|{parametros}'
+    return hashlib.md5(clave.encode()).hexdigest()
+
+
+def _validadores_detalle(request, pk):
+    """Fecha de actualización del progreso, id de su último log y número de logs, o None si no existe"""
+    if not hasattr(request, '_validadores_detalle'):
+        ultimo_log = LogProgreso.objects.filter(progreso_usuario=OuterRef('pk')).order_by('-fecha_cambio', '-id')
+        request._validadores_detalle = ProgresoUsuario.objects.filter(pk=pk, usuario=request.user).annotate(
+            ultimo_log=Subquery(ultimo_log.values('id')[:1]), total_logs=Count('logs')
+        ).values('fecha_actualizacion', 'ultimo_log', 'total_logs').first()
+    return request._validadores_detalle
+
+
+def _etag_detalle(request, pk):
+    # Incluye el último log porque con escritura diferida puede insertarse después del progreso,
+    # y el número de logs porque la compactación borra logs antiguos sin tocar el progreso
+    datos = _validadores_detalle(request, pk)
+    if datos is None:
+        return None
+    clave = f'{pk}|{datos["fecha_actualizacion"].isoformat()}|{datos["ultimo_log"]}|{datos["total_logs"]}'
+    return hashlib.md5(clave.encode()).hexdigest()
 
 
 @csrf_exempt
 @login_required
+@condition(etag_func=_etag_lista)
 def lista_progreso(request):
     """API para listar el progreso del usuario actual"""
     try:
@@ -20,27 +104,23 @@ def lista_progreso(request):
         completado = request.GET.get('completado')
         
         if actividad:
-            progresos = progresos.filter(actividad__icontains=actividad)
+            progresos = filtrar_actividad(progresos, actividad)
         if completado is not None:
             progresos = progresos.filter(completado=completado == 'true')
 
-        paginator = Paginator(progresos, 10)
+        if 'cursor' in request.GET:
+            return _lista_progreso_cursor(request, progresos, {
+                'actividad': actividad,
+                'completado': completado
+            })
+
+        paginator = Paginator(PROGRESO.filas(progresos), TAMANO_PAGINA)
         page_number = request.GET.get('page', 1)
         page_obj = paginator.get_page(page_number)
         
-        progresos_data = []
-        for progreso in page_obj:
-            progresos_data.append({
-                'id': progreso.id,
-                'actividad': progreso.actividad,
-                'progreso': float(progreso.progreso),
-                'completado': progreso.completado,
-                'fecha_inicio': progreso.fecha_inicio.isoformat(),
-                'fecha_actualizacion': progreso.fecha_actualizacion.isoformat(),
-                'resultado': progreso.resultado
-            })
+        progresos_data = PROGRESO.serializar(page_obj)
         
-        return JsonResponse({
+        return respuesta_json({
             'success': True,
             'progresos': progresos_data,
             'pagination': {
@@ -59,54 +139,245 @@ def lista_progreso(request):
         })
         
     except Exception as e:
-        return JsonResponse({
+        return respuesta_json({
             'success': False,
             'message': f'Error al obtener lista de progreso: {str(e)}'
         }, status=500)
 
 
+def _lista_progreso_cursor(request, progresos, filtros):
+    """
+    Paginación por cursor (keyset) sobre (fecha_actualizacion, id).
+
+    Cada página es una búsqueda por índice a partir de la última fila vista,
+    sin OFFSET ni COUNT(*); el total solo se calcula si se pide con
+    incluir_total=true.
+    """
+    total = progresos.count() if request.GET.get('incluir_total') == 'true' else None
+    try:
+        progresos = _desde_cursor(progresos, request.GET.get('cursor'))
+    except ValueError:
+        return respuesta_json({
+            'success': False,
+            'message': 'Cursor inválido'
+        }, status=400)
+
+    return _respuesta_cursor(list(PROGRESO.filas(progresos)[:TAMANO_PAGINA + 1]), total, filtros)
+
+
+def _desde_cursor(progresos, cursor):
+    """Ordena por (fecha_actualizacion, id) y salta hasta el cursor; lanza ValueError si es inválido"""
+    progresos = progresos.order_by('-fecha_actualizacion', '-id')
+    if cursor:
+        fecha, pk = _decodificar_cursor(cursor)
+        progresos = progresos.filter(
+            Q(fecha_actualizacion__lt=fecha) | Q(fecha_actualizacion=fecha, id__lt=pk)
+        )
+    return progresos
+
+
+def _respuesta_cursor(pagina, total, filtros):
+    """Construye la respuesta de una página por cursor a partir de TAMANO_PAGINA + 1 filas de PROGRESO"""
+    has_next = len(pagina) > TAMANO_PAGINA
+    progresos_data = PROGRESO.serializar(pagina[:TAMANO_PAGINA])
+
+    ultimo = progresos_data[-1] if progresos_data else None
+    return respuesta_json({
+        'success': True,
+        'progresos': progresos_data,
+        'pagination': {
+            'has_next': has_next,
+            'next_cursor': _codificar_cursor(ultimo['fecha_actualizacion'], ultimo['id']) if has_next else None,
+            'total_items': total
+        },
+        'filters': filtros
+    })
+
+
 @csrf_exempt
 @login_required
+def buscar_progreso(request):
+    """API para buscar actividades del usuario por nombre, ordenadas por relevancia"""
+    try:
+        termino = request.GET.get('q', '').strip()
+        if not termino:
+            return respuesta_json({
+                'success': False,
+                'message': 'El parámetro q es requerido'
+            }, status=400)
+
+        try:
+            limite = min(max(int(request.GET.get('limite', 20)), 1), 100)
+        except ValueError:
+            return respuesta_json({
+                'success': False,
+                'message': 'El parámetro limite debe ser un número'
+            }, status=400)
+
+        progresos_data = [PROGRESO.instancia(progreso)
+                          for progreso in buscar_actividades(termino, usuario=request.user, limite=limite)]
+
+        return respuesta_json({
+            'success': True,
+            'q': termino,
+            'progresos': progresos_data
+        })
+
+    except Exception as e:
+        return respuesta_json({
+            'success': False,
+            'message': f'Error al buscar progreso: {str(e)}'
+        }, status=500)
+
+
+@csrf_exempt
+@login_required
+@condition(etag_func=_etag_detalle)
 def detalle_progreso(request, pk):
     """API para mostrar el detalle de un progreso específico"""
     try:
-        progreso = get_object_or_404(ProgresoUsuario, pk=pk, usuario=request.user)
-        logs = LogProgreso.objects.filter(progreso_usuario=progreso)
+        fila = get_object_or_404(PROGRESO.filas(ProgresoUsuario.objects.filter(usuario=request.user)), pk=pk)
+        logs = list(LOG.filas(LogProgreso.objects.filter(progreso_usuario_id=pk))
+                    .order_by('-fecha_cambio', '-id')[:LOGS_EMBEBIDOS + 1])
+        hay_mas_logs = len(logs) > LOGS_EMBEBIDOS
         
         # Convertir logs a formato JSON
-        logs_data = []
-        for log in logs:
-            logs_data.append({
-                'id': log.id,
-                'progreso_anterior': float(log.progreso_anterior),
-                'progreso_nuevo': float(log.progreso_nuevo),
-                'descripcion': log.descripcion,
-                'fecha_cambio': log.fecha_cambio.isoformat()
-            })
+        logs_data = LOG.serializar(logs[:LOGS_EMBEBIDOS])
         
-        progreso_data = {
-            'id': progreso.id,
-            'actividad': progreso.actividad,
-            'progreso': float(progreso.progreso),
-            'completado': progreso.completado,
-            'fecha_inicio': progreso.fecha_inicio.isoformat(),
-            'fecha_actualizacion': progreso.fecha_actualizacion.isoformat(),
-            'resultado': progreso.resultado,
-            'logs': logs_data
-        }
+        progreso_data = PROGRESO.fila(fila)
+        progreso_data['logs'] = logs_data
+        progreso_data['hay_mas_logs'] = hay_mas_logs
         
-        return JsonResponse({
+        return respuesta_json({
             'success': True,
             'progreso': progreso_data
         })
         
     except Exception as e:
-        return JsonResponse({
+        return respuesta_json({
             'success': False,
             'message': f'Error al obtener detalle del progreso: {str(e)}'
         }, status=500)
 
 
+@csrf_exempt
+@login_required
+def logs_progreso(request, pk):
+    """
+    API para consultar el historial completo de logs de un progreso.
+
+    Pagina por cursor sobre (fecha_cambio, id) y admite los filtros desde
+    (inclusive) y hasta (exclusive), todos resueltos con el índice
+    log_progreso_fecha_idx.
+    """
+    try:
+        if not ProgresoUsuario.objects.filter(pk=pk, usuario=request.user).exists():
+            return respuesta_json({
+                'success': False,
+                'message': 'Progreso no encontrado'
+            }, status=404)
+
+        try:
+            limite = min(max(int(request.GET.get('limite', TAMANO_PAGINA_LOGS)), 1), MAX_PAGINA_LOGS)
+            desde = request.GET.get('desde')
+            hasta = request.GET.get('hasta')
+            cursor = request.GET.get('cursor')
+
+            logs = LogProgreso.objects.filter(progreso_usuario_id=pk).order_by('-fecha_cambio', '-id')
+            if desde:
+                logs = logs.filter(fecha_cambio__gte=parsear_fecha(desde))
+            if hasta:
+                logs = logs.filter(fecha_cambio__lt=parsear_fecha(hasta))
+            if cursor:
+                fecha, ultimo_id = _decodificar_cursor(cursor)
+                logs = logs.filter(Q(fecha_cambio__lt=fecha) | Q(fecha_cambio=fecha, id__lt=ultimo_id))
+        except ValueError as e:
+            return respuesta_json({
+                'success': False,
+                'message': f'Parámetros inválidos: {str(e)}'
+            }, status=400)
+
+        pagina = list(LOG.filas(logs)[:limite + 1])
+        has_next = len(pagina) > limite
+        logs_data = LOG.serializar(pagina[:limite])
+
+        ultimo = logs_data[-1] if logs_data else None
+        return respuesta_json({
+            'success': True,
+            'logs': logs_data,
+            'pagination': {
+                'has_next': has_next,
+                'next_cursor': _codificar_cursor(ultimo['fecha_cambio'], ultimo['id']) if has_next else None
+            },
+            'filters': {
+                'desde': desde,
+                'hasta': hasta
+            }
+        })
+
+    except Exception as e:
+        return respuesta_json({
+            'success': False,
+            'message': f'Error al obtener logs del progreso: {str(e)}'
+        }, status=500)
+
+
+def _validar_progreso(actividad, progreso):
+    """
+    Comprueba actividad y progreso de un elemento antes de escribirlo: texto
+    dentro del max_length del modelo y progreso entre 0 y 100 (como
+    ProgresoUsuarioForm). Devuelve el progreso como float; lanza ValueError
+    """
+    maximo = ProgresoUsuario._meta.get_field('actividad').max_length
+    if not isinstance(actividad, str):
+        raise ValueError('La actividad debe ser un texto')
+    if len(actividad) > maximo:
+        raise ValueError(f'La actividad no puede tener más de {maximo} caracteres')
+    valor = float(progreso)
+    if not 0 <= valor <= 100:
+        raise ValueError('El progreso debe estar entre 0 y 100')
+    return valor
+
+
+def _crear_progreso(usuario, data):
+    """Crea el progreso y suma su delta al resumen en la misma transacción"""
+    valor = _validar_progreso(data['actividad'], data['progreso'])
+    with transaction.atomic():
+        progreso = ProgresoUsuario.objects.create(
+            usuario=usuario,
+            actividad=data['actividad'],
+            progreso=valor,
+            completado=valor >= 100,
+            resultado=data.get('resultado', '')
+        )
+        resumen.registrar_creacion(progreso)
+        clasificacion.registrar_cambios(usuario.id, [(progreso.actividad, progreso.progreso)])
+    return progreso
+
+
+def _aplicar_progreso(usuario, pk, valor):
+    """Fija el progreso de una actividad, registra el log y actualiza el resumen; lanza Http404 si no existe"""
+    with transaction.atomic():
+        progreso = get_object_or_404(ProgresoUsuario.objects.select_for_update(), pk=pk, usuario=usuario)
+        progreso_anterior = progreso.progreso
+        completado_anterior = progreso.completado
+        progreso.progreso = valor
+        progreso.completado = progreso.progreso >= 100
+        progreso.save()
+        resumen.registrar_cambio(usuario.id, progreso_anterior, completado_anterior,
+                                 progreso.progreso, progreso.completado)
+        clasificacion.registrar_cambios(usuario.id, [(progreso.actividad, progreso.progreso)])
+
+        # Crear log de cambio
+        buffer_logs.registrar_logs([LogProgreso(
+            progreso_usuario=progreso,
+            progreso_anterior=progreso_anterior,
+            progreso_nuevo=progreso.progreso,
+            descripcion="Progreso actualizado mediante API"
+        )])
+    return progreso
+
+
 @csrf_exempt
 @login_required
 @require_http_methods(["POST"])
@@ -119,45 +390,31 @@ def crear_progreso(request):
         required_fields = ['actividad', 'progreso']
         for field in required_fields:
             if not data.get(field):
-                return JsonResponse({
+                return respuesta_json({
                     'success': False,
                     'message': f'El campo {field} es requerido'
                 }, status=400)
         
-        progreso = ProgresoUsuario.objects.create(
-            usuario=request.user,
-            actividad=data['actividad'],
-            progreso=float(data['progreso']),
-            completado=float(data['progreso']) >= 100,
-            resultado=data.get('resultado', '')
-        )
+        progreso = _crear_progreso(request.user, data)
         
-        return JsonResponse({
+        return respuesta_json({
             'success': True,
             'message': 'Progreso creado exitosamente',
-            'progreso': {
-                'id': progreso.id,
-                'actividad': progreso.actividad,
-                'progreso': float(progreso.progreso),
-                'completado': progreso.completado,
-                'fecha_inicio': progreso.fecha_inicio.isoformat(),
-                'fecha_actualizacion': progreso.fecha_actualizacion.isoformat(),
-                'resultado': progreso.resultado
-            }
+            'progreso': PROGRESO.instancia(progreso)
         }, status=201)
         
     except json.JSONDecodeError:
-        return JsonResponse({
+        return respuesta_json({
             'success': False,
             'message': 'JSON inválido'
         }, status=400)
     except ValueError as e:
-        return JsonResponse({
+        return respuesta_json({
             'success': False,
             'message': f'Error en los datos: {str(e)}'
         }, status=400)
     except Exception as e:
-        return JsonResponse({
+        return respuesta_json({
             'success': False,
             'message': f'Error al crear progreso: {str(e)}'
         }, status=500)
@@ -171,51 +428,52 @@ def editar_progreso(request, pk):
     try:
         import json
         data = json.loads(request.body)
-        progreso = get_object_or_404(ProgresoUsuario, pk=pk, usuario=request.user)
-        
-        progreso_anterior = progreso.progreso
-        
-        progreso.actividad = data.get('actividad', progreso.actividad)
-        progreso.progreso = float(data.get('progreso', progreso.progreso))
-        progreso.completado = progreso.progreso >= 100
-        progreso.resultado = data.get('resultado', progreso.resultado)
-        
-        progreso.save()
-        
-        if progreso_anterior != progreso.progreso:
-            LogProgreso.objects.create(
-                progreso_usuario=progreso,
-                progreso_anterior=progreso_anterior,
-                progreso_nuevo=progreso.progreso,
-                descripcion=f"Progreso actualizado de {progreso_anterior}% a {progreso.progreso}%"
-            )
+        with transaction.atomic():
+            progreso = get_object_or_404(ProgresoUsuario.objects.select_for_update(), pk=pk, usuario=request.user)
+            
+            progreso_anterior = progreso.progreso
+            completado_anterior = progreso.completado
+            actividad_anterior = progreso.actividad
+            
+            progreso.actividad = data.get('actividad', progreso.actividad)
+            progreso.progreso = float(data.get('progreso', progreso.progreso))
+            progreso.completado = progreso.progreso >= 100
+            progreso.resultado = data.get('resultado', progreso.resultado)
+            
+            progreso.save()
+            resumen.registrar_cambio(request.user.id, progreso_anterior, completado_anterior,
+                                     progreso.progreso, progreso.completado)
+            cambios = [(progreso.actividad, progreso.progreso)]
+            if actividad_anterior != progreso.actividad:
+                cambios.append((actividad_anterior, None))
+            clasificacion.registrar_cambios(request.user.id, cambios)
+            
+            if progreso_anterior != progreso.progreso:
+                buffer_logs.registrar_logs([LogProgreso(
+                    progreso_usuario=progreso,
+                    progreso_anterior=progreso_anterior,
+                    progreso_nuevo=progreso.progreso,
+                    descripcion=f"Progreso actualizado de {progreso_anterior}% a {progreso.progreso}%"
+                )])
         
-        return JsonResponse({
+        return respuesta_json({
             'success': True,
             'message': 'Progreso actualizado exitosamente',
-            'progreso': {
-                'id': progreso.id,
-                'actividad': progreso.actividad,
-                'progreso': float(progreso.progreso),
-                'completado': progreso.completado,
-                'fecha_inicio': progreso.fecha_inicio.isoformat(),
-                'fecha_actualizacion': progreso.fecha_actualizacion.isoformat(),
-                'resultado': progreso.resultado
-            }
+            'progreso': PROGRESO.instancia(progreso)
         })
         
     except json.JSONDecodeError:
-        return JsonResponse({
+        return respuesta_json({
             'success': False,
             'message': 'JSON inválido'
         }, status=400)
     except ValueError as e:
-        return JsonResponse({
+        return respuesta_json({
             'success': False,
             'message': f'Error en los datos: {str(e)}'
         }, status=400)
     except Exception as e:
-        return JsonResponse({
+        return respuesta_json({
             'success': False,
             'message': f'Error al editar progreso: {str(e)}'
         }, status=500)
@@ -230,52 +488,34 @@ def actualizar_progreso(request, pk):
         import json
         data = json.loads(request.body)
         
-        progreso = get_object_or_404(ProgresoUsuario, pk=pk, usuario=request.user)
-        
         nuevo_progreso = data.get('progreso')
         if nuevo_progreso is not None:
             try:
-                progreso_anterior = progreso.progreso
-                progreso.progreso = float(nuevo_progreso)
-                progreso.completado = progreso.progreso >= 100
-                progreso.save()
-                
-                # Crear log de cambio
-                LogProgreso.objects.create(
-                    progreso_usuario=progreso,
-                    progreso_anterior=progreso_anterior,
-                    progreso_nuevo=progreso.progreso,
-                    descripcion="Progreso actualizado mediante API"
-                )
+                progreso = _aplicar_progreso(request.user, pk, float(nuevo_progreso))
                 
-                return JsonResponse({
+                return respuesta_json({
                     'success': True,
-                    'data': {
-                        'id': progreso.id,
-                        'progreso': float(progreso.progreso),
-                        'completado': progreso.completado,
-                        'fecha_actualizacion': progreso.fecha_actualizacion.isoformat()
-                    },
+                    'data': PROGRESO_ACTUALIZADO.instancia(progreso),
                     'message': 'Progreso actualizado correctamente'
                 })
             except ValueError:
-                return JsonResponse({
+                return respuesta_json({
                     'success': False,
                     'error': 'Valor de progreso inválido'
                 }, status=400)
         
-        return JsonResponse({
+        return respuesta_json({
             'success': False,
             'error': 'Progreso no proporcionado en el JSON'
         }, status=400)
     
     except json.JSONDecodeError:
-        return JsonResponse({
+        return respuesta_json({
             'success': False,
             'error': 'JSON inválido'
         }, status=400)
     except Exception as e:
-        return JsonResponse({
+        return respuesta_json({
             'success': False,
             'error': str(e)
         }, status=500)
@@ -287,16 +527,563 @@ def actualizar_progreso(request, pk):
 def eliminar_progreso(request, pk):
     """API para eliminar un progreso"""
     try:
-        progreso = get_object_or_404(ProgresoUsuario, pk=pk, usuario=request.user)
-        progreso.delete()
+        with transaction.atomic():
+            progreso = get_object_or_404(ProgresoUsuario.objects.select_for_update(), pk=pk, usuario=request.user)
+            progreso.delete()
+            resumen.registrar_eliminacion(progreso)
+            clasificacion.registrar_cambios(request.user.id, [(progreso.actividad, None)])
         
-        return JsonResponse({
+        return respuesta_json({
             'success': True,
             'message': 'Progreso eliminado exitosamente'
         })
         
     except Exception as e:
-        return JsonResponse({
+        return respuesta_json({
             'success': False,
             'message': f'Error al eliminar progreso: {str(e)}'
         }, status=500)
+
+
+@csrf_exempt
+@login_required
+@require_http_methods(["POST"])
+def actualizar_progreso_lote(request):
+    """API para crear o actualizar el progreso de varias actividades en una sola petición"""
+    try:
+        data = json.loads(request.body)
+        elementos = data.get('progresos') if isinstance(data, dict) else data
+
+        if not isinstance(elementos, list) or not elementos:
+            return respuesta_json({
+                'success': False,
+                'message': 'Se requiere una lista no vacía en el campo progresos'
+            }, status=400)
+        if len(elementos) > MAX_ELEMENTOS_LOTE:
+            return respuesta_json({
+                'success': False,
+                'message': f'El lote no puede tener más de {MAX_ELEMENTOS_LOTE} elementos'
+            }, status=400)
+
+        # Validar y deduplicar por actividad (el último elemento gana)
+        por_actividad = {}
+        for indice, elemento in enumerate(elementos):
+            if not isinstance(elemento, dict):
+                return respuesta_json({
+                    'success': False,
+                    'message': 'Cada elemento del lote debe ser un objeto'
+                }, status=400)
+            for field in ['actividad', 'progreso']:
+                if elemento.get(field) in (None, ''):
+                    return respuesta_json({
+                        'success': False,
+                        'message': f'El campo {field} es requerido en cada elemento'
+                    }, status=400)
+            # Las mismas comprobaciones que crear_progreso, antes de llegar a la base de datos
+            try:
+                valor = _validar_progreso(elemento['actividad'], elemento['progreso'])
+            except (TypeError, ValueError) as e:
+                return respuesta_json({
+                    'success': False,
+                    'message': f'Elemento {indice}: {str(e)}'
+                }, status=400)
+            por_actividad[elemento['actividad']] = {
+                'progreso': valor,
+                'resultado': elemento.get('resultado'),
+            }
+
+        with transaction.atomic():
+            existentes = {
+                progreso.actividad: progreso
+                for progreso in ProgresoUsuario.objects.select_for_update().filter(
+                    usuario=request.user, actividad__in=list(por_actividad)
+                )
+            }
+
+            filas = []
+            for actividad, valores in por_actividad.items():
+                anterior = existentes.get(actividad)
+                resultado = valores['resultado']
+                if resultado is None:
+                    resultado = anterior.resultado if anterior else ''
+                filas.append(ProgresoUsuario(
+                    usuario=request.user,
+                    actividad=actividad,
+                    progreso=valores['progreso'],
+                    completado=valores['progreso'] >= 100,
+                    resultado=resultado
+                ))
+
+            campos = ['progreso', 'completado', 'resultado', 'fecha_actualizacion']
+            if connections[ProgresoUsuario.objects.db].features.supports_update_conflicts_with_target:
+                # PostgreSQL y SQLite: un único INSERT ... ON CONFLICT (usuario, actividad) que
+                # devuelve las claves primarias con RETURNING
+                ProgresoUsuario.objects.bulk_create(
+                    filas, update_conflicts=True, unique_fields=['usuario', 'actividad'], update_fields=campos
+                )
+            else:
+                # MySQL: ON DUPLICATE KEY UPDATE no admite unique_fields ni devuelve las claves primarias
+                ProgresoUsuario.objects.bulk_create(filas, update_conflicts=True, update_fields=campos)
+                ids = dict(ProgresoUsuario.objects.filter(
+                    usuario=request.user, actividad__in=list(por_actividad)
+                ).values_list('actividad', 'id'))
+                for fila in filas:
+                    fila.pk = ids[fila.actividad]
+
+            logs = []
+            for fila in filas:
+                anterior = existentes.get(fila.actividad)
+                if anterior is not None and float(anterior.progreso) != fila.progreso:
+                    logs.append(LogProgreso(
+                        progreso_usuario_id=fila.pk,
+                        progreso_anterior=anterior.progreso,
+                        progreso_nuevo=fila.progreso,
+                        descripcion=f"Progreso actualizado en lote de {anterior.progreso}% a {fila.progreso}%"
+                    ))
+            buffer_logs.registrar_logs(logs)
+            resumen.registrar_lote(request.user.id, [(existentes.get(fila.actividad), fila) for fila in filas])
+            clasificacion.registrar_cambios(request.user.id, [(fila.actividad, fila.progreso) for fila in filas])
+
+        return respuesta_json({
+            'success': True,
+            'message': 'Progresos actualizados exitosamente',
+            'creados': len(filas) - len(existentes),
+            'actualizados': len(existentes),
+            'progresos': [PROGRESO_LOTE.instancia(fila) for fila in filas]
+        })
+
+    except json.JSONDecodeError:
+        return respuesta_json({
+            'success': False,
+            'message': 'JSON inválido'
+        }, status=400)
+    except (TypeError, ValueError) as e:
+        return respuesta_json({
+            'success': False,
+            'message': f'Error en los datos: {str(e)}'
+        }, status=400)
+    except Exception as e:
+        return respuesta_json({
+            'success': False,
+            'message': f'Error al actualizar progresos en lote: {str(e)}'
+        }, status=500)
+
+
+@csrf_exempt
+@login_required
+def resumen_progreso(request):
+    """API con el resumen de progreso del usuario (actividades, completadas y promedio)"""
+    try:
+        datos = resumen.obtener_resumen(request.user)
+        return respuesta_json({
+            'success': True,
+            'resumen': {
+                'actividades': datos.actividades,
+                'completadas': datos.completadas,
+                'en_progreso': datos.actividades - datos.completadas,
+                'promedio_progreso': round(datos.promedio_progreso, 2)
+            }
+        })
+    except Exception as e:
+        return respuesta_json({
+            'success': False,
+            'message': f'Error al obtener resumen de progreso: {str(e)}'
+        }, status=500)
+
+
+@csrf_exempt
+@login_required
+def clasificacion_progreso(request):
+    """API con los mejores progresos de una actividad y la posición del usuario en ellos"""
+    try:
+        actividad = request.GET.get('actividad', '').strip()
+        if not actividad:
+            return respuesta_json({
+                'success': False,
+                'message': 'El parámetro actividad es requerido'
+            }, status=400)
+        try:
+            limite = min(max(int(request.GET.get('limite', 10)), 1), clasificacion.limite_maximo())
+        except ValueError:
+            return respuesta_json({
+                'success': False,
+                'message': 'El límite debe ser un número entero'
+            }, status=400)
+
+        entradas = clasificacion.obtener_clasificacion(actividad)
+        puestos = entradas[:limite]
+        nombres = dict(User.objects.filter(id__in=[usuario_id for usuario_id, _ in puestos])
+                       .values_list('id', 'username'))
+        posicion = next((i for i, (usuario_id, _) in enumerate(entradas, start=1)
+                         if usuario_id == request.user.id), None)
+
+        return respuesta_json({
+            'success': True,
+            'actividad': actividad,
+            'clasificacion': [
+                {'posicion': i, 'usuario_id': usuario_id, 'username': nombres.get(usuario_id), 'progreso': valor}
+                for i, (usuario_id, valor) in enumerate(puestos, start=1)
+            ],
+            # None si el usuario no está entre los puestos guardados
+            'mi_posicion': posicion if posicion is not None and posicion <= clasificacion.limite_maximo() else None
+        })
+
+    except Exception as e:
+        return respuesta_json({
+            'success': False,
+            'message': f'Error al obtener la clasificación: {str(e)}'
+        }, status=500)
+
+
+@csrf_exempt
+@login_required
+def exportar_datos(request, tipo):
+    """
+    Descarga en streaming de los progresos o logs del usuario en CSV o NDJSON.
+
+    Admite formato (csv, ndjson), desde (inclusive) y hasta (exclusive) sobre
+    fecha_actualizacion o fecha_cambio, y gzip=true. Con todos=true, o
+    usuario=<id>, el personal (is_staff) exporta los datos de toda la
+    institución o de otro usuario.
+    """
+    try:
+        if tipo not in exportacion.EXPORTACIONES:
+            raise Http404
+
+        formato = request.GET.get('formato', 'csv')
+        if formato not in exportacion.FORMATOS:
+            return respuesta_json({
+                'success': False,
+                'message': f'Formato no soportado: {formato}'
+            }, status=400)
+
+        usuario_id = request.user.id
+        if request.GET.get('todos') == 'true' or 'usuario' in request.GET:
+            if not request.user.is_staff:
+                return respuesta_json({
+                    'success': False,
+                    'message': 'Solo el personal puede exportar datos de otros usuarios'
+                }, status=403)
+            usuario_id = None if request.GET.get('todos') == 'true' else request.GET['usuario']
+
+        try:
+            if usuario_id is not None:
+                usuario_id = int(usuario_id)
+            desde = request.GET.get('desde')
+            hasta = request.GET.get('hasta')
+            desde = parsear_fecha(desde) if desde else None
+            hasta = parsear_fecha(hasta) if hasta else None
+        except ValueError as e:
+            return respuesta_json({
+                'success': False,
+                'message': f'Parámetros inválidos: {str(e)}'
+            }, status=400)
+
+        comprimir = request.GET.get('gzip') == 'true'
+        nombre = f'{tipo}-{timezone.now():%Y%m%d%H%M%S}.{formato}'
+        bloques = exportacion.exportar(tipo, formato, comprimir, usuario_id=usuario_id, desde=desde, hasta=hasta)
+        if isinstance(request, ASGIRequest):
+            bloques = exportacion.iterar_async(bloques)
+        response = StreamingHttpResponse(
+            bloques,
+            content_type='application/gzip' if comprimir else f'{exportacion.FORMATOS[formato]}; charset=utf-8'
+        )
+        response['Content-Disposition'] = f'attachment; filename="{nombre}{".gz" if comprimir else ""}"'
+        return response
+
+    except Http404:
+        raise
+    except Exception as e:
+        return respuesta_json({
+            'success': False,
+            'message': f'Error al exportar datos: {str(e)}'
+        }, status=500)
+
+
+@csrf_exempt
+@login_required
+def analitica_progreso(request):
+    """
+    API con la evolución del progreso por día o semana, a partir de LogProgreso.
+
+    Admite periodo (dia, semana), actividad, desde (inclusive) y hasta
+    (exclusive). Con todos=true, o usuario=<id>, el personal (is_staff)
+    consulta la cohorte completa o a otro usuario.
+    """
+    try:
+        periodo = request.GET.get('periodo', 'dia')
+        if periodo not in analitica.PERIODOS:
+            return respuesta_json({
+                'success': False,
+                'message': f'Periodo no soportado: {periodo}'
+            }, status=400)
+
+        alcance = request.user.id
+        if request.GET.get('todos') == 'true' or 'usuario' in request.GET:
+            if not request.user.is_staff:
+                return respuesta_json({
+                    'success': False,
+                    'message': 'Solo el personal puede consultar datos de otros usuarios'
+                }, status=403)
+            alcance = None if request.GET.get('todos') == 'true' else request.GET['usuario']
+
+        _, duracion = analitica.PERIODOS[periodo]
+        try:
+            if alcance is not None:
+                alcance = int(alcance)
+            hasta = request.GET.get('hasta')
+            hasta = parsear_fecha(hasta) if hasta else timezone.now()
+            desde = request.GET.get('desde')
+            desde = parsear_fecha(desde) if desde else hasta - duracion * analitica.PERIODOS_POR_DEFECTO
+            if desde >= hasta:
+                raise ValueError('desde debe ser anterior a hasta')
+            if (hasta - desde) / duracion > analitica.MAX_PERIODOS:
+                raise ValueError(f'el rango supera {analitica.MAX_PERIODOS} periodos')
+        except ValueError as e:
+            return respuesta_json({
+                'success': False,
+                'message': f'Parámetros inválidos: {str(e)}'
+            }, status=400)
+
+        actividad = request.GET.get('actividad')
+        return respuesta_json({
+            'success': True,
+            'periodo': periodo,
+            'actividad': actividad,
+            'series': analitica.serie_progreso(alcance, periodo, desde, hasta, actividad)
+        })
+
+    except Exception as e:
+        return respuesta_json({
+            'success': False,
+            'message': f'Error al obtener la analítica de progreso: {str(e)}'
+        }, status=500)
+
+
+# Vistas asíncronas para despliegues ASGI (uvicorn, daphne). Las lecturas usan
+# el ORM asíncrono y no ocupan el hilo compartido de sync_to_async; las
+# escrituras necesitan una transacción junto al resumen, que el ORM asíncrono
+# todavía no ofrece, y se ejecutan en un único bloque síncrono.
+
+def _numero_pagina(valor, total_paginas):
+    """Interpreta el parámetro page igual que Paginator.get_page"""
+    try:
+        numero = int(valor)
+    except (TypeError, ValueError):
+        return 1
+    if numero < 1:
+        return 1
+    return min(numero, total_paginas)
+
+
+def _condicion_async(etag_func):
+    """
+    condition() para vistas asíncronas. El decorador de Django llamaría a
+    etag_func en el bucle de eventos, y los validadores consultan la base de
+    datos con el ORM síncrono, así que se calculan con sync_to_async.
+    """
+    def decorador(vista):
+        @wraps(vista)
+        async def envoltura(request, *args, **kwargs):
+            etag = await sync_to_async(etag_func)(request, *args, **kwargs)
+            etag = quote_etag(etag) if etag is not None else None
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = await vista(request, *args, **kwargs)
+            if etag and request.method in ('GET', 'HEAD'):
+                response.headers.setdefault('ETag', etag)
+            return response
+        return envoltura
+    return decorador
+
+
+@csrf_exempt
+@login_required
+@_condicion_async(_etag_lista)
+async def lista_progreso_async(request):
+    """Versión asíncrona de lista_progreso"""
+    try:
+        usuario = await request.auser()
+        progresos = ProgresoUsuario.objects.filter(usuario=usuario)
+
+        actividad = request.GET.get('actividad')
+        completado = request.GET.get('completado')
+
+        if actividad:
+            # La primera llamada consulta sqlite_master; después queda en caché
+            await sync_to_async(fts_disponible)()
+            progresos = filtrar_actividad(progresos, actividad)
+        if completado is not None:
+            progresos = progresos.filter(completado=completado == 'true')
+
+        filtros = {
+            'actividad': actividad,
+            'completado': completado
+        }
+
+        if 'cursor' in request.GET:
+            total = await progresos.acount() if request.GET.get('incluir_total') == 'true' else None
+            try:
+                progresos = _desde_cursor(progresos, request.GET.get('cursor'))
+            except ValueError:
+                return respuesta_json({
+                    'success': False,
+                    'message': 'Cursor inválido'
+                }, status=400)
+            pagina = [fila async for fila in PROGRESO.filas(progresos)[:TAMANO_PAGINA + 1]]
+            return _respuesta_cursor(pagina, total, filtros)
+
+        total = await progresos.acount()
+        total_paginas = max(1, math.ceil(total / TAMANO_PAGINA))
+        numero = _numero_pagina(request.GET.get('page', 1), total_paginas)
+        inicio = (numero - 1) * TAMANO_PAGINA
+
+        filas = PROGRESO.filas(progresos)[inicio:inicio + TAMANO_PAGINA]
+        progresos_data = PROGRESO.serializar([fila async for fila in filas])
+
+        return respuesta_json({
+            'success': True,
+            'progresos': progresos_data,
+            'pagination': {
+                'current_page': numero,
+                'total_pages': total_paginas,
+                'total_items': total,
+                'has_next': numero < total_paginas,
+                'has_previous': numero > 1,
+                'next_page': numero + 1 if numero < total_paginas else None,
+                'previous_page': numero - 1 if numero > 1 else None
+            },
+            'filters': filtros
+        })
+
+    except Exception as e:
+        return respuesta_json({
+            'success': False,
+            'message': f'Error al obtener lista de progreso: {str(e)}'
+        }, status=500)
+
+
+@csrf_exempt
+@login_required
+@_condicion_async(_etag_detalle)
+async def detalle_progreso_async(request, pk):
+    """Versión asíncrona de detalle_progreso"""
+    try:
+        usuario = await request.auser()
+        try:
+            fila = await PROGRESO.filas(ProgresoUsuario.objects.filter(usuario=usuario)).aget(pk=pk)
+        except ProgresoUsuario.DoesNotExist:
+            return respuesta_json({
+                'success': False,
+                'message': 'Progreso no encontrado'
+            }, status=404)
+
+        logs = [log async for log in LOG.filas(LogProgreso.objects.filter(progreso_usuario_id=pk))
+                .order_by('-fecha_cambio', '-id')[:LOGS_EMBEBIDOS + 1]]
+        hay_mas_logs = len(logs) > LOGS_EMBEBIDOS
+
+        progreso_data = PROGRESO.fila(fila)
+        progreso_data['logs'] = LOG.serializar(logs[:LOGS_EMBEBIDOS])
+        progreso_data['hay_mas_logs'] = hay_mas_logs
+
+        return respuesta_json({
+            'success': True,
+            'progreso': progreso_data
+        })
+
+    except Exception as e:
+        return respuesta_json({
+            'success': False,
+            'message': f'Error al obtener detalle del progreso: {str(e)}'
+        }, status=500)
+
+
+@csrf_exempt
+@login_required
+@require_http_methods(["POST"])
+async def crear_progreso_async(request):
+    """Versión asíncrona de crear_progreso"""
+    try:
+        data = json.loads(request.body)
+
+        required_fields = ['actividad', 'progreso']
+        for field in required_fields:
+            if not data.get(field):
+                return respuesta_json({
+                    'success': False,
+                    'message': f'El campo {field} es requerido'
+                }, status=400)
+
+        usuario = await request.auser()
+        progreso = await sync_to_async(_crear_progreso)(usuario, data)
+
+        return respuesta_json({
+            'success': True,
+            'message': 'Progreso creado exitosamente',
+            'progreso': PROGRESO.instancia(progreso)
+        }, status=201)
+
+    except json.JSONDecodeError:
+        return respuesta_json({
+            'success': False,
+            'message': 'JSON inválido'
+        }, status=400)
+    except ValueError as e:
+        return respuesta_json({
+            'success': False,
+            'message': f'Error en los datos: {str(e)}'
+        }, status=400)
+    except Exception as e:
+        return respuesta_json({
+            'success': False,
+            'message': f'Error al crear progreso: {str(e)}'
+        }, status=500)
+
+
+@csrf_exempt
+@login_required
+@require_http_methods(["POST"])
+async def actualizar_progreso_async(request, pk):
+    """Versión asíncrona de actualizar_progreso"""
+    try:
+        data = json.loads(request.body)
+
+        nuevo_progreso = data.get('progreso')
+        if nuevo_progreso is None:
+            return respuesta_json({
+                'success': False,
+                'error': 'Progreso no proporcionado en el JSON'
+            }, status=400)
+        try:
+            valor = float(nuevo_progreso)
+        except (TypeError, ValueError):
+            return respuesta_json({
+                'success': False,
+                'error': 'Valor de progreso inválido'
+            }, status=400)
+
+        usuario = await request.auser()
+        try:
+            progreso = await sync_to_async(_aplicar_progreso)(usuario, pk, valor)
+        except Http404:
+            return respuesta_json({
+                'success': False,
+                'error': 'Progreso no encontrado'
+            }, status=404)
+
+        return respuesta_json({
+            'success': True,
+            'data': PROGRESO_ACTUALIZADO.instancia(progreso),
+            'message': 'Progreso actualizado correctamente'
+        })
+
+    except json.JSONDecodeError:
+        return respuesta_json({
+            'success': False,
+            'error': 'JSON inválido'
+        }, status=400)
+    except Exception as e:
+        return respuesta_json({
+            'success': False,
+            'error': str(e)
+        }, status=500)
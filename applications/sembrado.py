@@ -0,0 +1,190 @@
+"""
+Generación de datos sintéticos a escala de producción.
+
+Crea usuarios (User, Usuario y PerfilUsuario), sus progresos y un historial
+de logs. Con la misma semilla y fecha de referencia los datos son idénticos.
+Las filas se generan como instancias de modelo con la clave primaria ya
+asignada, así que los logs se enlazan a sus progresos sin releerlos, y se
+insertan por lotes:
+
+- en PostgreSQL con COPY, reservando antes los ids de la secuencia de cada
+  tabla y con synchronous_commit desactivado en cada transacción;
+- en el resto de bases de datos (o con copy=False) con un INSERT
+  parametrizado y executemany. Es lo mismo que hace bulk_create, pero sin
+  compilar la consulta en cada lote, que era más de la mitad del tiempo.
+
+En los dos casos los valores se preparan con los campos del modelo
+(pre_save y get_db_prep_save), igual que en bulk_create.
+
+Ninguno de los dos caminos envía señales por fila (post_save, etc.): las
+cachés que invalidan no tienen entradas para usuarios nuevos. La contraseña
+común se cifra una sola vez. Al terminar se reconstruyen los resúmenes y
+las clasificaciones.
+"""
+import io
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from applications.progreso_usuario.clasificacion import reconstruir_clasificaciones
+from applications.progreso_usuario.models import LogProgreso, ProgresoUsuario
+from applications.progreso_usuario.resumen import reconstruir_resumenes
+from applications.Usuarios.models import PerfilUsuario, Usuario
+
+# Contraseña común de los usuarios sintéticos (bench0, bench1...)
+CONTRASENA_SINTETICA = 'edumap-bench'
+
+MODELOS = (User, Usuario, PerfilUsuario, ProgresoUsuario, LogProgreso)
+
+
+def _texto_copy(valor):
+    """Valor en el formato de texto de COPY"""
+    if valor is None:
+        return '\\N'
+    if isinstance(valor, bool):
+        return 't' if valor else 'f'
+    return str(valor).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+class Insertador:
+    """Reserva claves primarias e inserta lotes de instancias con COPY o executemany"""
+
+    def __init__(self, copy=True):
+        # La conexión real y no el proxy django.db.connection, que se resolvería en cada valor
+        self.conexion = connections[DEFAULT_DB_ALIAS]
+        self.copy = copy and self.conexion.vendor == 'postgresql'
+        self.filas = dict.fromkeys(MODELOS, 0)
+        self._siguiente = {}
+
+    def reservar_ids(self, modelo, cantidad):
+        """Lista de `cantidad` claves primarias libres para el modelo"""
+        if self.conexion.vendor == 'postgresql':
+            with self.conexion.cursor() as cursor:
+                cursor.execute(
+                    "SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)",
+                    [modelo._meta.db_table, modelo._meta.pk.column, cantidad]
+                )
+                return [fila[0] for fila in cursor.fetchall()]
+        # Sin secuencias: a continuación del máximo actual (no ejecutar junto a otras escrituras)
+        if modelo not in self._siguiente:
+            self._siguiente[modelo] = (modelo.objects.aggregate(maximo=Max('pk'))['maximo'] or 0) + 1
+        inicio = self._siguiente[modelo]
+        self._siguiente[modelo] += cantidad
+        return list(range(inicio, inicio + cantidad))
+
+    def insertar(self, modelo, instancias, lote):
+        if not instancias:
+            return
+        campos = modelo._meta.concrete_fields
+        # pre_save aplica auto_now y auto_now_add igual que bulk_create
+        filas = [
+            [campo.get_db_prep_save(campo.pre_save(instancia, True), self.conexion) for campo in campos]
+            for instancia in instancias
+        ]
+        tabla = self.conexion.ops.quote_name(modelo._meta.db_table)
+        columnas = ', '.join(self.conexion.ops.quote_name(campo.column) for campo in campos)
+        if self.copy:
+            self._copy(f'COPY {tabla} ({columnas}) FROM STDIN', filas)
+        else:
+            sql = f'INSERT INTO {tabla} ({columnas}) VALUES ({", ".join(["%s"] * len(campos))})'
+            with self.conexion.cursor() as cursor:
+                for inicio in range(0, len(filas), lote):
+                    cursor.executemany(sql, filas[inicio:inicio + lote])
+        self.filas[modelo] += len(instancias)
+
+    def _copy(self, sql, filas):
+        datos = io.StringIO()
+        for fila in filas:
+            datos.write('\t'.join(_texto_copy(valor) for valor in fila))
+            datos.write('\n')
+        with self.conexion.cursor() as cursor:
+            cursor_driver = cursor.cursor
+            if hasattr(cursor_driver, 'copy'):
+                # psycopg 3
+                with cursor_driver.copy(sql) as copia:
+                    copia.write(datos.getvalue())
+            else:
+                # psycopg2
+                datos.seek(0)
+                cursor_driver.copy_expert(sql, datos)
+
+
+def sembrar(usuarios, actividades, logs, semilla=42, dias=90, referencia=None, prefijo='bench',
+            lote=10000, copy=True, informar=None):
+    """
+    Siembra `usuarios` usuarios `<prefijo><n>` con `actividades` progresos cada
+    uno y `logs` logs por progreso repartidos en los `dias` días anteriores a
+    `referencia` (por defecto ahora). Devuelve las filas insertadas por
+    modelo; `informar` recibe ese dict tras cada lote de usuarios.
+    """
+    rng = random.Random(semilla)
+    referencia = referencia or timezone.now()
+    contrasena = make_password(CONTRASENA_SINTETICA)
+    insertador = Insertador(copy)
+    usuarios_por_lote = max(1, lote // max(actividades * max(logs, 1), 1))
+
+    for inicio in range(0, usuarios, usuarios_por_lote):
+        numeros = range(inicio, min(inicio + usuarios_por_lote, usuarios))
+        with transaction.atomic():
+            if insertador.conexion.vendor == 'postgresql':
+                # Datos regenerables: no hace falta esperar al WAL en cada commit
+                with insertador.conexion.cursor() as cursor:
+                    cursor.execute('SET LOCAL synchronous_commit = off')
+
+            users = [
+                User(id=pk, username=f'{prefijo}{n}', email=f'{prefijo}{n}@edumap.test', password=contrasena,
+                     first_name='Bench', last_name=str(n), date_joined=referencia - timedelta(days=dias))
+                for pk, n in zip(insertador.reservar_ids(User, len(numeros)), numeros)
+            ]
+            insertador.insertar(User, users, lote)
+            insertador.insertar(Usuario, [
+                Usuario(id=pk, usuario_id=user.id, nombre=f'{user.first_name} {user.last_name}',
+                        correo=user.email, contrasena='')
+                for pk, user in zip(insertador.reservar_ids(Usuario, len(users)), users)
+            ], lote)
+            insertador.insertar(PerfilUsuario, [
+                PerfilUsuario(id=pk, usuario_id=user.id, first_name=user.first_name, last_name=user.last_name)
+                for pk, user in zip(insertador.reservar_ids(PerfilUsuario, len(users)), users)
+            ], lote)
+
+            progresos = []
+            ids_progreso = iter(insertador.reservar_ids(ProgresoUsuario, len(users) * actividades))
+            for user in users:
+                for a in range(actividades):
+                    valor = rng.choice([100, rng.randint(0, 99)])
+                    progresos.append(ProgresoUsuario(id=next(ids_progreso), usuario_id=user.id,
+                                                     actividad=f'Actividad {a}', progreso=valor,
+                                                     completado=valor >= 100))
+            insertador.insertar(ProgresoUsuario, progresos, lote)
+
+            ids_log = iter(insertador.reservar_ids(LogProgreso, len(progresos) * logs))
+            pendientes = []
+            for progreso in progresos:
+                # Historial creciente hasta el valor final, en orden cronológico
+                valores = sorted(rng.uniform(0, progreso.progreso) for _ in range(logs - 1))
+                valores.append(progreso.progreso)
+                fechas = sorted(referencia - timedelta(seconds=rng.uniform(0, dias * 86400)) for _ in range(logs))
+                anterior = 0
+                for valor, fecha in zip(valores, fechas):
+                    valor = round(valor, 2)
+                    pendientes.append(LogProgreso(id=next(ids_log), progreso_usuario_id=progreso.id,
+                                                  progreso_anterior=anterior, progreso_nuevo=valor,
+                                                  fecha_cambio=fecha))
+                    anterior = valor
+                if len(pendientes) >= lote:
+                    insertador.insertar(LogProgreso, pendientes, lote)
+                    pendientes = []
+            insertador.insertar(LogProgreso, pendientes, lote)
+
+        if informar is not None:
+            informar(insertador.filas)
+
+    reconstruir_resumenes()
+    reconstruir_clasificaciones()
+    return insertador.filas
+
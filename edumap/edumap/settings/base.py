@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -15,9 +16,12 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'applications.Usuarios',
     'applications.progreso_usuario',
+    'applications.monitoreo',
 ]
 
 MIDDLEWARE = [
+    # Primero, para que el tiempo total incluya el resto de middleware
+    'applications.monitoreo.middleware.MonitoreoMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -46,6 +50,106 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'edumap.wsgi.application'
 
+# Caché (LocMemCache por defecto; en producción puede apuntar a Redis o Memcached)
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'edumap',
+    }
+}
+
+# Alias de CACHES y duración (segundos) de los payloads de dashboard y perfil
+USUARIOS_CACHE_ALIAS = 'default'
+USUARIOS_CACHE_TIMEOUT = 300
+
+# Archivos subidos (avatares y sus miniaturas). En producción los sirve el servidor web;
+# media/avatars/miniaturas/ puede llevar Cache-Control: public, max-age=31536000, immutable
+MEDIA_URL = '/media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Hilos por proceso que generan las miniaturas de los avatares (ver
+# applications/Usuarios/miniaturas.py); 0 las genera en el hilo que guarda el perfil y
+# None no las genera al guardar (quedan para el comando generar_miniaturas)
+USUARIOS_MINIATURAS_HILOS = 2
+
+# Límites de la subida de avatares (ver applications/Usuarios/subidas.py). El servidor web
+# debe admitir al menos este tamaño de cuerpo (client_max_body_size en nginx)
+USUARIOS_AVATAR_MAX_BYTES = 5 * 1024 * 1024
+USUARIOS_AVATAR_MAX_PIXELES = 25_000_000  # ancho * alto, p. ej. 5000 x 5000
+
+# Alias de CACHES para progreso_usuario y duración (segundos) de las series de periodos terminados
+PROGRESO_CACHE_ALIAS = 'default'
+PROGRESO_ANALITICA_TIMEOUT = 86400
+
+# Puestos guardados por actividad en la clasificación (se sirven hasta la mitad) y duración en caché
+PROGRESO_CLASIFICACION_TAMANO = 100
+PROGRESO_CLASIFICACION_TIMEOUT = 300
+
+# Instrumentación por petición (ver applications/monitoreo/middleware.py). Server-Timing
+# expone tiempos internos a cualquier cliente: desactívalo si no debe ser público.
+MONITOREO_SERVER_TIMING = True
+# Máximo de consultas SQL por vista; al superarlo se registra un aviso
+MONITOREO_PRESUPUESTOS = {
+    'progreso_usuario:lista': 6,
+    'progreso_usuario:detalle': 6,
+    'progreso_usuario:resumen': 4,
+    'progreso_usuario:clasificacion': 5,
+    'inicio_sesion:dashboard': 4,
+    'inicio_sesion:perfil': 4,
+    # Escrituras: sesión, usuario, BEGIN (SQLite), fila bloqueada, escritura, log, resumen y clasificación
+    'progreso_usuario:crear': 6,
+    'progreso_usuario:editar': 9,
+    'progreso_usuario:actualizar': 9,
+    'progreso_usuario:eliminar': 9,
+    'progreso_usuario:lote': 10,
+}
+
+# Contadores e histogramas por vista compartidos entre workers (ver
+# applications/monitoreo/metricas.py). Cada hilo de cada proceso escribe su archivo en
+# este directorio; vacíalo al arrancar el servidor con limpiar_metricas(). Desactivadas
+# (None) salvo que se indique un directorio en EDUMAP_METRICAS_DIR.
+MONITOREO_METRICAS_DIRECTORIO = os.environ.get('EDUMAP_METRICAS_DIR') or None
+# Límites superiores (segundos) de los cubos del histograma de latencia
+MONITOREO_HISTOGRAMA_LIMITES = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Acceso a /metrics sin sesión de personal (el servidor de Prometheus): token Bearer de
+# EDUMAP_METRICAS_TOKEN o direcciones permitidas. No añadas 127.0.0.1 si hay un proxy
+# inverso en la misma máquina: todas las peticiones llegarían desde esa dirección.
+MONITOREO_METRICAS_TOKEN = os.environ.get('EDUMAP_METRICAS_TOKEN') or None
+MONITOREO_METRICAS_IPS = []
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # Una línea JSON por petición con sus métricas
+        'applications.monitoreo': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# Escritura diferida de LogProgreso (ver applications/progreso_usuario/buffer_logs.py).
+# Desactivada por defecto: los logs encolados se pierden si el proceso muere sin cerrarse.
+PROGRESO_LOGS_DIFERIDOS = False
+PROGRESO_LOGS_LOTE = 200              # volcar al alcanzar este número de logs
+PROGRESO_LOGS_INTERVALO = 1.0         # o, como máximo, cada tantos segundos
+PROGRESO_LOGS_MAX_PENDIENTES = 10000  # al llegar aquí la petición vuelca la cola ella misma
+
+# Días de historial completo de LogProgreso; compactar_logs agrupa por día los anteriores
+PROGRESO_LOGS_RETENCION_DIAS = 90
+
+# Función que codifica las respuestas JSON de progreso_usuario (ruta importable, p. ej.
+# 'orjson.dumps' si está instalado). None usa el codificador de JsonResponse.
+PROGRESO_JSON_DUMPS = None
+
+# Filas leídas por viaje a la base de datos en las exportaciones (QuerySet.iterator).
+# En PostgreSQL usan cursores de servidor: con PgBouncer en modo transacción hay que
+# activar DISABLE_SERVER_SIDE_CURSORS en la base de datos.
+PROGRESO_EXPORTACION_CHUNK = 2000
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
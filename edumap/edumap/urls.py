@@ -14,13 +14,21 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 from applications.Usuarios import views
+from applications.monitoreo import views as monitoreo_views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', views.vista_home, name='home'),
     path('api/usuarios/', include('applications.Usuarios.urls')),
     path('progreso_usuario/', include('applications.progreso_usuario.urls')),
+    # Sin barra final: es la ruta que Prometheus consulta por defecto
+    path('metrics', monitoreo_views.metricas, name='metricas'),
 ]
+
+# Solo con DEBUG (static() no añade nada en producción)
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)